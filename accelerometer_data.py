@@ -8,3 +8,5 @@ class AccelerometerData:
     y: float
     z: float
     timestamp: datetime
+    gap: bool = False
+    """Sample lies in a gap in the received data and was interpolated or held."""
@@ -0,0 +1,115 @@
+from accelerometer_data import AccelerometerData
+from datetime import datetime, timedelta
+import math
+
+
+class ActivityDetector:
+    """
+    Decides when a ring is at rest, so its filters can tick slowly until it moves again.
+
+    A sample is significant when its acceleration magnitude deviates from a moving average of the magnitude by more than
+    wake_threshold. The average settles within a fraction of a second once the ring lies still, whatever its
+    orientation, while movement keeps pulling the magnitude away from it. A ring is idle once there was no significant sample for
+    idle_after, and the outputs of its abs filter and leaky integrator have settled. A ring that sends no samples at
+    all is idle after idle_after as well.
+    """
+
+    _idle_after: timedelta
+    _wake_threshold: float
+    _baseline_smoothing: float
+    _leaky_integrator_rest: float
+
+    _baseline: float | None
+    _last_sample: datetime | None
+    _first_check: datetime | None
+    _last_significant: datetime | None
+    _abs_value: float | None
+    _leaky_integrator_value: float
+    _idle: bool
+
+    def __init__(
+        self,
+        idle_after: timedelta = timedelta(seconds=2),
+        wake_threshold: float = 60.0,
+        baseline_smoothing: float = 0.1,
+        leaky_integrator_rest: float = 0.01,
+    ) -> None:
+        """
+        baseline_smoothing: weight of each sample in the moving average of the magnitude.
+        leaky_integrator_rest: leaky integrator values below this count as settled.
+        """
+        self._idle_after = idle_after
+        self._wake_threshold = wake_threshold
+        self._baseline_smoothing = baseline_smoothing
+        self._leaky_integrator_rest = leaky_integrator_rest
+
+        self._baseline = None
+        self._last_sample = None
+        self._first_check = None
+        self._last_significant = None
+        self._abs_value = None
+        self._leaky_integrator_value = 0.0
+        self._idle = False
+
+    def set_idle_after(self, idle_after: timedelta) -> None:
+        self._idle_after = idle_after
+
+    def set_wake_threshold(self, wake_threshold: float) -> None:
+        self._wake_threshold = wake_threshold
+
+    @property
+    def is_idle(self) -> bool:
+        return self._idle
+
+    def on_sample(self, data: AccelerometerData) -> bool:
+        """
+        Returns True when the sample ends an idle period.
+        """
+        self._last_sample = data.timestamp
+        magnitude = math.sqrt(data.x**2 + data.y**2 + data.z**2)
+        if self._baseline is None:
+            self._baseline = magnitude
+        significant = abs(magnitude - self._baseline) > self._wake_threshold
+        self._baseline += self._baseline_smoothing * (magnitude - self._baseline)
+        if not significant:
+            return False
+        self._last_significant = data.timestamp
+        if self._idle:
+            self._idle = False
+            return True
+        return False
+
+    def on_abs(self, value: float) -> None:
+        self._abs_value = value
+
+    def on_leaky_integrator(self, value: float) -> None:
+        self._leaky_integrator_value = value
+
+    def should_idle(self, now: datetime) -> bool:
+        """
+        Returns True once when an active ring has come to rest, the ring is idle from then on.
+        """
+        if self._idle or self._leaky_integrator_value >= self._leaky_integrator_rest:
+            return False
+        if self._last_sample is None:
+            # A ring that has not sent anything yet gets idle_after from its first check.
+            if self._first_check is None:
+                self._first_check = now
+            if now - self._first_check < self._idle_after:
+                return False
+        receiving = (
+            self._last_sample is not None and now - self._last_sample < self._idle_after
+        )
+        if receiving:
+            if (
+                self._last_significant is not None
+                and now - self._last_significant < self._idle_after
+            ):
+                return False
+            if (
+                self._abs_value is None
+                or abs(self._abs_value - self._baseline) > self._wake_threshold
+            ):
+                return False
+        self._idle = True
+        return True
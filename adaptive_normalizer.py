@@ -0,0 +1,249 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+
+
+class P2Quantile:
+    """
+    Streaming quantile estimate with constant memory and constant update cost.
+
+    Implements the P-square algorithm (Jain & Chlamtac, 1985): five markers track the minimum, p/2, p, (1+p)/2 and
+    maximum quantiles and are moved with a piecewise-parabolic prediction.
+    """
+
+    _p: float
+    _count: int
+    _heights: list[float]
+    _positions: list[float]
+    _desired: list[float]
+    _increments: list[float]
+
+    def __init__(self, p: float) -> None:
+        assert 0.0 < p < 1.0
+        self._p = p
+        self.reset()
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    def reset(self) -> None:
+        p = self._p
+        self._count = 0
+        self._heights = []
+        self._positions = [1.0, 2.0, 3.0, 4.0, 5.0]
+        self._desired = [1.0, 1.0 + 2.0 * p, 1.0 + 4.0 * p, 3.0 + 2.0 * p, 5.0]
+        self._increments = [0.0, p / 2.0, p, (1.0 + p) / 2.0, 1.0]
+
+    def add(self, x: float) -> None:
+        self._count += 1
+        q = self._heights
+
+        if self._count <= 5:
+            q.append(x)
+            if self._count == 5:
+                q.sort()
+            return
+
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x < q[1]:
+            k = 0
+        elif x < q[2]:
+            k = 1
+        elif x < q[3]:
+            k = 2
+        elif x <= q[4]:
+            k = 3
+        else:
+            q[4] = x
+            k = 3
+
+        n = self._positions
+        for i in range(k + 1, 5):
+            n[i] += 1.0
+        for i in range(5):
+            self._desired[i] += self._increments[i]
+
+        for i in range(1, 4):
+            d = self._desired[i] - n[i]
+            if (d >= 1.0 and n[i + 1] - n[i] > 1.0) or (
+                d <= -1.0 and n[i - 1] - n[i] < -1.0
+            ):
+                s = 1 if d > 0 else -1
+                candidate = self._parabolic(i, s)
+                if q[i - 1] < candidate < q[i + 1]:
+                    q[i] = candidate
+                else:
+                    q[i] = q[i] + s * (q[i + s] - q[i]) / (n[i + s] - n[i])
+                n[i] += s
+
+    def _parabolic(self, i: int, s: int) -> float:
+        q = self._heights
+        n = self._positions
+        return q[i] + s / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + s) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - s) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    @property
+    def value(self) -> float | None:
+        if self._count == 0:
+            return None
+        if self._count < 5:
+            ordered = sorted(self._heights)
+            return ordered[min(len(ordered) - 1, int(self._p * len(ordered)))]
+        return self._heights[2]
+
+    def to_dict(self) -> dict:
+        return {
+            "p": self._p,
+            "count": self._count,
+            "heights": list(self._heights),
+            "positions": list(self._positions),
+            "desired": list(self._desired),
+        }
+
+    @staticmethod
+    def from_dict(state: dict) -> P2Quantile:
+        sketch = P2Quantile(state["p"])
+        sketch._count = state["count"]
+        sketch._heights = list(state["heights"])
+        sketch._positions = list(state["positions"])
+        sketch._desired = list(state["desired"])
+        return sketch
+
+
+class SlidingQuantile:
+    """
+    Approximates a quantile over a sliding time horizon.
+
+    Two P-square sketches are alternated, each covering half the horizon. The estimate comes from the older sketch
+    until the younger one has seen at least as many samples, so old data is forgotten after at most one horizon.
+    """
+
+    _p: float
+    _half_horizon: timedelta
+    _current: P2Quantile
+    _previous: P2Quantile | None
+    _epoch_start: datetime | None
+
+    def __init__(self, p: float, horizon: timedelta) -> None:
+        self._p = p
+        self._half_horizon = horizon / 2
+        self.reset()
+
+    def reset(self) -> None:
+        self._current = P2Quantile(self._p)
+        self._previous = None
+        self._epoch_start = None
+
+    @property
+    def count(self) -> int:
+        return max(
+            self._current.count,
+            0 if self._previous is None else self._previous.count,
+        )
+
+    def add(self, x: float, timestamp: datetime) -> None:
+        if self._epoch_start is None:
+            self._epoch_start = timestamp
+        elif timestamp - self._epoch_start >= self._half_horizon:
+            self._previous = self._current
+            self._current = P2Quantile(self._p)
+            self._epoch_start = timestamp
+        self._current.add(x)
+
+    @property
+    def value(self) -> float | None:
+        if self._previous is None or self._current.count >= self._previous.count:
+            return self._current.value
+        return self._previous.value
+
+    def to_dict(self) -> dict:
+        return {
+            "current": self._current.to_dict(),
+            "previous": None if self._previous is None else self._previous.to_dict(),
+        }
+
+    def load_dict(self, state: dict) -> None:
+        """
+        Restore sketch state. The epoch restarts at the next sample, timestamps from a previous run are meaningless.
+        """
+        self._current = P2Quantile.from_dict(state["current"])
+        self._previous = (
+            None
+            if state["previous"] is None
+            else P2Quantile.from_dict(state["previous"])
+        )
+        self._epoch_start = None
+
+
+class AdaptiveNormalizer:
+    """
+    Maps a signal to 0..1 using its own recent dynamic range.
+
+    The range is the interval between a low and a high streaming quantile over a sliding time horizon.
+    Until enough samples have been seen the fixed fallback range is used.
+    """
+
+    _low: SlidingQuantile
+    _high: SlidingQuantile
+    _fallback_low: float
+    _fallback_high: float
+    _min_span: float
+    _min_samples: int
+
+    def __init__(
+        self,
+        horizon: timedelta = timedelta(minutes=2),
+        low_quantile: float = 0.05,
+        high_quantile: float = 0.95,
+        fallback_low: float = 500.0,
+        fallback_high: float = 3000.0,
+        min_span: float = 100.0,
+        min_samples: int = 50,
+    ) -> None:
+        assert low_quantile < high_quantile
+        self._low = SlidingQuantile(low_quantile, horizon)
+        self._high = SlidingQuantile(high_quantile, horizon)
+        self._fallback_low = fallback_low
+        self._fallback_high = fallback_high
+        self._min_span = min_span
+        self._min_samples = min_samples
+
+    def reset(self) -> None:
+        self._low.reset()
+        self._high.reset()
+
+    @property
+    def range(self) -> tuple[float, float]:
+        if self._low.count < self._min_samples:
+            return self._fallback_low, self._fallback_high
+        low = self._low.value
+        high = max(self._high.value, low + self._min_span)
+        return low, high
+
+    def normalize(self, value: float, timestamp: datetime) -> float:
+        """
+        Update the range with value and return value mapped to 0..1.
+        """
+        self._low.add(value, timestamp)
+        self._high.add(value, timestamp)
+        return self.scale(value)
+
+    def scale(self, value: float) -> float:
+        """
+        Map value to 0..1 with the current range, without updating it. For signals on the same scale as the one the
+        range is learned from.
+        """
+        low, high = self.range
+        return max(0.0, min(1.0, (value - low) / (high - low)))
+
+    def to_dict(self) -> dict:
+        return {"low": self._low.to_dict(), "high": self._high.to_dict()}
+
+    def load_dict(self, state: dict) -> None:
+        self._low.load_dict(state["low"])
+        self._high.load_dict(state["high"])
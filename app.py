@@ -5,258 +5,904 @@ from nicegui import ui
 import nicegui
 import asyncio
 from accelerometer_data import AccelerometerData
-from typing import Callable
+from typing import Awaitable, Callable
 from scan_for_rings import scan_for_rings
 import json
 from pathlib import Path
 from ring_manager import RingManager, RingStatus
-from filters import Filters
+from filters import Filters, FilterParams
+from shard_supervisor import ShardSupervisor, Shard
+from hub_link import HubReceiver
 from midi_out import MidiOut
+from osc_out import OscOut
+from crowd_aggregator import CrowdAggregator
 from filter_abs import FilterAbsOutput
+from filter_energy import FilterEnergyOutput
 from ui_midi import UIMidi
-from dataclasses import asdict, fields
-from midi_config import MidiConfig
+from dataclasses import asdict, dataclass, replace
+from datetime import timedelta
+from midi_config import (
+    MidiConfig,
+    MidiRoute,
+    FEATURE_ABS,
+    FEATURE_LEAKY_INTEGRATOR,
+    CROWD_ADDRESS,
+    FEATURE_CROWD_ENERGY,
+    FEATURE_CROWD_MOVING,
+    FEATURE_CROWD_TRIGGERED,
+    gesture_feature,
+    energy_feature,
+    crowd_top_feature,
+    crowd_histogram_feature,
+    route_error,
+)
+from midi_routing import MidiRouter
 from filter_leaky_integrator import FilterLeakyIntegratorOutput
+from adaptive_normalizer import AdaptiveNormalizer
+from filter_gesture import FilterGestureOutput, GestureLibrary, GestureTemplate
+from ring_view_model import RingsViewModel, RingView
+from metrics import (
+    metrics,
+    MIDI_MESSAGES_SENT,
+    EVENT_LOOP_LAG_SECONDS,
+    EVENT_LOOP_LAG_MAX_SECONDS,
+)
+import time
+import traceback
 
 
 class App:
+    """
+    The engine: rings, filters and MIDI routing, shared by the views of all connected browsers.
+
+    Views never process signals themselves. Once per frame the engine formats what changed and hands the same result to
+    every view, so another viewer only costs the UI updates sent to it.
+    """
+
+    _rings_config: dict[str, dict]
+    _filter_params: dict[str, FilterParams]
     _ring_managers: dict[str, RingManager]
     _ring_manager_tasks: dict[str, asyncio.Task]
 
-    _rings: UIRings
-    _midi: UIMidi
-    _signals: UISignals
+    _shard_adapters: dict[str, str]
+    _shard_supervisor: ShardSupervisor | None
+    _shard_supervisor_task: asyncio.Task | None
 
-    _tab_rings: nicegui.elements.tabs.Tab
-    _tab_midi: nicegui.elements.tabs.Tab
+    _hub_addresses: set[str]
+    """Added rings whose samples come from a ring hub, see ring_hub.py."""
+    _known_hub_addresses: set[str]
+    """Rings added as hub rings since startup, so they are hub rings again when re-added after removal."""
+    _hub_receiver: HubReceiver | None
+    _hub_receiver_task: asyncio.Task | None
 
-    _client: nicegui.context.Context.client
+    _rings_view_model: RingsViewModel
+    _views: list[AppView]
+    _frame_task: asyncio.Task | None
 
     _filters: Filters
     _filters_task: asyncio.Task | None
+    _event_loop_lag_task: asyncio.Task | None
 
     _midi_out: MidiOut
+    _midi_router: MidiRouter
+    _crossfade_task: asyncio.Task | None
+
+    _crowd: CrowdAggregator
+    _crowd_task: asyncio.Task | None
+    _osc_out: OscOut | None
+    """Sends the crowd aggregates when osc.json exists."""
 
     _midi_config: MidiConfig
+    _midi_icon: str
 
-    def __init__(self) -> None:
-        ui.dark_mode(None)
+    _gesture_library: GestureLibrary
 
+    _abs_normalizers: dict[str, AdaptiveNormalizer]
+    _normalization_state: dict[str, dict]
+
+    def __init__(self) -> None:
         self._load_midi_config()
+        self._load_normalization_state()
+        self._abs_normalizers = {}
+        self._rings_view_model = RingsViewModel()
+        self._views = []
+        self._frame_task = None
+
+        self._rings_config = {}
+        self._filter_params = {}
+        self._ring_managers = {}
+        self._ring_manager_tasks = {}
+
+        self._shard_adapters = {}
+        self._shard_supervisor = None
+        self._shard_supervisor_task = None
+
+        self._hub_addresses = set()
+        self._known_hub_addresses = set()
+        self._hub_receiver = None
+        self._hub_receiver_task = None
+
+        self._gesture_library = GestureLibrary(Path("gestures.json"))
+        self._filters = Filters(
+            on_abs_filter_output=self._on_abs_filter_output,
+            on_leaky_integrator_filter_output=self._on_leaky_integrator_filter_output,
+            gesture_library=self._gesture_library,
+            on_gesture_filter_output=self._on_gesture_filter_output,
+            on_energy_filter_output=self._on_energy_filter_output,
+        )
+        self._midi_out = MidiOut()
+        self._midi_router = MidiRouter(self._midi_out)
+        self._crossfade_task = None
+        for error in self._midi_router.compile(self._midi_config.routes):
+            print(f"MIDI route left out: {error}")
+        self._update_midi_icon()
 
-        with ui.tabs() as tabs:
-            self._client = ui.context.client
+        self._crowd = CrowdAggregator()
+        self._crowd_task = None
+        self._load_osc_config()
 
-            self._ring_managers = {}
-            self._ring_manager_tasks = {}
+    def create_view(self) -> None:
+        """
+        Build the UI for the connecting browser. Call from a page function.
+        """
+        view = AppView(self)
+        self._views.append(view)
+        ui.context.client.on_disconnect(
+            lambda: self._views.remove(view) if view in self._views else None
+        )
 
-            self._tab_rings = ui.tab("Rings", icon="question_mark")
-            self._tab_midi = ui.tab("MIDI", icon="warning")
-            tab_signals = ui.tab("Signals", icon="")
+    @property
+    def rings(self) -> list[tuple[str, str, FilterParams]]:
+        """
+        Address, name and filter parameters of every ring.
+        """
+        return [
+            (address, config["name"], self._filter_params[address])
+            for address, config in self._rings_config.items()
+        ]
 
-        with ui.tab_panels(tabs, value=self._tab_rings).classes("w-full"):
-            with ui.tab_panel(self._tab_rings):
-                self._rings = UIRings(on_add_ring=self._on_add_ring)
-            with ui.tab_panel(self._tab_midi):
-                self._midi = UIMidi(
-                    self._midi_config,
-                    self._on_midi_ring_1_address,
-                    self._on_midi_ring_2_address,
-                    self._on_midi_ring_3_address,
+    @property
+    def midi_config(self) -> MidiConfig:
+        return self._midi_config
+
+    @property
+    def midi_features(self) -> list[str]:
+        return (
+            [FEATURE_ABS, FEATURE_LEAKY_INTEGRATOR]
+            + [gesture_feature(t.name) for t in self._gesture_library.templates]
+            + [
+                energy_feature(window)
+                for window in sorted(
+                    {
+                        window
+                        for params in self._filter_params.values()
+                        for window in params.energy_windows
+                    }
                 )
-            with ui.tab_panel(tab_signals):
-                self._signals = UISignals()
-
-        self._filters = Filters(
-            on_abs_filter_output=self._on_abs_filter_output,
-            on_leaky_integrator_filter_output=self._on_leaky_integrator_filter_output,
+            ]
+            + [FEATURE_CROWD_ENERGY, FEATURE_CROWD_MOVING, FEATURE_CROWD_TRIGGERED]
+            + [crowd_top_feature(i + 1) for i in range(self._crowd.top_k)]
+            + [crowd_histogram_feature(i) for i in range(self._crowd.bins)]
         )
-        self._midi_out = MidiOut()
+
+    @property
+    def midi_presets(self) -> list[str]:
+        return list(self._midi_config.presets.keys())
+
+    @property
+    def midi_icon(self) -> str:
+        return self._midi_icon
+
+    @property
+    def rings_icon(self) -> str:
+        return self._rings_view_model.rings_icon
+
+    def ring_display(self, address: str) -> RingDisplay:
+        return _ring_display(self._rings_view_model.ring(address))
 
     async def startup(self) -> None:
         self._midi_out.open()
-        self._update_midi_icon()
         self._filters_task = asyncio.create_task(self._filters.run())
+        self._event_loop_lag_task = asyncio.create_task(self._probe_event_loop_lag())
 
         path = Path("rings.json")
         if path.is_file():
             with open(path, "r") as f:
                 rings = json.load(f)
-                for ring in rings:
-                    self._rings.add(address=ring["address"], name=ring["name"])
+
+            # Rings with an adapter are run in a worker process per adapter.
+            shards: dict[str, Shard] = {}
+            for ring in rings:
+                if "adapter" in ring and not ring.get("hub", False):
+                    self._shard_adapters[ring["address"]] = ring["adapter"]
+                    shards.setdefault(
+                        ring["adapter"], Shard(adapter=ring["adapter"], rings=[])
+                    ).rings.append(
+                        {
+                            "address": ring["address"],
+                            "name": ring["name"],
+                            "filters": ring.get("filters", {}),
+                        }
+                    )
+
+            for ring in rings:
+                self.add_ring(
+                    address=ring["address"],
+                    name=ring["name"],
+                    filter_params=FilterParams.from_dict(ring.get("filters", {})),
+                    hub=ring.get("hub", False),
+                )
+
+            if len(shards) > 0:
+                self._shard_supervisor = ShardSupervisor(
+                    shards=list(shards.values()),
+                    on_status=self._on_sharded_ring_status,
+                    on_abs_filter_output=self._on_abs_filter_output,
+                    on_leaky_integrator_filter_output=self._on_leaky_integrator_filter_output,
+                )
+                self._shard_supervisor_task = asyncio.create_task(
+                    self._shard_supervisor.run()
+                )
+
+        self._frame_task = asyncio.create_task(self._render_frames())
+        if self._osc_out is not None:
+            self._osc_out.open()
+        self._crowd_task = asyncio.create_task(self._send_crowd_aggregates())
 
     async def shutdown(self) -> None:
+        self._save_normalization_state()
         self._midi_out.close()
+        if self._osc_out is not None:
+            self._osc_out.close()
         print("Shutting down ring communication..")
         for ring in self._ring_managers.values():
             await ring.close()
+        if self._shard_supervisor is not None:
+            self._shard_supervisor.close()
+        if self._hub_receiver is not None:
+            self._hub_receiver.close()
         print("Done")
         self._filters.close()
+        self._event_loop_lag_task.cancel()
+        if self._crossfade_task is not None:
+            self._crossfade_task.cancel()
+        self._crowd_task.cancel()
+        self._frame_task.cancel()
         print("Waiting background tasks to finish..")
-        await asyncio.gather(*self._ring_manager_tasks.values(), self._filters_task)
+        await asyncio.gather(
+            *self._ring_manager_tasks.values(),
+            self._filters_task,
+            *(
+                []
+                if self._shard_supervisor_task is None
+                else [self._shard_supervisor_task]
+            ),
+            *([] if self._hub_receiver_task is None else [self._hub_receiver_task]),
+        )
         print("Done.")
 
-    def _on_add_ring(self, address: str, name: str) -> str | None:
+    async def _probe_event_loop_lag(self) -> None:
+        interval = 0.1
+        probes_per_report = 50
+        while True:
+            max_lag = 0.0
+            for _ in range(probes_per_report):
+                start = time.perf_counter()
+                await asyncio.sleep(interval)
+                lag = max(0.0, time.perf_counter() - start - interval)
+                metrics.observe(EVENT_LOOP_LAG_SECONDS, lag)
+                max_lag = max(max_lag, lag)
+            metrics.set(EVENT_LOOP_LAG_MAX_SECONDS, max_lag)
+
+    def add_ring(
+        self, address: str, name: str, filter_params: FilterParams, hub: bool = False
+    ) -> str | None:
         """
         Add a new ring.
 
+        hub: the samples of the ring come from a ring hub instead of over BLE. The hub receiver starts with the first
+        hub ring.
+
         None is successful. str is error message.
         """
         if address == "":
             return "Address cannot be empty."
-        elif address in self._ring_managers.keys():
+        elif address in self._rings_config.keys():
             return f"Address {address} already added."
         else:
-            self._ring_managers[address] = RingManager(
-                address=address,
-                name=name,
-                on_connect=lambda: self._on_ring_connect(address),
-                on_disconnect=lambda: self._on_ring_disconnect(address),
-                on_connecting=lambda: self._on_ring_connecting(address),
-                on_connect_fail=lambda msg: self._on_ring_connect_fail(address, msg),
-                on_raw_sensor_data=lambda data: self._on_ring_raw_sensor_data(
-                    address, data
-                ),
-            )
-            self._ring_manager_tasks[address] = asyncio.create_task(
-                self._ring_managers[address].run()
-            )
-            self._filters.on_ring_add(address=address)
-            self._midi.update_ring_addresses(addresses=list(self._ring_managers.keys()))
+            features = self.midi_features
+            adapter = self._shard_adapters.get(address)
+            if hub or address in self._known_hub_addresses:
+                self._hub_addresses.add(address)
+                self._known_hub_addresses.add(address)
+                self._start_hub_receiver()
+                self._filters.on_ring_add(address=address, params=filter_params)
+                self._rings_config[address] = {
+                    "address": address,
+                    "name": name,
+                    "hub": True,
+                    "filters": filter_params.to_dict(),
+                }
+            elif adapter is None:
+                self._ring_managers[address] = RingManager(
+                    address=address,
+                    name=name,
+                    on_connect=lambda: self._on_ring_connect(address),
+                    on_disconnect=lambda: self._on_ring_disconnect(address),
+                    on_connecting=lambda: self._on_ring_connecting(address),
+                    on_connect_fail=lambda msg: self._on_ring_connect_fail(
+                        address, msg
+                    ),
+                    on_raw_sensor_data=lambda data: self._on_ring_raw_sensor_data(
+                        address, data
+                    ),
+                )
+                self._ring_manager_tasks[address] = asyncio.create_task(
+                    self._ring_managers[address].run()
+                )
+                self._filters.on_ring_add(address=address, params=filter_params)
+                self._rings_config[address] = {
+                    "address": address,
+                    "name": name,
+                    "filters": filter_params.to_dict(),
+                }
+            else:
+                if self._shard_supervisor is not None:
+                    # Re-added after a removal, startup hands the rings to the supervisor afterwards.
+                    self._shard_supervisor.add_ring(address, filter_params.to_dict())
+                self._rings_config[address] = {
+                    "address": address,
+                    "name": name,
+                    "adapter": adapter,
+                    "filters": filter_params.to_dict(),
+                }
+            self._filter_params[address] = filter_params
+            self._rings_view_model.add(address, name)
+            if address in self._hub_addresses:
+                status = self._hub_receiver.status(address)
+                if status is not None:
+                    self._rings_view_model.set_status(address, status)
+            self._abs_normalizers[address] = AdaptiveNormalizer()
+            if address in self._normalization_state:
+                self._abs_normalizers[address].load_dict(
+                    self._normalization_state[address]
+                )
+            self._update_midi_icon()
+            for view in self._views:
+                view.on_ring_add(address, name, filter_params)
+            if self.midi_features != features:
+                self._update_midi_features()
 
-        rings = [
-            {"address": r.address, "name": r.name} for r in self._ring_managers.values()
-        ]
+        self._save_rings_config()
+
+    async def remove_ring(self, address: str) -> None:
+        """
+        Remove a ring. The pipelines of the other rings keep running untouched.
+        """
+        if address not in self._rings_config:
+            # Already removed from another view.
+            return
+        features = self.midi_features
+        del self._rings_config[address]
+        del self._filter_params[address]
+        del self._abs_normalizers[address]
+        self._normalization_state.pop(address, None)
+        self._rings_view_model.remove(address)
+        self._crowd.remove(address)
+        metrics.remove_ring(address)
+        self._save_rings_config()
+        self._update_midi_icon()
+        for view in self._views:
+            view.on_ring_remove(address)
+        if self.midi_features != features:
+            self._update_midi_features()
+
+        if address in self._hub_addresses:
+            # Samples the hub keeps sending are ignored from now on.
+            self._hub_addresses.discard(address)
+            self._filters.on_ring_remove(address)
+            return
+        ring_manager = self._ring_managers.pop(address, None)
+        if ring_manager is None:
+            # Its worker closes the ring manager and then removes its filters.
+            self._shard_supervisor.remove_ring(address)
+            return
+        # Notifications keep arriving until the ring confirmed the disable command, so its filters go last.
+        await ring_manager.close()
+        await self._ring_manager_tasks.pop(address)
+        self._filters.on_ring_remove(address)
+
+    def set_filter_params(
+        self, address: str, params: FilterParams, origin: AppView | None = None
+    ) -> None:
+        """
+        origin: view the change was made in, it is not told about it again.
+        """
+        previous = self._filter_params[address]
+        self._filter_params[address] = params
+        self._rings_config[address]["filters"] = params.to_dict()
+        self._save_rings_config()
+        for view in self._views:
+            if view is not origin:
+                view.on_filter_params_change(address, params)
+        if params.energy_windows != previous.energy_windows:
+            self._update_midi_features()
+        if address in self._shard_adapters:
+            self._shard_supervisor.set_params(address, params.to_dict())
+        else:
+            self._filters.set_params(address, params)
+
+    def _save_rings_config(self) -> None:
         with open("rings.json", "w") as f:
-            json.dump(rings, f)
+            json.dump(list(self._rings_config.values()), f)
 
     def _on_ring_connect(self, address: str) -> None:
-        self._update_rings_icon()
-        self._rings.on_ring_connect(address)
+        self._rings_view_model.set_status(address, RingStatus.CONNECTED)
 
     def _on_ring_disconnect(self, address: str) -> None:
-        self._update_rings_icon()
-        self._rings.on_ring_disconnect(address)
+        self._rings_view_model.set_status(address, RingStatus.DISCONNECTED)
 
     def _on_ring_connecting(self, address: str) -> None:
-        self._update_rings_icon()
-        self._rings.on_ring_connecting(address)
+        self._rings_view_model.set_status(address, RingStatus.CONNECTING)
 
     def _on_ring_connect_fail(self, address: str, msg: str) -> None:
-        self._update_rings_icon()
-        self._rings.on_ring_connect_fail(address)
-        with self._client:
-            ui.notify(message=f"{address}: {msg}", type="negative")
+        self._rings_view_model.on_connect_fail(address, msg)
+
+    def _on_sharded_ring_status(self, address: str, status: RingStatus) -> None:
+        self._rings_view_model.set_status(address, status)
+
+    def _start_hub_receiver(self) -> None:
+        if self._hub_receiver is not None:
+            return
+        self._hub_receiver = HubReceiver(
+            on_sample=self._on_hub_sample, on_status=self._on_hub_status
+        )
+        self._hub_receiver_task = asyncio.create_task(self._hub_receiver.run())
+
+    def _on_hub_status(self, address: str, status: RingStatus) -> None:
+        if address in self._hub_addresses:
+            self._rings_view_model.set_status(address, status)
+
+    def _on_hub_sample(self, address: str, data: AccelerometerData) -> None:
+        if address in self._hub_addresses:
+            self._filters.on_raw_sensor_data(address, data)
 
     async def _on_ring_raw_sensor_data(
         self, address: str, data: AccelerometerData
     ) -> None:
+        if address not in self._rings_config:
+            return
         self._filters.on_raw_sensor_data(address, data)
 
-    def _update_rings_icon(self) -> None:
-        if any(
-            [r.status == RingStatus.DISCONNECTED for r in self._ring_managers.values()]
-        ):
-            self._tab_rings.icon = "warning"
-        elif any(
-            [r.status == RingStatus.CONNECTING for r in self._ring_managers.values()]
-        ):
-            self._tab_rings.icon = "bluetooth_searching"
-        else:
-            self._tab_rings.icon = "check"
+    def _update_ring_stats(self) -> None:
+        for address, ring in self._ring_managers.items():
+            self._rings_view_model.set_timing_stats(
+                address, self._filters.timing_stats(address)
+            )
+            self._rings_view_model.set_link_stats(address, ring.link_stats)
+        for address in self._hub_addresses:
+            self._rings_view_model.set_timing_stats(
+                address, self._filters.timing_stats(address)
+            )
+
+    async def _render_frames(self) -> None:
+        frames_per_stats_update = round(_STATS_PERIOD / _UI_FRAME_PERIOD)
+        frame = 0
+        while True:
+            await asyncio.sleep(_UI_FRAME_PERIOD)
+            if frame % frames_per_stats_update == 0:
+                self._update_ring_stats()
+            frame += 1
+
+            # Formatted once, shared by all views.
+            displays = [
+                _ring_display(ring) for ring in self._rings_view_model.take_dirty()
+            ]
+            rings_icon = self._rings_view_model.rings_icon
+            failures = self._rings_view_model.take_connect_failures()
+            # Browsers that never connected are deleted without a disconnect event.
+            self._views = [view for view in self._views if view.is_alive]
+            for view in list(self._views):
+                try:
+                    view.render(displays, rings_icon, failures)
+                except Exception:
+                    traceback.print_exc()
 
     def _update_midi_icon(self) -> None:
-        if any(
-            getattr(self._midi_config, f.name) is None
-            for f in fields(self._midi_config)
+        if len(self._midi_config.routes) == 0 or any(
+            (route.address not in self._rings_config and route.address != CROWD_ADDRESS)
+            or route_error(route) is not None
+            for route in self._midi_config.routes
         ):
-            self._tab_midi.icon = "warning"
+            self._midi_icon = "warning"
         else:
-            self._tab_midi.icon = "check"
+            self._midi_icon = "check"
+        for view in self._views:
+            view.set_midi_icon(self._midi_icon)
+
+    def _route(self, address: str, feature: str, value: float) -> None:
+        metrics.inc(
+            MIDI_MESSAGES_SENT,
+            address,
+            self._midi_router.route(address, feature, value),
+        )
 
     def _on_abs_filter_output(self, address: str, output: FilterAbsOutput) -> None:
-        if (
-            self._midi_config.abs_ring_1 is not None
-            and address == self._midi_config.abs_ring_1
-        ):
-            self._midi_out.send_abs_1(max(0.0, min(1.0, (output.value - 500) / 2500)))
-        if (
-            self._midi_config.abs_ring_2 is not None
-            and address == self._midi_config.abs_ring_2
-        ):
-            self._midi_out.send_abs_2(max(0.0, min(1.0, (output.value - 500) / 2500)))
-        if (
-            self._midi_config.abs_ring_3 is not None
-            and address == self._midi_config.abs_ring_3
-        ):
-            self._midi_out.send_abs_3(max(0.0, min(1.0, (output.value - 500) / 2500)))
+        if address not in self._rings_config:
+            return
+        value = self._abs_normalizers[address].normalize(output.value, output.timestamp)
+        self._crowd.on_activity(address, value)
+        self._route(address, FEATURE_ABS, value)
 
     def _on_leaky_integrator_filter_output(
         self, address: str, output: FilterLeakyIntegratorOutput
     ) -> None:
-        if (
-            self._midi_config.abs_ring_1 is not None
-            and address == self._midi_config.abs_ring_1
-        ):
-            self._midi_out.send_leaky_integrator_1(max(0.0, min(1.0, output.value / 1)))
-        if (
-            self._midi_config.abs_ring_2 is not None
-            and address == self._midi_config.abs_ring_2
-        ):
-            self._midi_out.send_leaky_integrator_2(max(0.0, min(1.0, output.value / 1)))
-        if (
-            self._midi_config.abs_ring_3 is not None
-            and address == self._midi_config.abs_ring_3
-        ):
-            self._midi_out.send_leaky_integrator_3(max(0.0, min(1.0, output.value / 1)))
+        if address not in self._rings_config:
+            return
+        value = max(0.0, min(1.0, output.value))
+        self._crowd.on_trigger(address, value)
+        self._route(address, FEATURE_LEAKY_INTEGRATOR, value)
+
+    def _on_energy_filter_output(
+        self, address: str, output: FilterEnergyOutput
+    ) -> None:
+        if address not in self._rings_config:
+            return
+        # Mean magnitudes like abs, so the range learned from abs keeps the scales comparable.
+        normalizer = self._abs_normalizers[address]
+        for window, value in zip(output.windows, output.values):
+            self._route(address, energy_feature(window), normalizer.scale(value))
+
+    def _on_gesture_filter_output(
+        self, address: str, output: FilterGestureOutput
+    ) -> None:
+        for match in output.matches:
+            self._route(address, gesture_feature(match.name), 1.0)
+            self._route(address, gesture_feature(match.name), 0.0)
 
-    def _on_midi_ring_1_address(self, address: str) -> None:
-        self._midi_config.abs_ring_1 = address
+    def start_gesture_recording(self, address: str) -> str | None:
+        """
+        None is successful. str is error message.
+        """
+        if address not in self._ring_managers and address not in self._hub_addresses:
+            return "Gestures can only be recorded for rings filtered in this process."
+        self._filters.start_gesture_recording(address)
+
+    def stop_gesture_recording(self, address: str, name: str) -> str | None:
+        """
+        None is successful. str is error message. Without a name the recording goes on, to stop again with one.
+        """
+        if name == "":
+            return "Gesture name cannot be empty."
+        values = self._filters.stop_gesture_recording(address)
+        if len(values) < 10:
+            return "Recording too short."
+        self._gesture_library.add(
+            GestureTemplate(
+                name=name, values=values, threshold=0.5 * len(values) ** 0.5
+            )
+        )
+        self._update_midi_features()
+
+    def _update_midi_features(self) -> None:
+        features = self.midi_features
+        for view in self._views:
+            view.update_midi_features(features)
+
+    def set_midi_routes(
+        self, routes: list[MidiRoute], origin: AppView | None = None
+    ) -> str | None:
+        """
+        origin: view the change was made in, it is not told about it again.
+
+        Returns a note for the user about routes that cannot be sent, if any.
+        """
+        self._midi_config.routes = routes
+        errors = self._midi_router.compile(routes)
         self._save_midi_config()
         self._update_midi_icon()
+        for view in self._views:
+            if view is not origin:
+                view.on_midi_routes_change(routes)
+        return _routes_note(errors)
+
+    def save_midi_preset(self, name: str) -> str | None:
+        """
+        Stores the current routes under name, replacing a preset of that name.
+
+        None is successful. str is error message.
+        """
+        if name == "":
+            return "Preset name cannot be empty."
+        self._midi_config.presets[name] = [
+            replace(route) for route in self._midi_config.routes
+        ]
+        self._save_midi_config()
+        for view in self._views:
+            view.on_midi_presets_change(self.midi_presets)
 
-    def _on_midi_ring_2_address(self, address: str) -> None:
-        self._midi_config.abs_ring_2 = address
+    def delete_midi_preset(self, name: str) -> None:
+        if self._midi_config.presets.pop(name, None) is None:
+            return
         self._save_midi_config()
-        self._update_midi_icon()
+        for view in self._views:
+            view.on_midi_presets_change(self.midi_presets)
+
+    def recall_midi_preset(self, name: str, fade: timedelta) -> str | None:
+        """
+        Makes the routes of a preset current, crossfading every output to them over fade.
 
-    def _on_midi_ring_3_address(self, address: str) -> None:
-        self._midi_config.abs_ring_3 = address
+        None is successful. str is error message.
+        """
+        preset = self._midi_config.presets.get(name)
+        if preset is None:
+            return f"No preset {name}."
+        routes = [replace(route) for route in preset]
+        self._midi_config.routes = routes
+        errors = self._midi_router.crossfade(
+            routes, fade.total_seconds(), now=time.perf_counter()
+        )
+        if self._midi_router.is_fading and (
+            self._crossfade_task is None or self._crossfade_task.done()
+        ):
+            self._crossfade_task = asyncio.create_task(self._run_crossfade())
         self._save_midi_config()
         self._update_midi_icon()
+        for view in self._views:
+            view.on_midi_routes_change(routes)
+        return _routes_note(errors)
+
+    async def _run_crossfade(self) -> None:
+        while self._midi_router.is_fading:
+            await asyncio.sleep(_CROSSFADE_FRAME_PERIOD)
+            metrics.inc(
+                MIDI_MESSAGES_SENT, amount=self._midi_router.step(time.perf_counter())
+            )
+
+    async def _send_crowd_aggregates(self) -> None:
+        while True:
+            await asyncio.sleep(_CROWD_PERIOD)
+            crowd = self._crowd.snapshot()
+            rings = max(1, crowd.rings)
+            self._route(CROWD_ADDRESS, FEATURE_CROWD_ENERGY, crowd.energy)
+            self._route(CROWD_ADDRESS, FEATURE_CROWD_MOVING, crowd.moving / rings)
+            self._route(CROWD_ADDRESS, FEATURE_CROWD_TRIGGERED, crowd.triggered / rings)
+            for i in range(self._crowd.top_k):
+                self._route(
+                    CROWD_ADDRESS,
+                    crowd_top_feature(i + 1),
+                    crowd.top[i][1] if i < len(crowd.top) else 0.0,
+                )
+            for i, count in enumerate(crowd.histogram):
+                self._route(CROWD_ADDRESS, crowd_histogram_feature(i), count / rings)
+
+            if self._osc_out is not None:
+                self._osc_out.send("/crowd/energy", crowd.energy, crowd.rings)
+                self._osc_out.send("/crowd/moving", crowd.moving, crowd.triggered)
+                self._osc_out.send(
+                    "/crowd/top",
+                    *(
+                        item
+                        for address, value in crowd.top
+                        for item in (address, value)
+                    ),
+                )
+                self._osc_out.send("/crowd/histogram", *crowd.histogram)
+
+    def reset_normalization(self, address: str) -> None:
+        self._abs_normalizers[address].reset()
+        self._normalization_state.pop(address, None)
+
+    def _save_normalization_state(self) -> None:
+        self._normalization_state.update(
+            {
+                address: normalizer.to_dict()
+                for address, normalizer in self._abs_normalizers.items()
+            }
+        )
+        with open("normalization.json", "w") as f:
+            json.dump(self._normalization_state, f)
+
+    def _load_normalization_state(self) -> None:
+        path = Path("normalization.json")
+        if path.is_file():
+            with open(path, "r") as f:
+                self._normalization_state = json.load(f)
+        else:
+            self._normalization_state = {}
 
     def _save_midi_config(self) -> None:
         with open("midi.json", "w") as f:
             json.dump(asdict(self._midi_config), f)
 
+    def _load_osc_config(self) -> None:
+        path = Path("osc.json")
+        if path.is_file():
+            with open(path, "r") as f:
+                config = json.load(f)
+            self._osc_out = OscOut(config.get("host", "127.0.0.1"), config["port"])
+        else:
+            self._osc_out = None
+
     def _load_midi_config(self) -> None:
         path = Path("midi.json")
         if path.is_file():
             with open(path, "r") as f:
-                self._midi_config = MidiConfig(**json.load(f))
+                self._midi_config = MidiConfig.from_dict(json.load(f))
         else:
             self._midi_config = MidiConfig()
 
 
+@dataclass
+class RingDisplay:
+    """
+    A ring as shown in the UI, formatted once per frame for all views.
+    """
+
+    address: str
+    icon: str
+    status: str
+    sample_rate: str | None = None
+    jitter: str | None = None
+    packet_rate: str | None = None
+    gaps: str | None = None
+    stall: str | None = None
+    reconnect_gap: str | None = None
+
+
+class AppView:
+    """
+    The UI of one connected browser. All state lives in App, which pushes changes to every view.
+    """
+
+    _client: nicegui.Client
+
+    _tab_rings: nicegui.elements.tabs.Tab
+    _tab_midi: nicegui.elements.tabs.Tab
+
+    _rings: UIRings
+    _midi: UIMidi
+    _signals: UISignals
+
+    _ring_addresses: list[str]
+
+    def __init__(self, app: App) -> None:
+        ui.dark_mode(None)
+        self._client = ui.context.client
+
+        with ui.tabs() as tabs:
+            self._tab_rings = ui.tab("Rings", icon=app.rings_icon)
+            self._tab_midi = ui.tab("MIDI", icon=app.midi_icon)
+            tab_signals = ui.tab("Signals", icon="")
+
+        with ui.tab_panels(tabs, value=self._tab_rings).classes("w-full"):
+            with ui.tab_panel(self._tab_rings):
+                self._rings = UIRings(
+                    on_add_ring=app.add_ring,
+                    on_remove_ring=app.remove_ring,
+                    on_filter_params_change=lambda address, params: app.set_filter_params(
+                        address, params, origin=self
+                    ),
+                    on_reset_normalization=app.reset_normalization,
+                    on_start_gesture_recording=app.start_gesture_recording,
+                    on_stop_gesture_recording=app.stop_gesture_recording,
+                )
+            with ui.tab_panel(self._tab_midi):
+                self._midi = UIMidi(
+                    app.midi_config,
+                    on_routes_change=lambda routes: app.set_midi_routes(
+                        routes, origin=self
+                    ),
+                    presets=app.midi_presets,
+                    on_preset_save=app.save_midi_preset,
+                    on_preset_recall=app.recall_midi_preset,
+                    on_preset_delete=app.delete_midi_preset,
+                )
+            with ui.tab_panel(tab_signals):
+                self._signals = UISignals()
+
+        self._ring_addresses = []
+        for address, name, filter_params in app.rings:
+            self.on_ring_add(address, name, filter_params)
+            self._rings.update_ring(app.ring_display(address))
+        self._midi.update_features(app.midi_features)
+
+    @property
+    def is_alive(self) -> bool:
+        return self._client.id in nicegui.Client.instances
+
+    def render(
+        self, rings: list[RingDisplay], rings_icon: str, failures: dict[str, str]
+    ) -> None:
+        """
+        Apply one frame: the rings that changed, the rings tab icon and the connection failures since the last frame.
+        """
+        for ring in rings:
+            self._rings.update_ring(ring)
+        if self._tab_rings.icon != rings_icon:
+            self._tab_rings.icon = rings_icon
+        with self._client:
+            if len(failures) == 1:
+                for address, msg in failures.items():
+                    ui.notify(message=f"{address}: {msg}", type="negative")
+            elif len(failures) > 1:
+                ui.notify(
+                    message=f"{len(failures)} rings failed to connect.",
+                    type="negative",
+                )
+
+    def on_ring_add(self, address: str, name: str, filter_params: FilterParams) -> None:
+        self._rings.add_tab(address, name, filter_params)
+        self._ring_addresses.append(address)
+        self._midi.update_ring_addresses([CROWD_ADDRESS] + self._ring_addresses)
+
+    def on_ring_remove(self, address: str) -> None:
+        self._rings.remove_tab(address)
+        self._ring_addresses.remove(address)
+        self._midi.update_ring_addresses([CROWD_ADDRESS] + self._ring_addresses)
+
+    def on_filter_params_change(self, address: str, params: FilterParams) -> None:
+        self._rings.update_filter_params(address, params)
+
+    def on_midi_routes_change(self, routes: list[MidiRoute]) -> None:
+        self._midi.update_routes(routes)
+
+    def update_midi_features(self, features: list[str]) -> None:
+        self._midi.update_features(features)
+
+    def on_midi_presets_change(self, presets: list[str]) -> None:
+        self._midi.update_presets(presets)
+
+    def set_midi_icon(self, icon: str) -> None:
+        self._tab_midi.icon = icon
+
+
 class UIRings:
-    _on_add_ring: Callable[[str, str], bool]
+    _on_add_ring: Callable[[str, str, FilterParams, bool], str | None]
+    _on_remove_ring: Callable[[str], Awaitable[None]]
+    _on_filter_params_change: Callable[[str, FilterParams], None]
+    _on_reset_normalization: Callable[[str], None]
+    _on_start_gesture_recording: Callable[[str], str | None]
+    _on_stop_gesture_recording: Callable[[str, str], str | None]
 
     _tabs = nicegui.elements.tabs.Tabs
     _panels = nicegui.elements.tabs.TabPanels
     _scan_list = nicegui.elements.list.List
     _tab_new = nicegui.elements.tabs.Tab
     _ring_address = nicegui.elements.input.Input
+    _ring_hub = nicegui.elements.checkbox.Checkbox
 
-    _ring_tabs: dict[str, IORingTab] = {}
-    _ring_tabs_ui: dict[str, nicegui.elements.tabs.Tab] = {}
+    _ring_tabs: dict[str, IORingTab]
+    _ring_tabs_ui: dict[str, nicegui.elements.tabs.Tab]
+    _ring_panels: dict[str, nicegui.elements.tabs.TabPanel]
 
     _scanning: bool
 
-    def __init__(self, on_add_ring: Callable[[str, str], str | None]) -> None:
+    def __init__(
+        self,
+        on_add_ring: Callable[[str, str, FilterParams, bool], str | None],
+        on_remove_ring: Callable[[str], Awaitable[None]],
+        on_filter_params_change: Callable[[str, FilterParams], None],
+        on_reset_normalization: Callable[[str], None],
+        on_start_gesture_recording: Callable[[str], str | None],
+        on_stop_gesture_recording: Callable[[str, str], str | None],
+    ) -> None:
         """
-        on_add_ring is None if successful, str is error message.
+        on_add_ring, on_start_gesture_recording and on_stop_gesture_recording return None if successful, str is
+        error message.
+
+        Ring tabs are only added and removed through add_tab and remove_tab, so every view follows the engine.
         """
         self._on_add_ring = on_add_ring
+        self._on_remove_ring = on_remove_ring
+        self._on_filter_params_change = on_filter_params_change
+        self._on_reset_normalization = on_reset_normalization
+        self._on_start_gesture_recording = on_start_gesture_recording
+        self._on_stop_gesture_recording = on_stop_gesture_recording
+
+        self._ring_tabs = {}
+        self._ring_tabs_ui = {}
+        self._ring_panels = {}
 
         self._scanning = False
 
@@ -274,11 +920,13 @@ class UIRings:
                     self._panels = panels
                     with ui.tab_panel(self._tab_new):
                         self._ring_address = ui.input(label="Ring address")
+                        self._ring_hub = ui.checkbox("Via ring hub")
                         ui.button(
                             text="Add",
                             on_click=lambda: self.add(
                                 address=self._ring_address.value,
                                 name=self._ring_address.value,
+                                hub=self._ring_hub.value,
                             ),
                         )
 
@@ -288,35 +936,46 @@ class UIRings:
                         with ui.list().props("dense separator") as scan_list:
                             self._scan_list = scan_list
 
-    def add(self, address: str, name: str) -> None:
-        result = self._on_add_ring(address, name)
-        if result is None:
-            with self._tabs:
-                self._ring_tabs_ui[address] = ui.tab(name, icon="question_mark")
-                self._tab_new.move(target_index=-1)
-            with self._panels:
-                with ui.tab_panel(name):
-                    self._ring_tabs[address] = IORingTab(
-                        address=address, name=name, on_remove=self._on_ring_tab_remove
-                    )
-        else:
+    def add(self, address: str, name: str, hub: bool = False) -> None:
+        result = self._on_add_ring(address, name, FilterParams(), hub)
+        if result is not None:
             ui.notify(message=result, type="warning")
 
-    def on_ring_connect(self, address: str) -> None:
-        self._ring_tabs_ui[address].icon = "check"
-        self._ring_tabs[address].on_connect()
+    def add_tab(self, address: str, name: str, filter_params: FilterParams) -> None:
+        with self._tabs:
+            self._ring_tabs_ui[address] = ui.tab(name, icon="question_mark")
+            self._tab_new.move(target_index=-1)
+        with self._panels:
+            with ui.tab_panel(self._ring_tabs_ui[address]) as panel:
+                self._ring_panels[address] = panel
+                self._ring_tabs[address] = IORingTab(
+                    address=address,
+                    name=name,
+                    filter_params=filter_params,
+                    on_remove=self._on_remove_ring,
+                    on_filter_params_change=self._on_filter_params_change,
+                    on_reset_normalization=self._on_reset_normalization,
+                    on_start_gesture_recording=self._on_start_gesture_recording,
+                    on_stop_gesture_recording=self._on_stop_gesture_recording,
+                )
 
-    def on_ring_disconnect(self, address: str) -> None:
-        self._ring_tabs_ui[address].icon = "warning"
-        self._ring_tabs[address].on_disconnect()
+    def remove_tab(self, address: str) -> None:
+        del self._ring_tabs[address]
+        if self._panels.value in (address, self._ring_tabs_ui[address]):
+            self._panels.value = self._tab_new
+        self._panels.remove(self._ring_panels.pop(address))
+        self._tabs.remove(self._ring_tabs_ui.pop(address))
 
-    def on_ring_connecting(self, address: str) -> None:
-        self._ring_tabs_ui[address].icon = "bluetooth_searching"
-        self._ring_tabs[address].on_connecting()
+    def update_ring(self, ring: RingDisplay) -> None:
+        if ring.address not in self._ring_tabs:
+            # Removed, its ring manager is shutting down.
+            return
+        if self._ring_tabs_ui[ring.address].icon != ring.icon:
+            self._ring_tabs_ui[ring.address].icon = ring.icon
+        self._ring_tabs[ring.address].update(ring)
 
-    def on_ring_connect_fail(self, address: str) -> None:
-        self._ring_tabs_ui[address].icon = "warning"
-        self._ring_tabs[address].on_connect_fail()
+    def update_filter_params(self, address: str, params: FilterParams) -> None:
+        self._ring_tabs[address].update_filter_params(params)
 
     async def _scan(self) -> None:
         if not self._scanning:
@@ -384,23 +1043,45 @@ class UIRings:
                 table.on("add", lambda msg: self.add(msg.args[0], msg.args[1]))
             self._scanning = False
 
-    def _on_ring_tab_remove(self, address: str) -> None:
-        ui.notify(message="TODO")
-
-    def remove_tab(self):
-        self.tabs.remove(0)
-        self.panels.remove(0)
-
 
 class IORingTab:
-    _on_remove: Callable[[str], None]
+    _on_remove: Callable[[str], Awaitable[None]]
+    _on_filter_params_change: Callable[[str, FilterParams], None]
+    _on_reset_normalization: Callable[[str], None]
+    _on_start_gesture_recording: Callable[[str], str | None]
+    _on_stop_gesture_recording: Callable[[str, str], str | None]
 
     _status: nicegui.elements.item.ItemLabel
+    _gesture_name: nicegui.elements.input.Input
+    _gesture_record: nicegui.elements.button.Button
+    _sample_rate: nicegui.elements.item.ItemLabel
+    _jitter: nicegui.elements.item.ItemLabel
+    _packet_rate: nicegui.elements.item.ItemLabel
+    _gaps: nicegui.elements.item.ItemLabel
+    _stall: nicegui.elements.item.ItemLabel
+    _reconnect_gap: nicegui.elements.item.ItemLabel
+
+    _filter_params: FilterParams
+    _filter_inputs: dict[str, nicegui.elements.number.Number]
 
     def __init__(
-        self, address: str, name: str, on_remove: Callable[[str], None]
+        self,
+        address: str,
+        name: str,
+        filter_params: FilterParams,
+        on_remove: Callable[[str], Awaitable[None]],
+        on_filter_params_change: Callable[[str, FilterParams], None],
+        on_reset_normalization: Callable[[str], None],
+        on_start_gesture_recording: Callable[[str], str | None],
+        on_stop_gesture_recording: Callable[[str, str], str | None],
     ) -> None:
         self._on_remove = on_remove
+        self._on_filter_params_change = on_filter_params_change
+        self._filter_params = filter_params
+        self._filter_inputs = {}
+        self._on_reset_normalization = on_reset_normalization
+        self._on_start_gesture_recording = on_start_gesture_recording
+        self._on_stop_gesture_recording = on_stop_gesture_recording
 
         with ui.list().props("separator"):
             with ui.item():
@@ -418,21 +1099,303 @@ class IORingTab:
                     ui.label("Status:").classes("text-bold")
                 with ui.item_section():
                     self._status = ui.item_label("?")
-        ui.button(text="Remove", on_click=self._on_remove)
+            with ui.item():
+                with ui.item_section():
+                    ui.label("Sample rate:").classes("text-bold")
+                with ui.item_section():
+                    self._sample_rate = ui.item_label("?")
+            with ui.item():
+                with ui.item_section():
+                    ui.label("Jitter:").classes("text-bold")
+                with ui.item_section():
+                    self._jitter = ui.item_label("?")
+            with ui.item():
+                with ui.item_section():
+                    ui.label("Packet rate:").classes("text-bold")
+                with ui.item_section():
+                    self._packet_rate = ui.item_label("?")
+            with ui.item():
+                with ui.item_section():
+                    ui.label("Packet gaps:").classes("text-bold")
+                with ui.item_section():
+                    self._gaps = ui.item_label("?")
+            with ui.item():
+                with ui.item_section():
+                    ui.label("Stall:").classes("text-bold")
+                with ui.item_section():
+                    self._stall = ui.item_label("?")
+            with ui.item():
+                with ui.item_section():
+                    ui.label("Last reconnect gap:").classes("text-bold")
+                with ui.item_section():
+                    self._reconnect_gap = ui.item_label("?")
+        ui.button(text="Remove", on_click=lambda: self._on_remove(address))
+        ui.button(
+            text="Reset normalization",
+            on_click=lambda: self._on_reset_normalization(address),
+        )
 
-    def on_connect(self) -> None:
-        self._status.text = "Connected"
+        with ui.expansion("Filters", icon="tune").classes("w-full"):
+            with ui.row():
+                self._duration_input(
+                    address, "Abs period (ms)", "abs_update_period", minimum=5
+                )
+                self._duration_input(
+                    address, "Abs window (ms)", "abs_window_size", minimum=20
+                )
+            with ui.row():
+                self._duration_input(
+                    address,
+                    "Leaky integrator period (ms)",
+                    "leaky_integrator_update_period",
+                    minimum=5,
+                )
+                self._number_input(
+                    address,
+                    "Damping",
+                    "leaky_integrator_damping",
+                    minimum=0.0,
+                    maximum=1.0,
+                    step=0.05,
+                )
+                self._number_input(
+                    address,
+                    "Trigger threshold",
+                    "leaky_integrator_threshold",
+                    minimum=0.0,
+                    maximum=4000.0,
+                    step=50.0,
+                )
+            with ui.row():
+                self._duration_input(
+                    address, "Gesture period (ms)", "gesture_update_period", minimum=10
+                )
+                self._number_input(
+                    address,
+                    "Gesture rest threshold",
+                    "gesture_min_std",
+                    minimum=0.0,
+                    maximum=1000.0,
+                    step=5.0,
+                )
+            with ui.row():
+                self._duration_input(
+                    address, "Idle after (ms)", "idle_after", minimum=100
+                )
+                self._number_input(
+                    address,
+                    "Wake threshold",
+                    "wake_threshold",
+                    minimum=0.0,
+                    maximum=2000.0,
+                    step=10.0,
+                )
+            with ui.row():
+                self._duration_input(
+                    address, "Energy period (ms)", "energy_update_period", minimum=5
+                )
+                self._windows_input(address, "Energy windows (ms)", "energy_windows")
 
-    def on_disconnect(self) -> None:
-        self._status.text = "Disconnected"
+        ui.separator()
 
-    def on_connecting(self) -> None:
-        self._status.text = "Connecting"
+        with ui.row():
+            self._gesture_name = ui.input(label="Gesture name")
+            self._gesture_record = ui.button(
+                text="Record gesture",
+                on_click=lambda: self._on_gesture_record_click(address),
+            )
 
-    def on_connect_fail(self) -> None:
-        self._status.text = "Disconnected"
+    def _duration_input(
+        self, address: str, label: str, name: str, minimum: float
+    ) -> None:
+        self._filter_inputs[name] = ui.number(
+            label=label,
+            value=getattr(self._filter_params, name).total_seconds() * 1000.0,
+            min=minimum,
+            step=5,
+            on_change=lambda e: self._set_filter_param(
+                address,
+                name,
+                (
+                    None
+                    if e.value is None or e.value < minimum
+                    else timedelta(milliseconds=e.value)
+                ),
+            ),
+        ).classes("w-48")
+
+    def _windows_input(self, address: str, label: str, name: str) -> None:
+        """
+        Durations as comma separated milliseconds, applied on blur or Enter. Applying every keystroke would pass through
+        shorter windows, e.g. 50 on the way to 5000, and the filter drops the samples the longer window needs.
+        """
+        element = ui.input(
+            label=label, value=_format_windows(getattr(self._filter_params, name))
+        ).classes("w-48")
+
+        def apply() -> None:
+            windows = _parse_windows(element.value)
+            if windows is None:
+                element.value = _format_windows(getattr(self._filter_params, name))
+                return
+            self._set_filter_param(address, name, windows)
+
+        element.on("blur", apply)
+        element.on("keydown.enter", apply)
+        self._filter_inputs[name] = element
+
+    def _number_input(
+        self,
+        address: str,
+        label: str,
+        name: str,
+        minimum: float,
+        maximum: float,
+        step: float,
+    ) -> None:
+        self._filter_inputs[name] = ui.number(
+            label=label,
+            value=getattr(self._filter_params, name),
+            min=minimum,
+            max=maximum,
+            step=step,
+            on_change=lambda e: self._set_filter_param(
+                address,
+                name,
+                (
+                    None
+                    if e.value is None or not minimum <= e.value <= maximum
+                    else e.value
+                ),
+            ),
+        ).classes("w-48")
+
+    def _set_filter_param(self, address: str, name: str, value) -> None:
+        if value is None or getattr(self._filter_params, name) == value:
+            return
+        self._filter_params = replace(self._filter_params, **{name: value})
+        self._on_filter_params_change(address, self._filter_params)
+
+    def update_filter_params(self, params: FilterParams) -> None:
+        """
+        Show parameters changed elsewhere.
+        """
+        self._filter_params = params
+        for name, element in self._filter_inputs.items():
+            value = getattr(params, name)
+            if isinstance(value, list):
+                element.value = _format_windows(value)
+            elif isinstance(value, timedelta):
+                element.value = value.total_seconds() * 1000.0
+            else:
+                element.value = value
+
+    def update(self, ring: RingDisplay) -> None:
+        for label, text in (
+            (self._status, ring.status),
+            (self._sample_rate, ring.sample_rate),
+            (self._jitter, ring.jitter),
+            (self._packet_rate, ring.packet_rate),
+            (self._gaps, ring.gaps),
+            (self._stall, ring.stall),
+            (self._reconnect_gap, ring.reconnect_gap),
+        ):
+            if text is not None and label.text != text:
+                label.text = text
+
+    def _on_gesture_record_click(self, address: str) -> None:
+        if self._gesture_record.text == "Record gesture":
+            result = self._on_start_gesture_recording(address)
+            if result is None:
+                self._gesture_record.text = "Stop recording"
+        else:
+            result = self._on_stop_gesture_recording(address, self._gesture_name.value)
+            if result is None or self._gesture_name.value != "":
+                # Without a name it is still recording.
+                self._gesture_record.text = "Record gesture"
+            if result is None:
+                ui.notify(message=f"Gesture {self._gesture_name.value} saved.")
+        if result is not None:
+            ui.notify(message=result, type="warning")
 
 
 class UISignals:
     def __init__(self) -> None:
         pass
+
+
+def _ring_display(ring: RingView) -> RingDisplay:
+    display = RingDisplay(
+        address=ring.address,
+        icon=_STATUS_ICONS[ring.status],
+        status=_STATUS_TEXTS[ring.status],
+    )
+    if ring.timing_stats is not None:
+        stats = ring.timing_stats
+        display.sample_rate = f"{stats.sample_rate:.1f} Hz"
+        display.jitter = (
+            f"{stats.jitter.total_seconds() * 1000:.1f} ms ({stats.gaps} gaps)"
+        )
+    if ring.link_stats is not None:
+        stats = ring.link_stats
+        display.packet_rate = f"{stats.packet_rate:.1f} Hz ({stats.packets} total)"
+        display.gaps = (
+            f"mean {stats.mean_gap.total_seconds() * 1000:.0f} ms, "
+            f"max {stats.max_gap.total_seconds() * 1000:.0f} ms"
+        )
+        display.stall = (
+            f"{stats.stall.total_seconds():.1f} s "
+            f"({stats.resends} resends, {stats.forced_reconnects} forced reconnects)"
+        )
+        display.reconnect_gap = (
+            "-"
+            if stats.last_reconnect_gap is None
+            else f"{stats.last_reconnect_gap.total_seconds():.2f} s"
+        )
+    return display
+
+
+def _routes_note(errors: list[str]) -> str | None:
+    return None if len(errors) == 0 else "Not sent: " + " ".join(errors)
+
+
+def _format_windows(windows: list[timedelta]) -> str:
+    return ", ".join(f"{window.total_seconds() * 1000.0:g}" for window in windows)
+
+
+def _parse_windows(text: str) -> list[timedelta] | None:
+    """
+    None unless every entry is a duration of at least 20 ms, the sample period after timing reconstruction.
+    """
+    try:
+        windows = [float(part) for part in text.split(",") if part.strip() != ""]
+    except ValueError:
+        return None
+    if len(windows) == 0 or any(window < 20.0 for window in windows):
+        return None
+    return [timedelta(milliseconds=window) for window in windows]
+
+
+_UI_FRAME_PERIOD = 0.1
+"""Seconds between UI reconciliations, caps the rate of UI updates no matter how many ring events arrive."""
+
+_CROSSFADE_FRAME_PERIOD = 0.02
+"""Seconds between the frames of a MIDI preset crossfade."""
+_CROWD_PERIOD = 0.05
+"""Seconds between crowd aggregate outputs."""
+_STATS_PERIOD = 1.0
+"""Seconds between refreshes of the timing and link statistics."""
+
+_STATUS_ICONS = {
+    None: "question_mark",
+    RingStatus.CONNECTED: "check",
+    RingStatus.DISCONNECTED: "warning",
+    RingStatus.CONNECTING: "bluetooth_searching",
+}
+
+_STATUS_TEXTS = {
+    None: "?",
+    RingStatus.CONNECTED: "Connected",
+    RingStatus.DISCONNECTED: "Disconnected",
+    RingStatus.CONNECTING: "Connecting",
+}
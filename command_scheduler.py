@@ -0,0 +1,216 @@
+from ring_transport import RingTransport, RingTransportError
+from clock import Clock, system_clock
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from enum import IntEnum
+from typing import Awaitable, Callable
+import asyncio
+import heapq
+import itertools
+
+
+class CommandPriority(IntEnum):
+    STREAM = 0
+    """Keeps the accelerometer stream going. Written right away, without rate limit."""
+    READING = 1
+    """Readings somebody waits for."""
+    POLL = 2
+    """Periodic background polls."""
+
+
+@dataclass(order=True)
+class _Command:
+    priority: int
+    sequence: int
+    packet: bytes = field(compare=False)
+    written: asyncio.Future = field(compare=False)
+
+
+class CommandScheduler:
+    """
+    Multiplexes the commands of one ring over its UART and routes notifications by packet type.
+
+    Commands are written one at a time, highest priority first and in order within a priority. Writes other than
+    STREAM commands are at least min_interval apart, so readings of other sensors never crowd the accelerometer
+    notifications off the link. A request waits for the next notification of its reply type, with at most one request
+    per reply type in flight. Notifications nobody waits for go to the handler of their type.
+    """
+
+    _address: str
+    _clock: Clock
+    _min_interval: timedelta
+
+    _queue: list[_Command]
+    _sequence: itertools.count
+    _queue_event: asyncio.Event
+    _writer_task: asyncio.Task | None
+    _last_write: datetime | None
+
+    _handlers: dict[int, Callable[[bytearray], Awaitable[None]]]
+    _reply_locks: dict[int, asyncio.Lock]
+    _replies: dict[int, asyncio.Future]
+
+    def __init__(
+        self,
+        address: str,
+        min_interval: timedelta = timedelta(milliseconds=100),
+        clock: Clock = system_clock,
+    ) -> None:
+        """
+        address: only used in error messages.
+        """
+        self._address = address
+        self._clock = clock
+        self._min_interval = min_interval
+
+        self._queue = []
+        self._sequence = itertools.count()
+        self._queue_event = asyncio.Event()
+        self._writer_task = None
+        self._last_write = None
+
+        self._handlers = {}
+        self._reply_locks = {}
+        self._replies = {}
+
+    def set_handler(
+        self, packet_type: int, handler: Callable[[bytearray], Awaitable[None]]
+    ) -> None:
+        self._handlers[packet_type] = handler
+
+    def start(self, transport: RingTransport) -> None:
+        """
+        Starts writing to a newly connected transport.
+        """
+        self.stop()
+        self._writer_task = asyncio.create_task(self._write_loop(transport))
+
+    def stop(self) -> None:
+        """
+        The connection is gone: fails queued commands and open requests.
+        """
+        if self._writer_task is not None:
+            self._writer_task.cancel()
+            self._writer_task = None
+        error = RingTransportError(f"{self._address} disconnected")
+        for command in self._queue:
+            if not command.written.done():
+                command.written.set_exception(error)
+        self._queue.clear()
+        for reply in self._replies.values():
+            if not reply.done():
+                reply.set_exception(error)
+
+    async def send(
+        self, packet: bytes, priority: CommandPriority = CommandPriority.READING
+    ) -> None:
+        """
+        Returns once the packet is written.
+        """
+        if self._writer_task is None:
+            raise RingTransportError(f"{self._address} is not connected")
+        written = asyncio.get_running_loop().create_future()
+        heapq.heappush(
+            self._queue, _Command(priority, next(self._sequence), packet, written)
+        )
+        self._queue_event.set()
+        await written
+
+    async def request(
+        self,
+        packet: bytes,
+        reply_type: int,
+        priority: CommandPriority = CommandPriority.READING,
+        timeout: timedelta = timedelta(seconds=2),
+    ) -> bytearray:
+        """
+        Sends packet and returns the next notification of reply_type.
+        """
+        async with self._reply_locks.setdefault(reply_type, asyncio.Lock()):
+            reply = asyncio.get_running_loop().create_future()
+            self._replies[reply_type] = reply
+            try:
+                await self.send(packet, priority)
+                return await self._wait_reply(reply, reply_type, timeout)
+            finally:
+                self._replies.pop(reply_type, None)
+                if reply.done() and not reply.cancelled():
+                    # Marks a failure as seen when the send failed first.
+                    reply.exception()
+
+    async def expect(
+        self, reply_type: int, timeout: timedelta = timedelta(seconds=2)
+    ) -> bytearray:
+        """
+        Returns the next notification of reply_type, for commands that answer with more than one.
+        """
+        async with self._reply_locks.setdefault(reply_type, asyncio.Lock()):
+            reply = asyncio.get_running_loop().create_future()
+            self._replies[reply_type] = reply
+            try:
+                return await self._wait_reply(reply, reply_type, timeout)
+            finally:
+                self._replies.pop(reply_type, None)
+
+    async def on_notification(self, data: bytearray) -> None:
+        reply = self._replies.get(data[0])
+        if reply is not None and not reply.done():
+            reply.set_result(data)
+            return
+        handler = self._handlers.get(data[0])
+        if handler is not None:
+            await handler(data)
+
+    async def _wait_reply(
+        self, reply: asyncio.Future, reply_type: int, timeout: timedelta
+    ) -> bytearray:
+        try:
+            return await asyncio.wait_for(reply, timeout=timeout.total_seconds())
+        except asyncio.TimeoutError:
+            raise RingTransportError(
+                f"{self._address} did not reply to command {reply_type:#04x}"
+            )
+
+    async def _write_loop(self, transport: RingTransport) -> None:
+        while True:
+            if len(self._queue) == 0:
+                self._queue_event.clear()
+                await self._queue_event.wait()
+                continue
+
+            command = self._queue[0]
+            if (
+                command.priority != CommandPriority.STREAM
+                and self._last_write is not None
+            ):
+                wait = self._last_write + self._min_interval - self._clock.now()
+                if wait > timedelta(0):
+                    # A more urgent command queued meanwhile is written first.
+                    self._queue_event.clear()
+                    try:
+                        await asyncio.wait_for(
+                            self._queue_event.wait(), timeout=wait.total_seconds()
+                        )
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+            heapq.heappop(self._queue)
+            if command.written.done():
+                continue
+            try:
+                await transport.write(command.packet)
+            except asyncio.CancelledError:
+                if not command.written.done():
+                    command.written.set_exception(
+                        RingTransportError(f"{self._address} disconnected")
+                    )
+                raise
+            except RingTransportError as e:
+                if not command.written.done():
+                    command.written.set_exception(e)
+            else:
+                # The sender may have been cancelled during the write, e.g. a poll at disconnect.
+                if not command.written.done():
+                    command.written.set_result(None)
+            self._last_write = self._clock.now()
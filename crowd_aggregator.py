@@ -0,0 +1,148 @@
+from dataclasses import dataclass
+import heapq
+import itertools
+
+
+@dataclass
+class CrowdSnapshot:
+    rings: int
+    energy: float
+    """Mean activity over all rings, 0 to 1."""
+    moving: int
+    """Rings with activity above the moving threshold."""
+    triggered: int
+    """Rings whose leaky integrator is above the trigger threshold."""
+    top: list[tuple[str, float]]
+    """Address and activity of the most active rings, most active first."""
+    histogram: list[int]
+    """Rings per activity bin, bins of equal width from 0 to 1."""
+
+
+class CrowdAggregator:
+    """
+    Crowd-level signals over the filter outputs of all rings, kept up to date incrementally.
+
+    Every output only changes the running sum, the moving and triggered counts and the histogram bin counts by the
+    difference to the previous value of its ring, so a snapshot costs nothing that grows with the number of rings
+    except the top k. That comes from a max-heap with lazy deletion: every update pushes a new entry, entries that are
+    not the latest of their ring are discarded when they surface, and the heap is rebuilt when stale entries dominate.
+    """
+
+    _moving_threshold: float
+    _triggered_threshold: float
+    _top_k: int
+    _bins: int
+
+    _activity: dict[str, float]
+    _triggers: dict[str, float]
+    _versions: dict[str, int]
+    _sum: float
+    _moving: int
+    _triggered: int
+    _histogram: list[int]
+    _heap: list[tuple[float, int, str]]
+    """(-activity, version, address)."""
+    _version_counter: itertools.count
+
+    def __init__(
+        self,
+        moving_threshold: float = 0.2,
+        triggered_threshold: float = 0.5,
+        top_k: int = 3,
+        bins: int = 8,
+    ) -> None:
+        """
+        Activity is the normalized abs output of a ring, triggers its leaky integrator output, both 0 to 1.
+        """
+        self._moving_threshold = moving_threshold
+        self._triggered_threshold = triggered_threshold
+        self._top_k = top_k
+        self._bins = bins
+
+        self._activity = {}
+        self._triggers = {}
+        self._versions = {}
+        self._sum = 0.0
+        self._moving = 0
+        self._triggered = 0
+        self._histogram = [0] * bins
+        self._heap = []
+        self._version_counter = itertools.count()
+
+    @property
+    def top_k(self) -> int:
+        return self._top_k
+
+    @property
+    def bins(self) -> int:
+        return self._bins
+
+    def on_activity(self, address: str, value: float) -> None:
+        old = self._activity.get(address)
+        if old is not None:
+            self._sum -= old
+            self._moving -= old > self._moving_threshold
+            self._histogram[self._bin(old)] -= 1
+        self._activity[address] = value
+        self._sum += value
+        self._moving += value > self._moving_threshold
+        self._histogram[self._bin(value)] += 1
+
+        version = next(self._version_counter)
+        self._versions[address] = version
+        heapq.heappush(self._heap, (-value, version, address))
+        if len(self._heap) > 4 * len(self._activity) + 64:
+            self._rebuild_heap()
+
+    def on_trigger(self, address: str, value: float) -> None:
+        old = self._triggers.get(address)
+        if old is not None:
+            self._triggered -= old > self._triggered_threshold
+        self._triggers[address] = value
+        self._triggered += value > self._triggered_threshold
+
+    def remove(self, address: str) -> None:
+        old = self._activity.pop(address, None)
+        if old is not None:
+            self._sum -= old
+            self._moving -= old > self._moving_threshold
+            self._histogram[self._bin(old)] -= 1
+            # Its heap entries are stale from now on.
+            del self._versions[address]
+        old = self._triggers.pop(address, None)
+        if old is not None:
+            self._triggered -= old > self._triggered_threshold
+
+    def snapshot(self) -> CrowdSnapshot:
+        rings = len(self._activity)
+        return CrowdSnapshot(
+            rings=rings,
+            energy=0.0 if rings == 0 else max(0.0, min(1.0, self._sum / rings)),
+            moving=self._moving,
+            triggered=self._triggered,
+            top=self._top(),
+            histogram=list(self._histogram),
+        )
+
+    def _top(self) -> list[tuple[str, float]]:
+        top = []
+        while len(top) < self._top_k and len(self._heap) > 0:
+            entry = heapq.heappop(self._heap)
+            _, version, address = entry
+            if self._versions.get(address) == version:
+                top.append(entry)
+        for entry in top:
+            heapq.heappush(self._heap, entry)
+        return [(address, -negative) for negative, _, address in top]
+
+    def _rebuild_heap(self) -> None:
+        self._heap = [
+            (-self._activity[address], version, address)
+            for address, version in self._versions.items()
+        ]
+        heapq.heapify(self._heap)
+        # As rare as the rebuilds, undoes rounding drift of the running sum.
+        self._sum = sum(self._activity.values())
+
+    def _bin(self, value: float) -> int:
+        return max(0, min(self._bins - 1, int(value * self._bins)))
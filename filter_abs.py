@@ -1,10 +1,12 @@
 from accelerometer_data import AccelerometerData
+from clock import Clock, system_clock
 from dataclasses import dataclass
 from datetime import datetime, timedelta
 from typing import AsyncGenerator
 import asyncio
 from collections import deque
 import numpy as np
+import time
 
 
 @dataclass
@@ -18,15 +20,27 @@ class FilterAbs:
     Ingests accelerometer xyz, possibly with missing samples & inconsistent period, outputs approximate absolute value at a consistent period.
     """
 
-    _stop_event: asyncio.Event | None
+    _clock: Clock
+    _stopped: bool
+    _interrupt_event: asyncio.Event
+    """Ends the current wait early, to tick now or to stop."""
     _input_data: deque[AccelerometerData]
     _update_period: timedelta
+    _last_tick_duration: float
     _window_size: timedelta
 
-    def __init__(self, update_period: timedelta, window_size: timedelta) -> None:
-        self._stop_event = None
+    def __init__(
+        self,
+        update_period: timedelta,
+        window_size: timedelta,
+        clock: Clock = system_clock,
+    ) -> None:
+        self._clock = clock
+        self._stopped = False
+        self._interrupt_event = asyncio.Event()
         self._input_data = deque()
         self._update_period = update_period
+        self._last_tick_duration = 0.0
         self._window_size = window_size
 
     def set_update_period(self, update_period: timedelta) -> None:
@@ -39,28 +53,30 @@ class FilterAbs:
         self._input_data.append(data)
 
     async def run(self) -> AsyncGenerator[FilterAbsOutput, None]:
-        self._stop_event = asyncio.Event()
-
-        while True:
-            stop_wait_task = asyncio.create_task(self._stop_event.wait())
+        while not self._stopped:
+            interrupt_wait_task = asyncio.create_task(self._interrupt_event.wait())
             timer_task = asyncio.create_task(
-                asyncio.sleep(self._update_period.total_seconds())
+                self._clock.sleep(self._update_period.total_seconds())
             )
 
             done, pending = await asyncio.wait(
-                [stop_wait_task, timer_task], return_when=asyncio.FIRST_COMPLETED
+                [interrupt_wait_task, timer_task], return_when=asyncio.FIRST_COMPLETED
             )
 
             for task in pending:
                 task.cancel()
 
-            if stop_wait_task in done:
+            self._interrupt_event.clear()
+            if self._stopped:
                 break
 
-            yield self._do_loop_iteration()
+            start = time.perf_counter()
+            output = self._do_loop_iteration()
+            self._last_tick_duration = time.perf_counter() - start
+            yield output
 
     def _do_loop_iteration(self) -> FilterAbsOutput:
-        now = datetime.now()
+        now = self._clock.now()
         while (
             len(self._input_data) > 0
             and now - self._input_data[0].timestamp > self._window_size
@@ -75,9 +91,25 @@ class FilterAbs:
 
         return FilterAbsOutput(
             mean,
-            datetime.now(),
+            self._clock.now(),
         )
 
+    @property
+    def last_tick_duration(self) -> float:
+        """
+        Seconds spent computing the most recent output.
+        """
+        return self._last_tick_duration
+
+    def wake(self) -> None:
+        """
+        Tick now instead of at the end of the current update period.
+        """
+        self._interrupt_event.set()
+
     def close(self) -> None:
-        if self._stop_event is not None and not self._stop_event.is_set():
-            self._stop_event.set()
+        """
+        Ends run, also when it has not started yet.
+        """
+        self._stopped = True
+        self._interrupt_event.set()
@@ -0,0 +1,155 @@
+from accelerometer_data import AccelerometerData
+from clock import Clock, system_clock
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import AsyncGenerator
+import asyncio
+import math
+import time
+
+
+@dataclass
+class FilterEnergyOutput:
+    values: list[float]
+    """Mean acceleration magnitude over each window, in the order of the windows."""
+    windows: list[timedelta]
+    timestamp: datetime
+
+
+class FilterEnergy:
+    """
+    Mean acceleration magnitude over any number of windows, e.g. short, medium and long term energy, from one buffer.
+
+    The buffer holds the samples of the longest window as timestamps and a prefix sum of their magnitudes, so the sum
+    over any window is the difference of two prefix sums. Each window keeps the index of its oldest sample, which only
+    moves forward, so a tick costs O(1) amortized per window however many samples the windows span.
+    """
+
+    _clock: Clock
+    _stopped: bool
+    _interrupt_event: asyncio.Event
+    """Ends the current wait early, to tick now or to stop."""
+    _update_period: timedelta
+    _last_tick_duration: float
+    _windows: list[timedelta]
+
+    _times: list[float]
+    """Unix seconds of the buffered samples."""
+    _prefix: list[float]
+    """_prefix[i] is the sum of the magnitudes of the samples before i, one entry longer than _times."""
+    _start: int
+    """First sample still within the longest window."""
+    _window_starts: list[int]
+    """First sample within each window."""
+
+    def __init__(
+        self,
+        update_period: timedelta,
+        windows: list[timedelta],
+        clock: Clock = system_clock,
+    ) -> None:
+        self._clock = clock
+        self._stopped = False
+        self._interrupt_event = asyncio.Event()
+        self._update_period = update_period
+        self._last_tick_duration = 0.0
+        self._times = []
+        self._prefix = [0.0]
+        self._start = 0
+        self.set_windows(windows)
+
+    def set_update_period(self, update_period: timedelta) -> None:
+        self._update_period = update_period
+
+    def set_windows(self, windows: list[timedelta]) -> None:
+        """
+        Windows longer than the previous longest one only see the samples from now on.
+        """
+        self._windows = list(windows)
+        self._window_starts = [self._start] * len(windows)
+
+    def on_accelerometer_data(self, data: AccelerometerData) -> None:
+        self._times.append(data.timestamp.timestamp())
+        self._prefix.append(
+            self._prefix[-1] + math.sqrt(data.x**2 + data.y**2 + data.z**2)
+        )
+
+    async def run(self) -> AsyncGenerator[FilterEnergyOutput, None]:
+        while not self._stopped:
+            interrupt_wait_task = asyncio.create_task(self._interrupt_event.wait())
+            timer_task = asyncio.create_task(
+                self._clock.sleep(self._update_period.total_seconds())
+            )
+
+            done, pending = await asyncio.wait(
+                [interrupt_wait_task, timer_task], return_when=asyncio.FIRST_COMPLETED
+            )
+
+            for task in pending:
+                task.cancel()
+
+            self._interrupt_event.clear()
+            if self._stopped:
+                break
+
+            start = time.perf_counter()
+            output = self._do_loop_iteration()
+            self._last_tick_duration = time.perf_counter() - start
+            yield output
+
+    def _do_loop_iteration(self) -> FilterEnergyOutput:
+        now = self._clock.now()
+        end = len(self._times)
+        values = []
+        for i, window in enumerate(self._windows):
+            oldest = now.timestamp() - window.total_seconds()
+            first = self._window_starts[i]
+            while first < end and self._times[first] < oldest:
+                first += 1
+            self._window_starts[i] = first
+            values.append(
+                0.0
+                if first == end
+                else (self._prefix[end] - self._prefix[first]) / (end - first)
+            )
+
+        self._start = min(self._window_starts, default=end)
+        if self._start > _MIN_COMPACT and 2 * self._start > end:
+            self._compact()
+
+        return FilterEnergyOutput(values, list(self._windows), now)
+
+    def _compact(self) -> None:
+        """
+        Drops the samples before the longest window, amortized O(1) per sample as at least half the buffer goes.
+        Rebasing the prefix sums also keeps them from growing without bound and losing precision.
+        """
+        offset = self._prefix[self._start]
+        del self._times[: self._start]
+        self._prefix = [value - offset for value in self._prefix[self._start :]]
+        self._window_starts = [first - self._start for first in self._window_starts]
+        self._start = 0
+
+    @property
+    def last_tick_duration(self) -> float:
+        """
+        Seconds spent computing the most recent output.
+        """
+        return self._last_tick_duration
+
+    def wake(self) -> None:
+        """
+        Tick now instead of at the end of the current update period.
+        """
+        self._interrupt_event.set()
+
+    def close(self) -> None:
+        """
+        Ends run, also when it has not started yet.
+        """
+        self._stopped = True
+        self._interrupt_event.set()
+
+
+_MIN_COMPACT = 64
+"""Samples to drop at least per compaction."""
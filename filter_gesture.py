@@ -0,0 +1,346 @@
+from __future__ import annotations
+
+from accelerometer_data import AccelerometerData
+from clock import Clock, system_clock
+from dataclasses import dataclass, field, asdict
+from datetime import datetime, timedelta
+from typing import AsyncGenerator
+from pathlib import Path
+import asyncio
+import json
+import math
+import numpy as np
+import time
+
+
+@dataclass
+class GestureTemplate:
+    name: str
+    values: list[float]
+    """Recorded acceleration magnitude, one value per resampled sample."""
+    threshold: float
+    """Largest DTW distance, between z-normalized sequences, that counts as a match."""
+    band: int = 0
+    """Sakoe-Chiba band half width in samples. 0 means 10% of the template length."""
+
+
+class CompiledGestureTemplate:
+    """
+    Template prepared for matching: z-normalized, with its LB_Keogh envelope precomputed.
+    """
+
+    index: int
+    name: str
+    threshold: float
+    band: int
+    values: np.ndarray
+    upper: np.ndarray
+    lower: np.ndarray
+
+    def __init__(self, index: int, template: GestureTemplate) -> None:
+        self.index = index
+        self.name = template.name
+        self.threshold = template.threshold
+        self.values = _z_normalize(np.asarray(template.values, dtype=np.float64))
+        self.band = (
+            template.band
+            if template.band > 0
+            else max(1, int(round(0.1 * len(self.values))))
+        )
+
+        n = len(self.values)
+        self.upper = np.empty(n)
+        self.lower = np.empty(n)
+        for i in range(n):
+            window = self.values[max(0, i - self.band) : i + self.band + 1]
+            self.upper[i] = window.max()
+            self.lower[i] = window.min()
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+class GestureLibrary:
+    """
+    Gesture templates shared by the gesture filters of all rings, persisted as JSON.
+    """
+
+    _path: Path
+    _templates: list[GestureTemplate]
+    _compiled: list[CompiledGestureTemplate]
+
+    def __init__(self, path: Path) -> None:
+        self._path = path
+        self._templates = []
+        if path.is_file():
+            with open(path, "r") as f:
+                self._templates = [GestureTemplate(**t) for t in json.load(f)]
+        self._compile()
+
+    @property
+    def templates(self) -> list[GestureTemplate]:
+        return list(self._templates)
+
+    @property
+    def compiled(self) -> list[CompiledGestureTemplate]:
+        return self._compiled
+
+    @property
+    def max_length(self) -> int:
+        return max((len(t) for t in self._compiled), default=0)
+
+    def add(self, template: GestureTemplate) -> None:
+        """
+        Add a template, replacing any template with the same name.
+        """
+        self._templates = [t for t in self._templates if t.name != template.name]
+        self._templates.append(template)
+        self._compile()
+        self._save()
+
+    def remove(self, name: str) -> None:
+        self._templates = [t for t in self._templates if t.name != name]
+        self._compile()
+        self._save()
+
+    def _compile(self) -> None:
+        self._compiled = [
+            CompiledGestureTemplate(i, t)
+            for i, t in enumerate(self._templates)
+            if len(t.values) >= 2
+        ]
+
+    def _save(self) -> None:
+        with open(self._path, "w") as f:
+            json.dump([asdict(t) for t in self._templates], f)
+
+
+@dataclass
+class GestureMatch:
+    name: str
+    index: int
+    """Position of the template in the library."""
+    distance: float
+
+
+@dataclass
+class FilterGestureOutput:
+    matches: list[GestureMatch] = field(default_factory=list)
+    timestamp: datetime = field(default_factory=datetime.now)
+
+
+class FilterGesture:
+    """
+    Matches the recent acceleration magnitude of a ring against the gesture templates using streaming DTW.
+
+    Every tick the most recent samples are compared with each template. Templates are first ranked by their LB_Keogh
+    lower bound, which prunes every template whose bound already exceeds its threshold or the best distance found so
+    far. The remaining ones get a banded DTW that is abandoned as soon as a full row exceeds that same bound. So the
+    cost of a tick is dominated by a few vectorized lower bounds instead of a full DTW per template.
+    """
+
+    _clock: Clock
+    _stopped: bool
+    _interrupt_event: asyncio.Event
+    """Ends the current wait early, to tick now or to stop."""
+    _update_period: timedelta
+    _last_tick_duration: float
+    _library: GestureLibrary
+    _refractory: timedelta
+    _min_std: float
+
+    _buffer: np.ndarray
+    _capacity: int
+    _write_index: int
+    _filled: int
+
+    _recording: list[float] | None
+    _last_match: dict[str, datetime]
+
+    def __init__(
+        self,
+        update_period: timedelta,
+        library: GestureLibrary,
+        capacity: int = 500,
+        refractory: timedelta = timedelta(seconds=1),
+        min_std: float = 30.0,
+        clock: Clock = system_clock,
+    ) -> None:
+        """
+        capacity: longest template in samples that can be matched.
+        refractory: a template does not match again within this time after a match.
+        min_std: windows with less variation in magnitude than this are considered to be at rest and never match.
+        """
+        self._clock = clock
+        self._stopped = False
+        self._interrupt_event = asyncio.Event()
+        self._update_period = update_period
+        self._last_tick_duration = 0.0
+        self._library = library
+        self._refractory = refractory
+        self._min_std = min_std
+
+        self._capacity = capacity
+        # Every sample is written twice, so the last n samples are always one contiguous slice.
+        self._buffer = np.zeros(2 * capacity)
+        self._write_index = 0
+        self._filled = 0
+
+        self._recording = None
+        self._last_match = {}
+
+    def set_update_period(self, update_period: timedelta) -> None:
+        self._update_period = update_period
+
+    def set_min_std(self, min_std: float) -> None:
+        self._min_std = min_std
+
+    def on_accelerometer_data(self, data: AccelerometerData) -> None:
+        magnitude = math.sqrt(data.x**2 + data.y**2 + data.z**2)
+        self._buffer[self._write_index] = magnitude
+        self._buffer[self._write_index + self._capacity] = magnitude
+        self._write_index = (self._write_index + 1) % self._capacity
+        self._filled = min(self._filled + 1, self._capacity)
+        if self._recording is not None:
+            self._recording.append(magnitude)
+
+    def start_recording(self) -> None:
+        self._recording = []
+
+    def stop_recording(self) -> list[float]:
+        recording = [] if self._recording is None else self._recording
+        self._recording = None
+        return recording[: self._capacity]
+
+    @property
+    def is_recording(self) -> bool:
+        return self._recording is not None
+
+    async def run(self) -> AsyncGenerator[FilterGestureOutput, None]:
+        while not self._stopped:
+            interrupt_wait_task = asyncio.create_task(self._interrupt_event.wait())
+            timer_task = asyncio.create_task(
+                self._clock.sleep(self._update_period.total_seconds())
+            )
+
+            done, pending = await asyncio.wait(
+                [interrupt_wait_task, timer_task], return_when=asyncio.FIRST_COMPLETED
+            )
+
+            for task in pending:
+                task.cancel()
+
+            self._interrupt_event.clear()
+            if self._stopped:
+                break
+
+            start = time.perf_counter()
+            output = self._do_loop_iteration()
+            self._last_tick_duration = time.perf_counter() - start
+            yield output
+
+    def _do_loop_iteration(self) -> FilterGestureOutput:
+        now = self._clock.now()
+        output = FilterGestureOutput(timestamp=now)
+        if self._recording is not None:
+            return output
+
+        candidates = []
+        for template in self._library.compiled:
+            n = len(template)
+            if n > self._filled:
+                continue
+            last_match = self._last_match.get(template.name)
+            if last_match is not None and now - last_match < self._refractory:
+                continue
+            query = self._window(n)
+            if query.std() < self._min_std:
+                continue
+            query = _z_normalize(query)
+            bound = _lb_keogh(query, template)
+            if bound < template.threshold:
+                candidates.append((bound, template, query))
+
+        best: GestureMatch | None = None
+        for bound, template, query in sorted(candidates, key=lambda c: c[0]):
+            limit = (
+                template.threshold
+                if best is None
+                else min(template.threshold, best.distance)
+            )
+            if bound >= limit:
+                continue
+            distance = _dtw(query, template.values, template.band, limit)
+            if distance < limit:
+                best = GestureMatch(
+                    name=template.name, index=template.index, distance=distance
+                )
+
+        if best is not None:
+            self._last_match[best.name] = now
+            output.matches.append(best)
+        return output
+
+    def _window(self, n: int) -> np.ndarray:
+        end = self._write_index + self._capacity
+        return self._buffer[end - n : end]
+
+    @property
+    def last_tick_duration(self) -> float:
+        """
+        Seconds spent computing the most recent output.
+        """
+        return self._last_tick_duration
+
+    def wake(self) -> None:
+        """
+        Tick now instead of at the end of the current update period.
+        """
+        self._interrupt_event.set()
+
+    def close(self) -> None:
+        """
+        Ends run, also when it has not started yet.
+        """
+        self._stopped = True
+        self._interrupt_event.set()
+
+
+def _z_normalize(values: np.ndarray) -> np.ndarray:
+    std = values.std()
+    return (values - values.mean()) / (std if std > 0.0 else 1.0)
+
+
+def _lb_keogh(query: np.ndarray, template: CompiledGestureTemplate) -> float:
+    above = np.maximum(query - template.upper, 0.0)
+    below = np.maximum(template.lower - query, 0.0)
+    return math.sqrt(float(np.dot(above, above) + np.dot(below, below)))
+
+
+def _dtw(a: np.ndarray, b: np.ndarray, band: int, limit: float) -> float:
+    """
+    DTW distance of equal length sequences within a Sakoe-Chiba band.
+
+    Returns infinity as soon as every cell of a row exceeds limit, the distance can then only grow.
+    """
+    n = len(a)
+    a = a.tolist()
+    b = b.tolist()
+    limit_squared = limit * limit
+    previous = [math.inf] * (n + 1)
+    previous[0] = 0.0
+    for i in range(1, n + 1):
+        current = [math.inf] * (n + 1)
+        a_i = a[i - 1]
+        row_min = math.inf
+        for j in range(max(1, i - band), min(n, i + band) + 1):
+            cell = (a_i - b[j - 1]) ** 2 + min(
+                previous[j], previous[j - 1], current[j - 1]
+            )
+            current[j] = cell
+            if cell < row_min:
+                row_min = cell
+        if row_min >= limit_squared:
+            return math.inf
+        previous = current
+    return math.sqrt(previous[n])
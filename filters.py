@@ -1,16 +1,116 @@
+from __future__ import annotations
+
 from filter_abs import FilterAbs, FilterAbsOutput
+from filter_energy import FilterEnergy, FilterEnergyOutput
 from accelerometer_data import AccelerometerData
 import asyncio
+from dataclasses import dataclass, field, replace
 from datetime import timedelta
 from typing import AsyncGenerator, Callable
 import traceback
 from filter_leaky_integrator import FilterLeakyIntegrator, FilterLeakyIntegratorOutput
+from timing_reconstructor import TimingReconstructor, TimingStats
+from filter_gesture import FilterGesture, FilterGestureOutput, GestureLibrary
+from activity_detector import ActivityDetector
+from clock import Clock, system_clock
+from metrics import (
+    metrics,
+    Timer,
+    ABS_FILTER_TICKS,
+    LEAKY_INTEGRATOR_FILTER_TICKS,
+    GESTURE_FILTER_TICKS,
+    ENERGY_FILTER_TICKS,
+    GESTURE_MATCHES,
+    FILTER_TICK_SECONDS,
+    ROUTE_SECONDS,
+    FILTER_TICKS_SKIPPED,
+    RING_IDLE,
+    RING_WAKES,
+)
+
+
+@dataclass
+class FilterParams:
+    """
+    Tunable parameters of the filters of one ring.
+    """
+
+    abs_update_period: timedelta = timedelta(milliseconds=50)
+    abs_window_size: timedelta = timedelta(milliseconds=500)
+    leaky_integrator_update_period: timedelta = timedelta(milliseconds=50)
+    leaky_integrator_damping: float = 0.7
+    leaky_integrator_threshold: float = 500.0
+    gesture_update_period: timedelta = timedelta(milliseconds=100)
+    gesture_min_std: float = 30.0
+    idle_after: timedelta = timedelta(seconds=2)
+    wake_threshold: float = 60.0
+    energy_update_period: timedelta = timedelta(milliseconds=50)
+    energy_windows: list[timedelta] = field(
+        default_factory=lambda: [
+            timedelta(milliseconds=100),
+            timedelta(milliseconds=500),
+            timedelta(seconds=5),
+        ]
+    )
+
+    def to_dict(self) -> dict:
+        """
+        JSON compatible, durations in milliseconds.
+        """
+        return {
+            "abs_update_period_ms": _to_ms(self.abs_update_period),
+            "abs_window_size_ms": _to_ms(self.abs_window_size),
+            "leaky_integrator_update_period_ms": _to_ms(
+                self.leaky_integrator_update_period
+            ),
+            "leaky_integrator_damping": self.leaky_integrator_damping,
+            "leaky_integrator_threshold": self.leaky_integrator_threshold,
+            "gesture_update_period_ms": _to_ms(self.gesture_update_period),
+            "gesture_min_std": self.gesture_min_std,
+            "idle_after_ms": _to_ms(self.idle_after),
+            "wake_threshold": self.wake_threshold,
+            "energy_update_period_ms": _to_ms(self.energy_update_period),
+            "energy_windows_ms": [_to_ms(window) for window in self.energy_windows],
+        }
+
+    @classmethod
+    def from_dict(cls, d: dict) -> FilterParams:
+        """
+        Missing keys keep their defaults.
+        """
+        params = cls()
+        for name, value in d.items():
+            if name.endswith("_ms") and hasattr(params, name[:-3]):
+                setattr(
+                    params,
+                    name[:-3],
+                    (
+                        [timedelta(milliseconds=v) for v in value]
+                        if isinstance(value, list)
+                        else timedelta(milliseconds=value)
+                    ),
+                )
+            elif hasattr(params, name):
+                setattr(params, name, value)
+        return params
 
 
 class Filters:
+    """
+    Runs the filters of every ring and hands their outputs to the callbacks.
+
+    Rings at rest, as decided by their ActivityDetector, are switched to ticking every _IDLE_UPDATE_PERIOD. The next
+    significant sample switches them back and makes every filter of the ring tick right away.
+    """
+
+    _clock: Clock
     _stop_event: asyncio.Event | None
     _filters_changed_event: asyncio.Event | None
 
+    _params: dict[str, FilterParams]
+    _timing_reconstructors: dict[str, TimingReconstructor]
+    _activity_detectors: dict[str, ActivityDetector]
+
     _abs_filters: dict[str, FilterAbs]
     _abs_filter_gens: dict[str, AsyncGenerator[FilterAbsOutput, None]]
     _abs_filter_tasks: dict[str, asyncio.Task]
@@ -21,8 +121,22 @@ class Filters:
     ]
     _leaky_integrator_filter_tasks: dict[str, asyncio.Task]
 
+    _gesture_library: GestureLibrary | None
+    _gesture_filters: dict[str, FilterGesture]
+    _gesture_filter_gens: dict[str, AsyncGenerator[FilterGestureOutput, None]]
+    _gesture_filter_tasks: dict[str, asyncio.Task]
+
+    _energy_filters: dict[str, FilterEnergy]
+    _energy_filter_gens: dict[str, AsyncGenerator[FilterEnergyOutput, None]]
+    _energy_filter_tasks: dict[str, asyncio.Task]
+
     _on_abs_filter_output: Callable[[FilterAbsOutput], None]
     _on_leaky_integrator_filter_output: Callable[[FilterLeakyIntegratorOutput], None]
+    _on_gesture_filter_output: Callable[[str, FilterGestureOutput], None] | None
+    _on_energy_filter_output: Callable[[str, FilterEnergyOutput], None] | None
+
+    _closing_gens: dict[asyncio.Task, AsyncGenerator]
+    """Generators of removed rings, until their last pending step finished."""
 
     def __init__(
         self,
@@ -30,9 +144,26 @@ class Filters:
         on_leaky_integrator_filter_output: Callable[
             [str, FilterLeakyIntegratorOutput], None
         ],
+        gesture_library: GestureLibrary | None = None,
+        on_gesture_filter_output: (
+            Callable[[str, FilterGestureOutput], None] | None
+        ) = None,
+        on_energy_filter_output: (
+            Callable[[str, FilterEnergyOutput], None] | None
+        ) = None,
+        clock: Clock = system_clock,
     ) -> None:
+        """
+        Gesture recognition only runs when a gesture library is given. on_gesture_filter_output is only called for
+        outputs with matches. The energy filter only runs when on_energy_filter_output is given.
+        clock: time of all filters, a VirtualClock replays recorded samples faster than real time.
+        """
+        self._clock = clock
         self._stop_event = None
         self._filters_changed_event = None
+        self._params = {}
+        self._timing_reconstructors = {}
+        self._activity_detectors = {}
         self._abs_filters = {}
         self._abs_filter_gens = {}
         self._on_abs_filter_output = on_abs_filter_output
@@ -43,67 +174,185 @@ class Filters:
         self._on_leaky_integrator_filter_output = on_leaky_integrator_filter_output
         self._leaky_integrator_filter_tasks = {}
 
+        self._gesture_library = gesture_library
+        self._gesture_filters = {}
+        self._gesture_filter_gens = {}
+        self._on_gesture_filter_output = on_gesture_filter_output
+        self._gesture_filter_tasks = {}
+
+        self._energy_filters = {}
+        self._energy_filter_gens = {}
+        self._on_energy_filter_output = on_energy_filter_output
+        self._energy_filter_tasks = {}
+
+        self._closing_gens = {}
+
     async def run(self) -> None:
-        try:
-            self._stop_event = asyncio.Event()
-            self._filters_changed_event = asyncio.Event()
+        self._stop_event = asyncio.Event()
+        self._filters_changed_event = asyncio.Event()
 
-            stop_wait_task = asyncio.create_task(self._stop_event.wait())
-            filters_changed_wait_task = asyncio.create_task(
-                self._filters_changed_event.wait()
-            )
+        stop_wait_task = asyncio.create_task(self._stop_event.wait())
+        filters_changed_wait_task = asyncio.create_task(
+            self._filters_changed_event.wait()
+        )
+        try:
             while not self._stop_event.is_set():
                 done, pending = await asyncio.wait(
                     [stop_wait_task, filters_changed_wait_task]
                     + [v for v in self._abs_filter_tasks.values()]
-                    + [v for v in self._leaky_integrator_filter_tasks.values()],
+                    + [v for v in self._leaky_integrator_filter_tasks.values()]
+                    + [v for v in self._gesture_filter_tasks.values()]
+                    + [v for v in self._energy_filter_tasks.values()]
+                    + [v for v in self._closing_gens.keys()],
                     return_when=asyncio.FIRST_COMPLETED,
                 )
                 if stop_wait_task in done:
                     break
                 if filters_changed_wait_task in done:
+                    # Only wakes the wait up, so it includes the tasks of added rings.
                     self._filters_changed_event.clear()
-                for address, task in self._abs_filter_tasks.items():
-                    if task in done:
-                        self._on_abs_filter_output(
-                            address=address, output=task.result()
+                    filters_changed_wait_task = asyncio.create_task(
+                        self._filters_changed_event.wait()
+                    )
+                for task in [t for t in self._closing_gens.keys() if t in done]:
+                    self._step_closing_gen(task)
+                # Callbacks may add or remove rings, so iterate over copies.
+                for address, task in list(self._abs_filter_tasks.items()):
+                    if task in done and self._abs_filter_tasks.get(address) is task:
+                        metrics.inc(ABS_FILTER_TICKS, address)
+                        metrics.observe(
+                            FILTER_TICK_SECONDS,
+                            self._abs_filters[address].last_tick_duration,
+                            address,
                         )
                         self._abs_filter_tasks[address] = asyncio.create_task(
                             self._abs_filter_gens[address].__anext__()
                         )
-                for address, task in self._leaky_integrator_filter_tasks.items():
-                    if task in done:
-                        self._on_leaky_integrator_filter_output(
-                            address=address, output=task.result()
+                        output = task.result()
+                        self._on_tick(address, self._params[address].abs_update_period)
+                        self._activity_detectors[address].on_abs(output.value)
+                        with Timer(metrics, ROUTE_SECONDS, address):
+                            self._on_abs_filter_output(address=address, output=output)
+                        if address in self._activity_detectors and (
+                            self._activity_detectors[address].should_idle(
+                                output.timestamp
+                            )
+                        ):
+                            self._set_idle(address)
+                for address, task in list(self._leaky_integrator_filter_tasks.items()):
+                    if (
+                        task in done
+                        and self._leaky_integrator_filter_tasks.get(address) is task
+                    ):
+                        metrics.inc(LEAKY_INTEGRATOR_FILTER_TICKS, address)
+                        metrics.observe(
+                            FILTER_TICK_SECONDS,
+                            self._leaky_integrator_filters[address].last_tick_duration,
+                            address,
                         )
                         self._leaky_integrator_filter_tasks[address] = (
                             asyncio.create_task(
                                 self._leaky_integrator_filter_gens[address].__anext__()
                             )
                         )
+                        output = task.result()
+                        self._on_tick(
+                            address,
+                            self._params[address].leaky_integrator_update_period,
+                        )
+                        self._activity_detectors[address].on_leaky_integrator(
+                            output.value
+                        )
+                        with Timer(metrics, ROUTE_SECONDS, address):
+                            self._on_leaky_integrator_filter_output(
+                                address=address, output=output
+                            )
+                for address, task in list(self._gesture_filter_tasks.items()):
+                    if task in done and self._gesture_filter_tasks.get(address) is task:
+                        metrics.inc(GESTURE_FILTER_TICKS, address)
+                        metrics.observe(
+                            FILTER_TICK_SECONDS,
+                            self._gesture_filters[address].last_tick_duration,
+                            address,
+                        )
+                        self._gesture_filter_tasks[address] = asyncio.create_task(
+                            self._gesture_filter_gens[address].__anext__()
+                        )
+                        output = task.result()
+                        self._on_tick(
+                            address, self._params[address].gesture_update_period
+                        )
+                        if len(output.matches) > 0:
+                            metrics.inc(GESTURE_MATCHES, address, len(output.matches))
+                            with Timer(metrics, ROUTE_SECONDS, address):
+                                self._on_gesture_filter_output(
+                                    address=address, output=output
+                                )
+                for address, task in list(self._energy_filter_tasks.items()):
+                    if task in done and self._energy_filter_tasks.get(address) is task:
+                        metrics.inc(ENERGY_FILTER_TICKS, address)
+                        metrics.observe(
+                            FILTER_TICK_SECONDS,
+                            self._energy_filters[address].last_tick_duration,
+                            address,
+                        )
+                        self._energy_filter_tasks[address] = asyncio.create_task(
+                            self._energy_filter_gens[address].__anext__()
+                        )
+                        output = task.result()
+                        self._on_tick(
+                            address, self._params[address].energy_update_period
+                        )
+                        with Timer(metrics, ROUTE_SECONDS, address):
+                            self._on_energy_filter_output(
+                                address=address, output=output
+                            )
         except Exception:
             print("Filters crashed!!!")
             traceback.print_exc()
+        finally:
+            stop_wait_task.cancel()
+            filters_changed_wait_task.cancel()
+            for address in list(self._params.keys()):
+                self.on_ring_remove(address)
+            while len(self._closing_gens) > 0:
+                done, pending = await asyncio.wait(self._closing_gens.keys())
+                for task in done:
+                    self._step_closing_gen(task)
 
     def close(self) -> None:
         self._stop_event.set()
 
-    def on_ring_add(self, address: str) -> None:
-        assert address not in self._abs_filters.keys()
+    def on_ring_add(self, address: str, params: FilterParams | None = None) -> None:
+        """
+        Starts the filters of a ring. The filters of other rings are not affected.
+        """
+        assert address not in self._params.keys()
+        params = FilterParams() if params is None else params
+        self._params[address] = params
+
+        self._timing_reconstructors[address] = TimingReconstructor(
+            output_period=timedelta(milliseconds=20)
+        )
+        self._activity_detectors[address] = ActivityDetector(
+            idle_after=params.idle_after, wake_threshold=params.wake_threshold
+        )
+
         self._abs_filters[address] = FilterAbs(
-            update_period=timedelta(milliseconds=50),
-            window_size=timedelta(milliseconds=500),
+            update_period=params.abs_update_period,
+            window_size=params.abs_window_size,
+            clock=self._clock,
         )
         self._abs_filter_gens[address] = self._abs_filters[address].run()
         self._abs_filter_tasks[address] = asyncio.create_task(
             self._abs_filter_gens[address].__anext__()
         )
-        if self._filters_changed_event is not None:
-            self._filters_changed_event.set()
 
-        assert address not in self._leaky_integrator_filters.keys()
         self._leaky_integrator_filters[address] = FilterLeakyIntegrator(
-            update_period=timedelta(milliseconds=50), damping=0.7
+            update_period=params.leaky_integrator_update_period,
+            damping=params.leaky_integrator_damping,
+            threshold=params.leaky_integrator_threshold,
+            clock=self._clock,
         )
         self._leaky_integrator_filter_gens[address] = self._leaky_integrator_filters[
             address
@@ -111,19 +360,194 @@ class Filters:
         self._leaky_integrator_filter_tasks[address] = asyncio.create_task(
             self._leaky_integrator_filter_gens[address].__anext__()
         )
+
+        if self._gesture_library is not None:
+            self._gesture_filters[address] = FilterGesture(
+                update_period=params.gesture_update_period,
+                library=self._gesture_library,
+                min_std=params.gesture_min_std,
+                clock=self._clock,
+            )
+            self._gesture_filter_gens[address] = self._gesture_filters[address].run()
+            self._gesture_filter_tasks[address] = asyncio.create_task(
+                self._gesture_filter_gens[address].__anext__()
+            )
+
+        if self._on_energy_filter_output is not None:
+            self._energy_filters[address] = FilterEnergy(
+                update_period=params.energy_update_period,
+                windows=params.energy_windows,
+                clock=self._clock,
+            )
+            self._energy_filter_gens[address] = self._energy_filters[address].run()
+            self._energy_filter_tasks[address] = asyncio.create_task(
+                self._energy_filter_gens[address].__anext__()
+            )
+
         if self._filters_changed_event is not None:
             self._filters_changed_event.set()
 
     def on_ring_remove(self, address: str) -> None:
-        self._abs_filters[address].close()
-        del self._abs_filters[address]
-        del self._abs_filter_gens[address]
-        self._abs_filter_tasks[address].cancel()
-        del self._abs_filter_tasks[address]
-        self._filters_changed_event.set()
+        """
+        Stops the filters of a ring. Outputs computed after this call are dropped. The filters of other rings are
+        not affected.
+        """
+        del self._params[address]
+        del self._timing_reconstructors[address]
+        if self._activity_detectors.pop(address).is_idle:
+            metrics.set(RING_IDLE, 0.0, address)
 
-        raise NotImplementedError()
+        self._abs_filters.pop(address).close()
+        self._closing_gens[self._abs_filter_tasks.pop(address)] = (
+            self._abs_filter_gens.pop(address)
+        )
+
+        self._leaky_integrator_filters.pop(address).close()
+        self._closing_gens[self._leaky_integrator_filter_tasks.pop(address)] = (
+            self._leaky_integrator_filter_gens.pop(address)
+        )
+
+        if address in self._gesture_filters:
+            self._gesture_filters.pop(address).close()
+            self._closing_gens[self._gesture_filter_tasks.pop(address)] = (
+                self._gesture_filter_gens.pop(address)
+            )
+
+        if address in self._energy_filters:
+            self._energy_filters.pop(address).close()
+            self._closing_gens[self._energy_filter_tasks.pop(address)] = (
+                self._energy_filter_gens.pop(address)
+            )
+
+        if self._filters_changed_event is not None:
+            self._filters_changed_event.set()
+
+    def _step_closing_gen(self, task: asyncio.Task) -> None:
+        """
+        Called when the pending step of a removed ring's generator finished. Its filter is closed, so either it
+        finished or the next step will.
+        """
+        gen = self._closing_gens.pop(task)
+        if task.cancelled() or task.exception() is not None:
+            return
+        self._closing_gens[asyncio.create_task(gen.__anext__())] = gen
+
+    def params(self, address: str) -> FilterParams:
+        return self._params[address]
+
+    def set_params(self, address: str, params: FilterParams) -> None:
+        """
+        Retunes the filters of a ring in place. Takes effect from their next tick on.
+        """
+        previous = self._params[address]
+        self._params[address] = params
+        self._abs_filters[address].set_window_size(params.abs_window_size)
+        self._leaky_integrator_filters[address].set_damping(
+            params.leaky_integrator_damping
+        )
+        self._leaky_integrator_filters[address].set_threshold(
+            params.leaky_integrator_threshold
+        )
+        if address in self._gesture_filters:
+            self._gesture_filters[address].set_min_std(params.gesture_min_std)
+        if (
+            address in self._energy_filters
+            and params.energy_windows != previous.energy_windows
+        ):
+            self._energy_filters[address].set_windows(params.energy_windows)
+        activity_detector = self._activity_detectors[address]
+        activity_detector.set_idle_after(params.idle_after)
+        activity_detector.set_wake_threshold(params.wake_threshold)
+        if not activity_detector.is_idle:
+            self._set_update_periods(address, params)
+
+    def is_idle(self, address: str) -> bool:
+        return self._activity_detectors[address].is_idle
+
+    def _set_update_periods(self, address: str, params: FilterParams) -> None:
+        self._abs_filters[address].set_update_period(params.abs_update_period)
+        self._leaky_integrator_filters[address].set_update_period(
+            params.leaky_integrator_update_period
+        )
+        if address in self._gesture_filters:
+            self._gesture_filters[address].set_update_period(
+                params.gesture_update_period
+            )
+        if address in self._energy_filters:
+            self._energy_filters[address].set_update_period(params.energy_update_period)
+
+    def _set_idle(self, address: str) -> None:
+        """
+        Slows all filters of the ring down, from after their current tick on.
+        """
+        self._set_update_periods(
+            address,
+            replace(
+                self._params[address],
+                abs_update_period=_IDLE_UPDATE_PERIOD,
+                leaky_integrator_update_period=_IDLE_UPDATE_PERIOD,
+                gesture_update_period=_IDLE_UPDATE_PERIOD,
+                energy_update_period=_IDLE_UPDATE_PERIOD,
+            ),
+        )
+        metrics.set(RING_IDLE, 1.0, address)
+
+    def _wake(self, address: str) -> None:
+        """
+        Restores the update periods of the ring and makes its filters tick now, so they see the waking sample.
+        """
+        self._set_update_periods(address, self._params[address])
+        self._abs_filters[address].wake()
+        self._leaky_integrator_filters[address].wake()
+        if address in self._gesture_filters:
+            self._gesture_filters[address].wake()
+        if address in self._energy_filters:
+            self._energy_filters[address].wake()
+        metrics.set(RING_IDLE, 0.0, address)
+        metrics.inc(RING_WAKES, address)
+
+    def _on_tick(self, address: str, update_period: timedelta) -> None:
+        """
+        Counts the ticks an idle ring skipped: an idle tick stands in for this many ticks at the normal update period.
+        """
+        if self._activity_detectors[address].is_idle:
+            metrics.inc(
+                FILTER_TICKS_SKIPPED,
+                address,
+                max(0, round(_IDLE_UPDATE_PERIOD / update_period) - 1),
+            )
 
     def on_raw_sensor_data(self, address: str, data: AccelerometerData) -> None:
-        self._abs_filters[address].on_accelerometer_data(data)
-        self._leaky_integrator_filters[address].on_accelerometer_data(data)
+        """
+        Samples of rings that are not added, e.g. still in flight after removal, are ignored.
+        """
+        if address not in self._params:
+            return
+        for sample in self._timing_reconstructors[address].on_sample(data):
+            if self._activity_detectors[address].on_sample(sample):
+                self._wake(address)
+            self._abs_filters[address].on_accelerometer_data(sample)
+            self._leaky_integrator_filters[address].on_accelerometer_data(sample)
+            if address in self._gesture_filters:
+                self._gesture_filters[address].on_accelerometer_data(sample)
+            if address in self._energy_filters:
+                self._energy_filters[address].on_accelerometer_data(sample)
+
+    def start_gesture_recording(self, address: str) -> None:
+        self._gesture_filters[address].start_recording()
+
+    def stop_gesture_recording(self, address: str) -> list[float]:
+        """
+        Returns the acceleration magnitude recorded since start_gesture_recording.
+        """
+        return self._gesture_filters[address].stop_recording()
+
+    def timing_stats(self, address: str) -> TimingStats:
+        return self._timing_reconstructors[address].stats
+
+
+def _to_ms(duration: timedelta) -> float:
+    return duration.total_seconds() * 1000.0
+
+
+_IDLE_UPDATE_PERIOD = timedelta(seconds=1)
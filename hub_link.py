@@ -0,0 +1,383 @@
+"""
+UDP link between a ring hub (ring_hub.py), which runs the ring managers near the dancers, and the main process, which
+runs the filters.
+
+Every datagram starts with a header of magic, kind, session, sequence number and send time. The session is random per
+hub run, the sequence number counts all datagrams of a session, so the receiver can tell lost and reordered datagrams
+apart from a restarted hub. Sample datagrams carry up to _MAX_SAMPLES records of ring index, age at sending in
+microseconds and x, y, z. State datagrams carry the addresses, names and statuses of the rings of the hub as JSON,
+which also maps ring indices to addresses. They are sent after status changes and every _STATE_PERIOD.
+"""
+
+from accelerometer_data import AccelerometerData
+from clock import Clock, system_clock
+from ring_manager import RingStatus
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable
+from metrics import (
+    metrics,
+    HUB_DATAGRAMS_MISSED,
+    HUB_DATAGRAMS_REORDERED,
+    HUB_LATENCY_SECONDS,
+    HUB_SAMPLE_AGE_SECONDS,
+)
+import asyncio
+import json
+import random
+import struct
+
+HUB_PORT = 9870
+
+
+@dataclass
+class HubLinkStats:
+    datagrams: int
+    samples: int
+    lost: int
+    """Datagrams missing from the sequence, not counting those that arrived late."""
+    reordered: int
+    unknown_samples: int
+    """Samples dropped because the state of their hub was not received yet."""
+    loss_rate: float
+    latency_mean: timedelta
+    """Send to receive over the recent window. Needs synchronized clocks unless over loopback."""
+    latency_max: timedelta
+    sample_age_mean: timedelta
+    """Arrival at the hub to receive, including batching, over the recent window."""
+    sample_age_max: timedelta
+
+
+class HubSender:
+    """
+    Hub side: batches the samples of all rings into datagrams to one receiver.
+
+    A batch is sent every batch_period, or earlier when it fills a datagram, so the added latency is at most
+    batch_period.
+    """
+
+    _target: tuple[str, int]
+    _clock: Clock
+    _batch_period: timedelta
+
+    _addresses: list[str]
+    _names: list[str]
+    _indices: dict[str, int]
+    _statuses: list[RingStatus | None]
+    _state_changed: bool
+
+    _session: int
+    _sequence: int
+    _batch: list[tuple[int, AccelerometerData]]
+    _transport: asyncio.DatagramTransport | None
+    _stop_event: asyncio.Event | None
+
+    def __init__(
+        self,
+        target: tuple[str, int],
+        rings: list[dict],
+        batch_period: timedelta = timedelta(milliseconds=20),
+        clock: Clock = system_clock,
+    ) -> None:
+        """
+        rings: {"address": ..., "name": ...} per ring of the hub.
+        """
+        self._target = target
+        self._clock = clock
+        self._batch_period = batch_period
+
+        self._addresses = [ring["address"] for ring in rings]
+        self._names = [ring["name"] for ring in rings]
+        self._indices = {address: i for i, address in enumerate(self._addresses)}
+        self._statuses = [None] * len(rings)
+        self._state_changed = False
+
+        self._session = random.getrandbits(32)
+        self._sequence = 0
+        self._batch = []
+        self._transport = None
+        self._stop_event = None
+
+    async def run(self) -> None:
+        self._stop_event = asyncio.Event()
+        self._transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+            asyncio.DatagramProtocol, remote_addr=self._target
+        )
+        next_state = self._clock.now()
+        try:
+            while not self._stop_event.is_set():
+                self._flush()
+                if self._state_changed or self._clock.now() >= next_state:
+                    next_state = self._clock.now() + _STATE_PERIOD
+                    self._send_state()
+                await self._clock.sleep(self._batch_period.total_seconds())
+            self._flush()
+            self._send_state()
+        finally:
+            self._transport.close()
+            self._transport = None
+
+    def close(self) -> None:
+        self._stop_event.set()
+
+    def on_status(self, address: str, status: RingStatus) -> None:
+        self._statuses[self._indices[address]] = status
+        # Sent with the next batch, so the status changes of many rings connecting at once take one datagram.
+        self._state_changed = True
+
+    def on_sample(self, address: str, data: AccelerometerData) -> None:
+        self._batch.append((self._indices[address], data))
+        if len(self._batch) >= _MAX_SAMPLES:
+            self._flush()
+
+    def _header(self, kind: int) -> bytes:
+        header = _HEADER.pack(
+            _MAGIC, kind, self._session, self._sequence, self._clock.now().timestamp()
+        )
+        self._sequence = (self._sequence + 1) & 0xFFFFFFFF
+        return header
+
+    def _flush(self) -> None:
+        if len(self._batch) == 0 or self._transport is None:
+            return
+        now = self._clock.now()
+        datagram = bytearray(self._header(_KIND_SAMPLES))
+        for index, data in self._batch:
+            age = max(0, int((now - data.timestamp) / _MICROSECOND))
+            datagram += _SAMPLE.pack(
+                index, min(age, 0xFFFFFFFF), int(data.x), int(data.y), int(data.z)
+            )
+        self._batch.clear()
+        self._transport.sendto(datagram)
+
+    def _send_state(self) -> None:
+        self._state_changed = False
+        state = [
+            {
+                "address": address,
+                "name": name,
+                "status": None if status is None else status.name,
+            }
+            for address, name, status in zip(
+                self._addresses, self._names, self._statuses
+            )
+        ]
+        self._transport.sendto(
+            self._header(_KIND_STATE) + json.dumps(state).encode("utf-8")
+        )
+
+
+class _Session:
+    addresses: list[str] | None
+    statuses: list[RingStatus | None]
+    expected_sequence: int | None
+
+    def __init__(self) -> None:
+        self.addresses = None
+        self.statuses = []
+        self.expected_sequence = None
+
+
+class HubReceiver:
+    """
+    Main process side: receives the datagrams of any number of hubs and hands their samples and ring statuses to the
+    callbacks, as if the rings were local.
+
+    Sample timestamps are moved onto the clock of this process, keeping their age at sending. The BLE arrival jitter
+    the timing reconstruction relies on is kept, and the clocks of the hubs do not need to be synchronized.
+    """
+
+    _on_sample: Callable[[str, AccelerometerData], None]
+    _on_status: Callable[[str, RingStatus], None]
+    _local_addr: tuple[str, int]
+    _clock: Clock
+
+    _sessions: dict[tuple[str, int], _Session]
+    _statuses: dict[str, RingStatus]
+    """Last status per ring address, over all hubs."""
+    _transport: asyncio.DatagramTransport | None
+    _stop_event: asyncio.Event | None
+
+    _datagrams: int
+    _samples: int
+    _lost: int
+    _reordered: int
+    _unknown_samples: int
+    _latencies: deque[float]
+    _sample_ages: deque[float]
+
+    def __init__(
+        self,
+        on_sample: Callable[[str, AccelerometerData], None],
+        on_status: Callable[[str, RingStatus], None],
+        local_addr: tuple[str, int] = ("0.0.0.0", HUB_PORT),
+        clock: Clock = system_clock,
+        window: int = 256,
+    ) -> None:
+        """
+        window: number of recent datagrams and samples the latency statistics are computed over.
+        """
+        self._on_sample = on_sample
+        self._on_status = on_status
+        self._local_addr = local_addr
+        self._clock = clock
+
+        self._sessions = {}
+        self._statuses = {}
+        self._transport = None
+        self._stop_event = None
+
+        self._datagrams = 0
+        self._samples = 0
+        self._lost = 0
+        self._reordered = 0
+        self._unknown_samples = 0
+        self._latencies = deque(maxlen=window)
+        self._sample_ages = deque(maxlen=window)
+
+    async def open(self) -> None:
+        """
+        Binds the socket. Called by run when not called before.
+        """
+        self._stop_event = asyncio.Event()
+        self._transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+            lambda: _HubProtocol(self._on_datagram), local_addr=self._local_addr
+        )
+
+    @property
+    def local_addr(self) -> tuple[str, int]:
+        """
+        Bound address, with the actual port when bound to port 0.
+        """
+        return self._transport.get_extra_info("sockname")[:2]
+
+    async def run(self) -> None:
+        if self._transport is None:
+            await self.open()
+        try:
+            await self._stop_event.wait()
+        finally:
+            self._transport.close()
+            self._transport = None
+
+    def close(self) -> None:
+        self._stop_event.set()
+
+    def status(self, address: str) -> RingStatus | None:
+        """
+        Last status a hub reported for the ring, None if none did. on_status is only called on changes, so a ring
+        added while its hub runs takes its current status from here.
+        """
+        return self._statuses.get(address)
+
+    @property
+    def stats(self) -> HubLinkStats:
+        received = self._datagrams + self._lost
+        return HubLinkStats(
+            datagrams=self._datagrams,
+            samples=self._samples,
+            lost=self._lost,
+            reordered=self._reordered,
+            unknown_samples=self._unknown_samples,
+            loss_rate=0.0 if received == 0 else self._lost / received,
+            latency_mean=_mean(self._latencies),
+            latency_max=timedelta(seconds=max(self._latencies, default=0.0)),
+            sample_age_mean=_mean(self._sample_ages),
+            sample_age_max=timedelta(seconds=max(self._sample_ages, default=0.0)),
+        )
+
+    def _on_datagram(self, datagram: bytes, addr: tuple) -> None:
+        if len(datagram) < _HEADER.size:
+            return
+        magic, kind, session_id, sequence, send_time = _HEADER.unpack_from(datagram)
+        if magic != _MAGIC:
+            return
+        now = self._clock.now()
+        session = self._sessions.setdefault((addr[0], session_id), _Session())
+
+        self._datagrams += 1
+        self._track_sequence(session, sequence)
+        latency = now.timestamp() - send_time
+        self._latencies.append(latency)
+        metrics.observe(HUB_LATENCY_SECONDS, latency)
+
+        if kind == _KIND_STATE:
+            self._on_state(session, datagram[_HEADER.size :])
+        elif kind == _KIND_SAMPLES:
+            self._on_samples(session, datagram, now, latency)
+
+    def _track_sequence(self, session: _Session, sequence: int) -> None:
+        if session.expected_sequence is None:
+            session.expected_sequence = sequence
+        gap = (sequence - session.expected_sequence) & 0xFFFFFFFF
+        if gap < 0x80000000:
+            self._lost += gap
+            metrics.inc(HUB_DATAGRAMS_MISSED, amount=gap)
+            session.expected_sequence = (sequence + 1) & 0xFFFFFFFF
+        else:
+            # Arrived after a later one, it was counted as lost then.
+            self._reordered += 1
+            self._lost -= 1
+            metrics.inc(HUB_DATAGRAMS_REORDERED)
+
+    def _on_state(self, session: _Session, payload: bytes) -> None:
+        state = json.loads(payload)
+        session.addresses = [ring["address"] for ring in state]
+        if len(session.statuses) != len(state):
+            session.statuses = [None] * len(state)
+        for i, ring in enumerate(state):
+            status = None if ring["status"] is None else RingStatus[ring["status"]]
+            if status is not None and status != session.statuses[i]:
+                session.statuses[i] = status
+                self._statuses[ring["address"]] = status
+                self._on_status(ring["address"], status)
+
+    def _on_samples(
+        self, session: _Session, datagram: bytes, now: datetime, latency: float
+    ) -> None:
+        count = (len(datagram) - _HEADER.size) // _SAMPLE.size
+        if session.addresses is None:
+            self._unknown_samples += count
+            return
+        for index, age, x, y, z in _SAMPLE.iter_unpack(
+            datagram[_HEADER.size : _HEADER.size + count * _SAMPLE.size]
+        ):
+            if index >= len(session.addresses):
+                self._unknown_samples += 1
+                continue
+            age = timedelta(microseconds=age)
+            self._samples += 1
+            self._sample_ages.append(age.total_seconds() + latency)
+            metrics.observe(HUB_SAMPLE_AGE_SECONDS, age.total_seconds() + latency)
+            self._on_sample(
+                session.addresses[index],
+                AccelerometerData(x=x, y=y, z=z, timestamp=now - age),
+            )
+
+
+class _HubProtocol(asyncio.DatagramProtocol):
+    _on_datagram: Callable[[bytes, tuple], None]
+
+    def __init__(self, on_datagram: Callable[[bytes, tuple], None]) -> None:
+        self._on_datagram = on_datagram
+
+    def datagram_received(self, data: bytes, addr: tuple) -> None:
+        self._on_datagram(data, addr)
+
+
+def _mean(values: deque[float]) -> timedelta:
+    return timedelta(seconds=0.0 if len(values) == 0 else sum(values) / len(values))
+
+
+_MAGIC = b"BH"
+_KIND_SAMPLES = 1
+_KIND_STATE = 2
+_HEADER = struct.Struct("<2sBIId")
+"""Magic, kind, session, sequence number, send time in Unix seconds."""
+_SAMPLE = struct.Struct("<HIhhh")
+"""Ring index, age at sending in microseconds, x, y, z."""
+_MAX_SAMPLES = (1200 - _HEADER.size) // _SAMPLE.size
+"""Keeps datagrams below common MTUs, so they are never fragmented."""
+_MICROSECOND = timedelta(microseconds=1)
+_STATE_PERIOD = timedelta(seconds=1)
@@ -0,0 +1,99 @@
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from collections import deque
+
+
+@dataclass
+class LinkStats:
+    packet_rate: float
+    """Notifications per second over the recent window."""
+    mean_gap: timedelta
+    """Mean time between notifications over the recent window."""
+    max_gap: timedelta
+    """Longest time between notifications over the recent window."""
+    stall: timedelta
+    """Time since the last notification."""
+    packets: int
+    resends: int
+    """Times the raw sensor stream was re-enabled because it stalled."""
+    forced_reconnects: int
+    """Times the connection was dropped because the stream stalled for too long."""
+    last_reconnect_gap: timedelta | None
+    """Time from the last disconnect to the first sample after reconnecting."""
+
+
+class LinkMonitor:
+    """
+    Link quality of one ring, derived from notification arrival times.
+    """
+
+    _gaps: deque[float]
+    _gap_sum: float
+    _last_packet: datetime | None
+    _packets: int
+    _resends: int
+    _forced_reconnects: int
+    _last_reconnect_gap: timedelta | None
+
+    def __init__(self, window: int = 64) -> None:
+        """
+        window: number of recent inter-arrival gaps the statistics are computed over.
+        """
+        self._gaps = deque(maxlen=window)
+        self._gap_sum = 0.0
+        self._last_packet = None
+        self._packets = 0
+        self._resends = 0
+        self._forced_reconnects = 0
+        self._last_reconnect_gap = None
+
+    def on_connect(self, now: datetime) -> None:
+        """
+        Start of a new connection. Stall time counts from here until the first packet.
+        """
+        self._gaps.clear()
+        self._gap_sum = 0.0
+        self._last_packet = now
+
+    def on_disconnect(self) -> None:
+        self._last_packet = None
+
+    def on_packet(self, now: datetime) -> None:
+        self._packets += 1
+        if self._last_packet is not None:
+            gap = (now - self._last_packet).total_seconds()
+            if len(self._gaps) == self._gaps.maxlen:
+                self._gap_sum -= self._gaps[0]
+            self._gaps.append(gap)
+            self._gap_sum += gap
+        self._last_packet = now
+
+    def on_resend(self) -> None:
+        self._resends += 1
+
+    def on_forced_reconnect(self) -> None:
+        self._forced_reconnects += 1
+
+    def on_reconnect_gap(self, gap: timedelta) -> None:
+        self._last_reconnect_gap = gap
+
+    def stall(self, now: datetime) -> timedelta:
+        if self._last_packet is None:
+            return timedelta()
+        return now - self._last_packet
+
+    def stats(self, now: datetime) -> LinkStats:
+        return LinkStats(
+            packet_rate=(
+                0.0 if self._gap_sum <= 0.0 else len(self._gaps) / self._gap_sum
+            ),
+            mean_gap=timedelta(
+                seconds=0.0 if len(self._gaps) == 0 else self._gap_sum / len(self._gaps)
+            ),
+            max_gap=timedelta(seconds=max(self._gaps, default=0.0)),
+            stall=self.stall(now),
+            packets=self._packets,
+            resends=self._resends,
+            forced_reconnects=self._forced_reconnects,
+            last_reconnect_gap=self._last_reconnect_gap,
+        )
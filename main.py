@@ -1,5 +1,10 @@
 from app import App
 from nicegui import ui, app as nicegui_app
+from fastapi.responses import PlainTextResponse
+from metrics import metrics
+from sampling_profiler import SamplingProfiler
+import os
+import threading
 
 
 def main() -> None:
@@ -23,13 +28,39 @@ def main() -> None:
 
     app = App()
 
+    @ui.page("/")
+    def index() -> None:
+        app.create_view()
+
+    profiler = (
+        SamplingProfiler(threading.get_ident())
+        if os.environ.get("BORDERLAND_PROFILE", "") not in ("", "0")
+        else None
+    )
+
+    @nicegui_app.get("/metrics")
+    def get_metrics() -> PlainTextResponse:
+        return PlainTextResponse(
+            metrics.render(), media_type="text/plain; version=0.0.4"
+        )
+
+    if profiler is not None:
+
+        @nicegui_app.get("/profile")
+        def get_profile() -> PlainTextResponse:
+            return PlainTextResponse(profiler.render())
+
     @nicegui_app.on_startup
     async def startup(self) -> None:
+        if profiler is not None:
+            profiler.start()
         await app.startup()
 
     @nicegui_app.on_shutdown
     async def shutdown():
         await app.shutdown()
+        if profiler is not None:
+            profiler.stop()
 
     ui.run()
 
@@ -0,0 +1,214 @@
+from enum import Enum
+import time
+
+
+class MetricType(Enum):
+    COUNTER = "counter"
+    GAUGE = "gauge"
+    SUMMARY = "summary"
+
+
+class Metrics:
+    """
+    Always-on counters, gauges and timers, optionally labelled per ring.
+
+    Updating a metric is a dict lookup and an addition, so it is cheap enough to call for every sample.
+    Rendered in the Prometheus text exposition format.
+    """
+
+    _types: dict[str, tuple[MetricType, str]]
+    _values: dict[str, dict[str, float]]
+    _sums: dict[str, dict[str, float]]
+
+    def __init__(self) -> None:
+        self._types = {}
+        self._values = {}
+        self._sums = {}
+
+    def declare(self, name: str, metric_type: MetricType, help: str) -> None:
+        self._types[name] = (metric_type, help)
+        self._values.setdefault(name, {})
+        if metric_type == MetricType.SUMMARY:
+            self._sums.setdefault(name, {})
+
+    def inc(self, name: str, ring: str = "", amount: float = 1.0) -> None:
+        values = self._values[name]
+        values[ring] = values.get(ring, 0.0) + amount
+
+    def set(self, name: str, value: float, ring: str = "") -> None:
+        self._values[name][ring] = value
+
+    def observe(self, name: str, seconds: float, ring: str = "") -> None:
+        counts = self._values[name]
+        counts[ring] = counts.get(ring, 0.0) + 1.0
+        sums = self._sums[name]
+        sums[ring] = sums.get(ring, 0.0) + seconds
+
+    def remove_ring(self, ring: str) -> None:
+        for values in self._values.values():
+            values.pop(ring, None)
+        for sums in self._sums.values():
+            sums.pop(ring, None)
+
+    def render(self) -> str:
+        lines = []
+        for name, (metric_type, help) in self._types.items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {metric_type.value}")
+            if metric_type == MetricType.SUMMARY:
+                for ring, count in self._values[name].items():
+                    lines.append(f"{name}_count{_labels(ring)} {count}")
+                    lines.append(f"{name}_sum{_labels(ring)} {self._sums[name][ring]}")
+            else:
+                for ring, value in self._values[name].items():
+                    lines.append(f"{name}{_labels(ring)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class Timer:
+    """
+    Context manager observing the elapsed wall time into a summary metric.
+    """
+
+    _metrics: Metrics
+    _name: str
+    _ring: str
+    _start: float
+
+    def __init__(self, metrics: Metrics, name: str, ring: str = "") -> None:
+        self._metrics = metrics
+        self._name = name
+        self._ring = ring
+
+    def __enter__(self) -> "Timer":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self._metrics.observe(self._name, time.perf_counter() - self._start, self._ring)
+
+
+def _labels(ring: str) -> str:
+    if ring == "":
+        return ""
+    escaped = ring.replace("\\", "\\\\").replace('"', '\\"')
+    return f'{{ring="{escaped}"}}'
+
+
+metrics = Metrics()
+
+SAMPLES_DECODED = "borderland_samples_decoded_total"
+DECODE_SECONDS = "borderland_decode_seconds"
+STALL_RESENDS = "borderland_stall_resends_total"
+STALL_RECONNECTS = "borderland_stall_reconnects_total"
+RECONNECT_GAP_SECONDS = "borderland_reconnect_gap_seconds"
+ABS_FILTER_TICKS = "borderland_abs_filter_ticks_total"
+LEAKY_INTEGRATOR_FILTER_TICKS = "borderland_leaky_integrator_filter_ticks_total"
+GESTURE_FILTER_TICKS = "borderland_gesture_filter_ticks_total"
+ENERGY_FILTER_TICKS = "borderland_energy_filter_ticks_total"
+GESTURE_MATCHES = "borderland_gesture_matches_total"
+FILTER_TICK_SECONDS = "borderland_filter_tick_seconds"
+ROUTE_SECONDS = "borderland_route_seconds"
+MIDI_MESSAGES_SENT = "borderland_midi_messages_sent_total"
+EVENT_LOOP_LAG_SECONDS = "borderland_event_loop_lag_seconds"
+EVENT_LOOP_LAG_MAX_SECONDS = "borderland_event_loop_lag_max_seconds"
+FILTER_TICKS_SKIPPED = "borderland_filter_ticks_skipped_total"
+RING_IDLE = "borderland_ring_idle"
+RING_WAKES = "borderland_ring_wakes_total"
+RING_BATTERY = "borderland_ring_battery_percent"
+RING_HEART_RATE = "borderland_ring_heart_rate_bpm"
+HUB_DATAGRAMS_MISSED = "borderland_hub_datagrams_missed_total"
+HUB_DATAGRAMS_REORDERED = "borderland_hub_datagrams_reordered_total"
+HUB_LATENCY_SECONDS = "borderland_hub_latency_seconds"
+HUB_SAMPLE_AGE_SECONDS = "borderland_hub_sample_age_seconds"
+
+metrics.declare(
+    SAMPLES_DECODED, MetricType.COUNTER, "Accelerometer samples decoded from BLE."
+)
+metrics.declare(
+    DECODE_SECONDS,
+    MetricType.SUMMARY,
+    "Time spent decoding a BLE notification and handing it to the filters.",
+)
+metrics.declare(
+    STALL_RESENDS,
+    MetricType.COUNTER,
+    "Times the raw sensor stream was re-enabled because it stalled.",
+)
+metrics.declare(
+    STALL_RECONNECTS,
+    MetricType.COUNTER,
+    "Times a ring was reconnected because its stream stalled.",
+)
+metrics.declare(
+    RECONNECT_GAP_SECONDS,
+    MetricType.SUMMARY,
+    "Time from a disconnect to the first sample after reconnecting.",
+)
+metrics.declare(ABS_FILTER_TICKS, MetricType.COUNTER, "Abs filter outputs produced.")
+metrics.declare(
+    LEAKY_INTEGRATOR_FILTER_TICKS,
+    MetricType.COUNTER,
+    "Leaky integrator filter outputs produced.",
+)
+metrics.declare(
+    GESTURE_FILTER_TICKS, MetricType.COUNTER, "Gesture filter ticks evaluated."
+)
+metrics.declare(
+    ENERGY_FILTER_TICKS, MetricType.COUNTER, "Energy filter outputs produced."
+)
+metrics.declare(GESTURE_MATCHES, MetricType.COUNTER, "Gestures recognized.")
+metrics.declare(
+    FILTER_TICK_SECONDS,
+    MetricType.SUMMARY,
+    "Time spent computing a filter output.",
+)
+metrics.declare(
+    ROUTE_SECONDS,
+    MetricType.SUMMARY,
+    "Time spent routing a filter output to MIDI, including sending.",
+)
+metrics.declare(MIDI_MESSAGES_SENT, MetricType.COUNTER, "MIDI messages sent.")
+metrics.declare(
+    EVENT_LOOP_LAG_SECONDS,
+    MetricType.SUMMARY,
+    "How late the event loop woke up a periodic probe.",
+)
+metrics.declare(
+    EVENT_LOOP_LAG_MAX_SECONDS,
+    MetricType.GAUGE,
+    "Largest event loop lag seen during the last probe period.",
+)
+metrics.declare(
+    FILTER_TICKS_SKIPPED,
+    MetricType.COUNTER,
+    "Filter ticks not computed because the ring was idle.",
+)
+metrics.declare(RING_IDLE, MetricType.GAUGE, "1 while the filters of a ring run idle.")
+metrics.declare(
+    RING_WAKES, MetricType.COUNTER, "Times an idle ring was woken up by movement."
+)
+metrics.declare(RING_BATTERY, MetricType.GAUGE, "Last battery level read from a ring.")
+metrics.declare(
+    RING_HEART_RATE, MetricType.GAUGE, "Last heart rate measured by a ring."
+)
+metrics.declare(
+    HUB_DATAGRAMS_MISSED,
+    MetricType.COUNTER,
+    "Hub datagrams missing when a later one arrived. Lost ones are missed minus reordered.",
+)
+metrics.declare(
+    HUB_DATAGRAMS_REORDERED,
+    MetricType.COUNTER,
+    "Hub datagrams that arrived after a later one.",
+)
+metrics.declare(
+    HUB_LATENCY_SECONDS,
+    MetricType.SUMMARY,
+    "Time from sending a hub datagram to receiving it, by the clocks of both.",
+)
+metrics.declare(
+    HUB_SAMPLE_AGE_SECONDS,
+    MetricType.SUMMARY,
+    "Time from a sample arriving at its hub to it being received, including batching.",
+)
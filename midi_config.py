@@ -1,8 +1,108 @@
-from dataclasses import dataclass
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+FEATURE_ABS = "abs"
+FEATURE_LEAKY_INTEGRATOR = "leaky_integrator"
+
+CROWD_ADDRESS = "crowd"
+"""Routes from this address take the aggregates over all rings instead of the signals of one ring."""
+FEATURE_CROWD_ENERGY = "energy"
+FEATURE_CROWD_MOVING = "moving"
+FEATURE_CROWD_TRIGGERED = "triggered"
+
+
+def gesture_feature(name: str) -> str:
+    return f"gesture/{name}"
+
+
+def energy_feature(window: timedelta) -> str:
+    """
+    Mean acceleration magnitude over window, see FilterEnergy.
+    """
+    return f"energy/{window.total_seconds() * 1000.0:g}ms"
+
+
+def crowd_top_feature(rank: int) -> str:
+    """
+    Activity of the rank-th most active ring, from 1.
+    """
+    return f"top/{rank}"
+
+
+def crowd_histogram_feature(bin: int) -> str:
+    """
+    Fraction of the rings in activity bin, from 0.
+    """
+    return f"histogram/{bin}"
+
+
+@dataclass
+class MidiRoute:
+    address: str
+    """Ring address, or CROWD_ADDRESS."""
+    feature: str
+    """Signal of the ring, e.g. FEATURE_ABS."""
+    channel: int = 1
+    """MIDI channel, 1 to 16."""
+    number: int = 1
+    """Controller number for "cc" and "cc14", parameter number for "nrpn"."""
+    type: str = "cc"
+    """ "cc" for 7-bit CC, "cc14" for 14-bit CC (LSB on number + 32), "nrpn" for 14-bit NRPN."""
+    curve: str = "linear"
+    """ "linear", "exponential", "logarithmic" or "s_curve"."""
+    amount: float = 2.0
+    """Shape of the curve. Ignored for linear."""
+    minimum: float = 0.0
+    """Output at input 0, as fraction of the full MIDI range."""
+    maximum: float = 1.0
+    """Output at input 1, as fraction of the full MIDI range."""
+
+
+MAX_NUMBERS = {"cc": 127, "cc14": 31, "nrpn": 16383}
+"""Highest number per route type. cc14 also sends the LSB on number + 32."""
+
+
+def route_error(route: MidiRoute) -> str | None:
+    """
+    None if the route can be sent. str is what is wrong with it.
+    """
+    if route.type not in MAX_NUMBERS:
+        return f"Unknown MIDI type {route.type}."
+    if not 1 <= route.channel <= 16:
+        return f"MIDI channel {route.channel} is not between 1 and 16."
+    if not 0 <= route.number <= MAX_NUMBERS[route.type]:
+        return (
+            f"{route.type} number {route.number} is not between 0 and "
+            f"{MAX_NUMBERS[route.type]}."
+        )
+    return None
 
 
 @dataclass
 class MidiConfig:
-    abs_ring_1: str | None = None
-    abs_ring_2: str | None = None
-    abs_ring_3: str | None = None
+    routes: list[MidiRoute] = field(default_factory=list)
+    presets: dict[str, list[MidiRoute]] = field(default_factory=dict)
+    """Named sets of routes to crossfade to, e.g. one per scene."""
+
+    @staticmethod
+    def from_dict(config: dict) -> MidiConfig:
+        routes = [MidiRoute(**route) for route in config.get("routes", [])]
+        presets = {
+            name: [MidiRoute(**route) for route in preset_routes]
+            for name, preset_routes in config.get("presets", {}).items()
+        }
+
+        # Before the routing table there were three fixed rings, sending abs on CC 1-3 and leaky integrator on CC 4-6.
+        for i in (1, 2, 3):
+            address = config.get(f"abs_ring_{i}")
+            if address is not None:
+                routes.append(MidiRoute(address=address, feature=FEATURE_ABS, number=i))
+                routes.append(
+                    MidiRoute(
+                        address=address, feature=FEATURE_LEAKY_INTEGRATOR, number=3 + i
+                    )
+                )
+
+        return MidiConfig(routes=routes, presets=presets)
@@ -13,44 +13,33 @@ class MidiOut:
     def close(self) -> None:
         self._midi_out.close_port()
 
-    def send_abs_1(self, value: float) -> None:
+    def send_cc(self, channel: int, number: int, value: int) -> None:
         """
-        value must be between 0 and 1
+        channel 1 to 16, number 0 to 127, value 0 to 127
         """
-        assert value <= 1.0 and value >= 0.0
-        self._midi_out.send_message([176, 1, round(value * 127)])
+        assert 1 <= channel <= 16 and 0 <= number <= 127
+        assert value <= 127 and value >= 0
+        self._midi_out.send_message([0xB0 | (channel - 1), number, value])
 
-    def send_abs_2(self, value: float) -> None:
+    def send_cc14(self, channel: int, number: int, value: int) -> None:
         """
-        value must be between 0 and 1
+        channel 1 to 16, number 0 to 31, value 0 to 16383.
+        The MSB is sent on number, the LSB on number + 32.
         """
-        assert value <= 1.0 and value >= 0.0
-        self._midi_out.send_message([176, 2, round(value * 127)])
+        assert 1 <= channel <= 16 and 0 <= number <= 31
+        assert value <= 16383 and value >= 0
+        status = 0xB0 | (channel - 1)
+        self._midi_out.send_message([status, number, value >> 7])
+        self._midi_out.send_message([status, number + 32, value & 0x7F])
 
-    def send_abs_3(self, value: float) -> None:
+    def send_nrpn(self, channel: int, number: int, value: int) -> None:
         """
-        value must be between 0 and 1
+        channel 1 to 16, number 0 to 16383, value 0 to 16383
         """
-        assert value <= 1.0 and value >= 0.0
-        self._midi_out.send_message([176, 3, round(value * 127)])
-
-    def send_leaky_integrator_1(self, value: float) -> None:
-        """
-        value must be between 0 and 1
-        """
-        assert value <= 1.0 and value >= 0.0
-        self._midi_out.send_message([176, 4, round(value * 127)])
-
-    def send_leaky_integrator_2(self, value: float) -> None:
-        """
-        value must be between 0 and 1
-        """
-        assert value <= 1.0 and value >= 0.0
-        self._midi_out.send_message([176, 5, round(value * 127)])
-
-    def send_leaky_integrator_3(self, value: float) -> None:
-        """
-        value must be between 0 and 1
-        """
-        assert value <= 1.0 and value >= 0.0
-        self._midi_out.send_message([176, 6, round(value * 127)])
+        assert 1 <= channel <= 16 and 0 <= number <= 16383
+        assert value <= 16383 and value >= 0
+        status = 0xB0 | (channel - 1)
+        self._midi_out.send_message([status, 99, number >> 7])
+        self._midi_out.send_message([status, 98, number & 0x7F])
+        self._midi_out.send_message([status, 6, value >> 7])
+        self._midi_out.send_message([status, 38, value & 0x7F])
@@ -0,0 +1,243 @@
+from __future__ import annotations
+
+from midi_config import MidiRoute, route_error
+from midi_out import MidiOut
+from dataclasses import dataclass
+import numpy as np
+
+_RANGES = {"cc": 127, "cc14": 16383, "nrpn": 16383}
+
+
+def response_curve(curve: str, amount: float, x: np.ndarray) -> np.ndarray:
+    """
+    Maps x in 0..1 to 0..1.
+    """
+    if curve == "linear":
+        return x
+    elif curve == "exponential":
+        return x**amount
+    elif curve == "logarithmic":
+        return 1.0 - (1.0 - x) ** amount
+    elif curve == "s_curve":
+        a = x**amount
+        return a / (a + (1.0 - x) ** amount)
+    else:
+        raise ValueError(f"Unknown response curve {curve}.")
+
+
+class MidiRouter:
+    """
+    Sends (ring, feature) values to MIDI according to a compiled routing table.
+
+    Compiling turns the routes into a dict from (ring, feature) to route indices and one lookup table per route with
+    the curve and output range baked in, with an entry per MIDI value of its type, so 14-bit routes keep their full
+    resolution. Routing a value is then a dict lookup plus, per matching route, a table lookup, independent of the
+    total number of routes. A message is only sent when the value of an output, a (type, channel, number), changes.
+
+    A crossfade switches to new routes over a duration. Meanwhile routed values only update the latest value per route
+    of both tables, and step interpolates every output between them in one vectorized pass per frame, so its cost does
+    not depend on how often the inputs tick. Outputs only the old routes drive hold their value, outputs only the new
+    routes drive fade in from their last sent value.
+    """
+
+    _midi_out: MidiOut
+    _table: _RoutingTable
+    _sent: dict[tuple[str, int, int], int]
+    """Last value sent per output."""
+    _inputs: dict[tuple[str, str], float]
+    """Last value per (ring, feature), so new routes start from the current inputs."""
+    _fade: _Crossfade | None
+
+    def __init__(self, midi_out: MidiOut) -> None:
+        self._midi_out = midi_out
+        self._sent = {}
+        self._inputs = {}
+        self.compile([])
+
+    def compile(self, routes: list[MidiRoute]) -> list[str]:
+        """
+        Switches to routes right away, ending a crossfade.
+
+        Routes that cannot be sent are left out, returns what is wrong with them.
+        """
+        routes, errors = _sendable(routes)
+        self._table = _RoutingTable(routes)
+        self._fade = None
+        return errors
+
+    def crossfade(
+        self, routes: list[MidiRoute], duration: float, now: float
+    ) -> list[str]:
+        """
+        Fades from the current routes to routes over duration seconds, from now, as passed to step.
+
+        Routes that cannot be sent are left out, returns what is wrong with them.
+        """
+        routes, errors = _sendable(routes)
+        target = _RoutingTable(routes)
+        for (address, feature), value in self._inputs.items():
+            target.store(address, feature, value)
+        if duration <= 0.0:
+            self._table = target
+            self._fade = None
+            return errors
+        if self._fade is None:
+            source = self._table
+        else:
+            # Fading again mid-fade continues from what was sent last, so nothing jumps.
+            source = _RoutingTable([])
+        outputs = list(dict.fromkeys(source.outputs + target.outputs))
+        sent = np.array([self._sent.get(output, np.nan) for output in outputs])
+        self._fade = _Crossfade(
+            source=source,
+            target=target,
+            outputs=outputs,
+            source_routes=source.route_per_output(outputs),
+            target_routes=target.route_per_output(outputs),
+            held=sent.copy(),
+            sent=sent,
+            start=now,
+            duration=duration,
+        )
+        return errors
+
+    @property
+    def is_fading(self) -> bool:
+        return self._fade is not None
+
+    def route(self, address: str, feature: str, value: float) -> int:
+        """
+        value must be between 0 and 1. Returns the number of MIDI messages sent.
+        """
+        assert value <= 1.0 and value >= 0.0
+        self._inputs[(address, feature)] = value
+        if self._fade is not None:
+            self._fade.source.store(address, feature, value)
+            self._fade.target.store(address, feature, value)
+            return 0
+
+        indices = self._table.routes.get((address, feature))
+        if indices is None:
+            return 0
+        sent = 0
+        for i in indices:
+            midi_value = self._table.lookup(i, value)
+            self._table.values[i] = midi_value
+            output = self._table.outputs[i]
+            if self._sent.get(output) == midi_value:
+                continue
+            self._sent[output] = midi_value
+            sent += self._send(output, midi_value)
+        return sent
+
+    def step(self, now: float) -> int:
+        """
+        Sends one frame of the crossfade, if any. Returns the number of MIDI messages sent.
+        """
+        fade = self._fade
+        if fade is None:
+            return 0
+        weight = min(1.0, max(0.0, (now - fade.start) / fade.duration))
+
+        # Index -1 of route values is NaN, for outputs a table does not drive.
+        source = fade.source.values[fade.source_routes]
+        source = np.where(np.isnan(source), fade.held, source)
+        target = fade.target.values[fade.target_routes]
+        target = np.where(np.isnan(target), source, target)
+        source = np.where(np.isnan(source), target, source)
+        mixed = np.rint(source + weight * (target - source))
+        changed = np.flatnonzero(~np.isnan(mixed) & (mixed != fade.sent))
+        fade.sent[changed] = mixed[changed]
+
+        sent = 0
+        for j in changed:
+            output = fade.outputs[j]
+            midi_value = int(mixed[j])
+            self._sent[output] = midi_value
+            sent += self._send(output, midi_value)
+
+        if weight >= 1.0:
+            self._table = fade.target
+            self._fade = None
+        return sent
+
+    def _send(self, output: tuple[str, int, int], midi_value: int) -> int:
+        route_type, channel, number = output
+        if route_type == "cc":
+            self._midi_out.send_cc(channel, number, midi_value)
+            return 1
+        elif route_type == "cc14":
+            self._midi_out.send_cc14(channel, number, midi_value)
+            return 2
+        else:
+            self._midi_out.send_nrpn(channel, number, midi_value)
+            return 4
+
+
+def _sendable(routes: list[MidiRoute]) -> tuple[list[MidiRoute], list[str]]:
+    errors = [route_error(route) for route in routes]
+    return [route for route, error in zip(routes, errors) if error is None], [
+        f"{route.address} {route.feature}: {error}"
+        for route, error in zip(routes, errors)
+        if error is not None
+    ]
+
+
+class _RoutingTable:
+    routes: dict[tuple[str, str], list[int]]
+    luts: list[np.ndarray]
+    """Per route, the MIDI value for each of _RANGES[type] + 1 evenly spaced inputs."""
+    outputs: list[tuple[str, int, int]]
+    """Type, channel and number per route."""
+    values: np.ndarray
+    """Latest MIDI value per route, NaN before its first input. One more NaN at the end, for index -1."""
+
+    def __init__(self, routes: list[MidiRoute]) -> None:
+        self.routes = {}
+        self.luts = []
+        self.outputs = []
+        self.values = np.full(len(routes) + 1, np.nan)
+
+        for i, route in enumerate(routes):
+            self.routes.setdefault((route.address, route.feature), []).append(i)
+            x = np.linspace(0.0, 1.0, _RANGES[route.type] + 1)
+            y = route.minimum + (route.maximum - route.minimum) * response_curve(
+                route.curve, route.amount, x
+            )
+            self.luts.append(
+                np.round(np.clip(y, 0.0, 1.0) * _RANGES[route.type]).astype(np.uint16)
+            )
+            self.outputs.append((route.type, route.channel, route.number))
+
+    def lookup(self, i: int, value: float) -> int:
+        """
+        MIDI value of route i for value in 0..1.
+        """
+        lut = self.luts[i]
+        return int(lut[int(value * (len(lut) - 1) + 0.5)])
+
+    def store(self, address: str, feature: str, value: float) -> None:
+        for i in self.routes.get((address, feature), []):
+            self.values[i] = self.lookup(i, value)
+
+    def route_per_output(self, outputs: list[tuple[str, int, int]]) -> np.ndarray:
+        """
+        Index of the route driving each output, the last one if several do, -1 if none.
+        """
+        driving = {output: i for i, output in enumerate(self.outputs)}
+        return np.array([driving.get(output, -1) for output in outputs], dtype=np.intp)
+
+
+@dataclass
+class _Crossfade:
+    source: _RoutingTable
+    target: _RoutingTable
+    outputs: list[tuple[str, int, int]]
+    """Outputs of both tables."""
+    source_routes: np.ndarray
+    target_routes: np.ndarray
+    held: np.ndarray
+    """Value per output when the fade started, NaN if never sent."""
+    sent: np.ndarray
+    start: float
+    duration: float
@@ -0,0 +1,57 @@
+import socket
+import struct
+
+
+class OscOut:
+    """
+    Sends OSC messages over UDP, with int, float and string arguments.
+    """
+
+    _target: tuple[str, int]
+    _socket: socket.socket | None
+
+    def __init__(self, host: str, port: int) -> None:
+        self._target = (host, port)
+        self._socket = None
+
+    def open(self) -> None:
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.setblocking(False)
+
+    def close(self) -> None:
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def send(self, address: str, *args: int | float | str) -> None:
+        if self._socket is None:
+            return
+        try:
+            self._socket.sendto(_message(address, args), self._target)
+        except (BlockingIOError, OSError):
+            # OSC is fire and forget, a full buffer or an unreachable receiver must not stop the show.
+            pass
+
+
+def _message(address: str, args: tuple[int | float | str, ...]) -> bytes:
+    tags = ","
+    data = b""
+    for arg in args:
+        if isinstance(arg, bool) or isinstance(arg, int):
+            tags += "i"
+            data += struct.pack(">i", int(arg))
+        elif isinstance(arg, float):
+            tags += "f"
+            data += struct.pack(">f", arg)
+        else:
+            tags += "s"
+            data += _string(arg)
+    return _string(address) + _string(tags) + data
+
+
+def _string(value: str) -> bytes:
+    """
+    Null terminated and padded to a multiple of 4 bytes.
+    """
+    encoded = value.encode("utf-8") + b"\0"
+    return encoded + b"\0" * (-len(encoded) % 4)
@@ -0,0 +1,234 @@
+"""
+Replays recorded accelerometer samples through the filters in virtual time, so an hour of samples takes seconds. The
+filters run unchanged and see every sample at the time it was recorded, so their outputs are the ones of live
+operation.
+
+    python replay.py --record recording.csv --rings 4 --duration 3600
+    python replay.py recording.csv --output outputs.csv
+
+Recordings are CSV with address, ISO timestamp, x, y and z per sample. --record creates one from emulated rings, also
+in virtual time.
+"""
+
+from accelerometer_data import AccelerometerData
+from clock import VirtualClock
+from filters import Filters, FilterParams
+from filter_abs import FilterAbsOutput
+from filter_leaky_integrator import FilterLeakyIntegratorOutput
+from filter_energy import FilterEnergyOutput
+from filter_gesture import FilterGestureOutput, GestureLibrary
+from ring_manager import RingManager
+from ring_emulator import FaultConfig, emulator_transport_factory
+from midi_config import energy_feature
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, TextIO
+import argparse
+import asyncio
+import csv
+import sys
+import time
+
+
+def read_recording(path: Path) -> list[tuple[str, AccelerometerData]]:
+    with path.open(newline="") as f:
+        samples = [
+            (
+                row[0],
+                AccelerometerData(
+                    x=int(row[2]),
+                    y=int(row[3]),
+                    z=int(row[4]),
+                    timestamp=datetime.fromisoformat(row[1]),
+                ),
+            )
+            for row in csv.reader(f)
+        ]
+    samples.sort(key=lambda s: s[1].timestamp)
+    return samples
+
+
+async def replay(
+    clock: VirtualClock,
+    samples: list[tuple[str, AccelerometerData]],
+    params: FilterParams,
+    gesture_library: GestureLibrary | None,
+    output: TextIO,
+) -> int:
+    """
+    Feeds samples to the filters at their recorded time and writes every output as address, filter, timestamp and
+    value. Returns the number of outputs.
+    """
+    writer = csv.writer(output)
+    outputs = 0
+
+    def write(address: str, name: str, timestamp: datetime, value) -> None:
+        nonlocal outputs
+        outputs += 1
+        writer.writerow([address, name, timestamp.isoformat(), value])
+
+    def on_abs(address: str, output: FilterAbsOutput) -> None:
+        write(address, "abs", output.timestamp, output.value)
+
+    def on_leaky_integrator(address: str, output: FilterLeakyIntegratorOutput) -> None:
+        write(address, "leaky_integrator", output.timestamp, output.value)
+
+    def on_energy(address: str, output: FilterEnergyOutput) -> None:
+        for window, value in zip(output.windows, output.values):
+            write(address, energy_feature(window), output.timestamp, value)
+
+    def on_gesture(address: str, output: FilterGestureOutput) -> None:
+        for match in output.matches:
+            write(address, "gesture", output.timestamp, match.name)
+
+    filters = Filters(
+        on_abs_filter_output=on_abs,
+        on_leaky_integrator_filter_output=on_leaky_integrator,
+        gesture_library=gesture_library,
+        on_gesture_filter_output=on_gesture,
+        on_energy_filter_output=on_energy,
+        clock=clock,
+    )
+    for address in dict.fromkeys(address for address, _ in samples):
+        filters.on_ring_add(address, params)
+    filters_task = asyncio.create_task(filters.run())
+
+    for address, data in samples:
+        delay = (data.timestamp - clock.now()).total_seconds()
+        if delay > 0.0:
+            await clock.sleep(delay)
+        filters.on_raw_sensor_data(address, data)
+
+    # Let the filters see the end of the last window, like a live run that goes on.
+    await clock.sleep(params.abs_window_size.total_seconds())
+    filters.close()
+    await filters_task
+    return outputs
+
+
+async def record(
+    clock: VirtualClock,
+    rings: int,
+    duration: timedelta,
+    sample_rate: float,
+    faults: FaultConfig,
+    seed: int | None,
+    output: TextIO,
+) -> int:
+    """
+    Records what RingManagers receive from emulated rings. Returns the number of samples.
+    """
+    writer = csv.writer(output)
+    samples = 0
+
+    def on_raw_sensor_data(address: str) -> Callable:
+        async def on_data(data: AccelerometerData) -> None:
+            nonlocal samples
+            samples += 1
+            writer.writerow(
+                [address, data.timestamp.isoformat(), data.x, data.y, data.z]
+            )
+
+        return on_data
+
+    factory = emulator_transport_factory(
+        sample_rate=sample_rate, faults=faults, seed=seed
+    )
+    ring_managers = []
+    for i in range(rings):
+        address = f"EM:00:00:00:{i >> 8:02X}:{i & 0xFF:02X}"
+        ring_managers.append(
+            RingManager(
+                address=address,
+                name=f"Emulated {i}",
+                on_connect=lambda: None,
+                on_disconnect=lambda: None,
+                on_connecting=lambda: None,
+                on_connect_fail=lambda message: None,
+                on_raw_sensor_data=on_raw_sensor_data(address),
+                transport_factory=factory,
+                clock=clock,
+            )
+        )
+
+    tasks = [asyncio.create_task(r.run()) for r in ring_managers]
+    await clock.sleep(duration.total_seconds())
+    for ring_manager in ring_managers:
+        await ring_manager.close()
+    await asyncio.gather(*tasks)
+    return samples
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("recording", type=Path)
+    parser.add_argument(
+        "--record",
+        action="store_true",
+        help="Write a recording of emulated rings instead of replaying one.",
+    )
+    parser.add_argument(
+        "--output", type=Path, default=None, help="Filter outputs, default stdout."
+    )
+    parser.add_argument("--gestures", type=Path, default=None, help="Gesture library.")
+    parser.add_argument("--rings", type=int, default=1)
+    parser.add_argument("--duration", type=float, default=3600.0, help="Seconds.")
+    parser.add_argument("--rate", type=float, default=25.0, help="Samples per second.")
+    parser.add_argument(
+        "--disconnect-rate", type=float, default=0.0, help="Per second."
+    )
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="Per second.")
+    parser.add_argument("--drop", type=float, default=0.0, help="Probability.")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.record:
+        clock = VirtualClock(start=datetime.now())
+        with args.recording.open("w", newline="") as f:
+            count = clock.run(
+                record(
+                    clock,
+                    rings=args.rings,
+                    duration=timedelta(seconds=args.duration),
+                    sample_rate=args.rate,
+                    faults=FaultConfig(
+                        disconnect_rate=args.disconnect_rate,
+                        stall_rate=args.stall_rate,
+                        drop_probability=args.drop,
+                    ),
+                    seed=args.seed,
+                    output=f,
+                )
+            )
+        what = "samples recorded"
+        simulated = args.duration
+    else:
+        samples = read_recording(args.recording)
+        if len(samples) == 0:
+            sys.exit(f"{args.recording} has no samples")
+        clock = VirtualClock(start=samples[0][1].timestamp)
+        gesture_library = (
+            None if args.gestures is None else GestureLibrary(args.gestures)
+        )
+        f = sys.stdout if args.output is None else args.output.open("w", newline="")
+        try:
+            count = clock.run(
+                replay(clock, samples, FilterParams(), gesture_library, output=f)
+            )
+        finally:
+            if f is not sys.stdout:
+                f.close()
+        what = "filter outputs"
+        simulated = (samples[-1][1].timestamp - samples[0][1].timestamp).total_seconds()
+
+    elapsed = time.perf_counter() - start
+    print(
+        f"{count} {what}, {simulated:.0f} s in {elapsed:.1f} s "
+        f"({simulated / elapsed:.0f}x real time)",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
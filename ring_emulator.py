@@ -0,0 +1,285 @@
+from ring_transport import RingTransport, RingTransportError, RingTransportFactory
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Awaitable, Callable
+import asyncio
+import itertools
+import math
+import random
+
+
+@dataclass
+class FaultConfig:
+    disconnect_rate: float = 0.0
+    """Injected connection losses per second of streaming."""
+    stall_rate: float = 0.0
+    """Injected stream stalls per second of streaming."""
+    stall_duration: timedelta = timedelta(seconds=3)
+    """A stall ends by itself after this long."""
+    stall_recovery_probability: float = 0.5
+    """Chance that re-enabling the raw sensor stream ends a stall early."""
+    drop_probability: float = 0.0
+    """Chance that a single notification is lost."""
+    connect_failure_probability: float = 0.0
+    """Chance that a connection attempt fails."""
+    connect_latency: timedelta = timedelta(milliseconds=50)
+    """Time to connect with cached services."""
+    discovery_latency: timedelta = timedelta(milliseconds=500)
+    """Additional time to connect without cached services."""
+
+
+@dataclass
+class EmulatorStats:
+    connects: int = 0
+    connect_failures: int = 0
+    packets_sent: int = 0
+    packets_dropped: int = 0
+    injected_disconnects: int = 0
+    injected_stalls: int = 0
+
+
+class EmulatedRingTransport(RingTransport):
+    """
+    In-process stand-in for an R02 ring, speaking its UART protocol.
+
+    Validates incoming command packets, streams 0xA1 0x03 accelerometer notifications between the enable (a104) and
+    disable (a102) raw sensor commands, answers battery (03) and real-time heart rate (69, 6a) commands, and injects
+    the faults of FaultConfig.
+    """
+
+    _address: str
+    _on_disconnect: Callable[[], None]
+    _sample_period: float
+    _faults: FaultConfig
+    _random: random.Random
+    _phase: float
+
+    _connected: bool
+    _callback: Callable[[bytearray], Awaitable[None]] | None
+    _stream_task: asyncio.Task | None
+    _heart_rate_task: asyncio.Task | None
+    _reply_tasks: set[asyncio.Task]
+    _battery_level: int
+    _stalled_until: float
+
+    _stats: EmulatorStats
+
+    def __init__(
+        self,
+        address: str,
+        on_disconnect: Callable[[], None],
+        sample_rate: float = 25.0,
+        faults: FaultConfig | None = None,
+        seed: int | None = None,
+    ) -> None:
+        """
+        sample_rate: accelerometer notifications per second while the raw sensor stream is enabled.
+        seed: makes the signal and the injected faults reproducible. Combined with the address, so every ring differs.
+        """
+        self._address = address
+        self._on_disconnect = on_disconnect
+        self._sample_period = 1.0 / sample_rate
+        self._faults = FaultConfig() if faults is None else faults
+        self._random = random.Random(None if seed is None else f"{seed}/{address}")
+        self._phase = self._random.uniform(0.0, 2.0 * math.pi)
+
+        self._connected = False
+        self._callback = None
+        self._stream_task = None
+        self._heart_rate_task = None
+        self._reply_tasks = set()
+        self._battery_level = self._random.randint(20, 100)
+        self._stalled_until = 0.0
+
+        self._stats = EmulatorStats()
+
+    @property
+    def stats(self) -> EmulatorStats:
+        return self._stats
+
+    async def connect(self, use_cache: bool) -> None:
+        if self._connected:
+            raise RingTransportError(f"{self._address} is already connected")
+        latency = self._faults.connect_latency
+        if not use_cache:
+            latency += self._faults.discovery_latency
+        await asyncio.sleep(latency.total_seconds())
+        if self._random.random() < self._faults.connect_failure_probability:
+            self._stats.connect_failures += 1
+            raise RingTransportError(f"Injected connection failure of {self._address}")
+        self._connected = True
+        self._callback = None
+        self._stats.connects += 1
+
+    async def disconnect(self) -> None:
+        if not self._connected:
+            return
+        self._drop_connection()
+
+    @property
+    def is_connected(self) -> bool:
+        return self._connected
+
+    async def start_notify(
+        self, callback: Callable[[bytearray], Awaitable[None]]
+    ) -> None:
+        self._check_connected()
+        self._callback = callback
+
+    async def write(self, data: bytes) -> None:
+        self._check_connected()
+        if len(data) != 16:
+            raise RingTransportError(f"Command of {len(data)} bytes, expected 16")
+        if sum(data[:15]) & 0xFF != data[15]:
+            raise RingTransportError(f"Command {data.hex()} has a wrong checksum")
+
+        if data[0] == 0xA1 and data[1] == 0x04:
+            if self._stalled_until > 0.0 and (
+                self._random.random() < self._faults.stall_recovery_probability
+            ):
+                self._stalled_until = 0.0
+            if self._stream_task is None:
+                self._stream_task = asyncio.create_task(self._stream())
+        elif data[0] == 0xA1 and data[1] == 0x02:
+            self._stop_stream()
+        elif data[0] == 0x03:
+            task = asyncio.create_task(
+                self._reply(_packet(0x03, self._battery_level, 0))
+            )
+            self._reply_tasks.add(task)
+            task.add_done_callback(self._reply_tasks.discard)
+        elif data[0] == 0x69 and data[1] == 0x01:
+            if self._heart_rate_task is None:
+                self._heart_rate_task = asyncio.create_task(self._measure_heart_rate())
+        elif data[0] == 0x6A:
+            self._stop_heart_rate()
+
+    def _check_connected(self) -> None:
+        if not self._connected:
+            raise RingTransportError(f"{self._address} is not connected")
+
+    def _drop_connection(self) -> None:
+        self._connected = False
+        self._callback = None
+        self._stalled_until = 0.0
+        self._stop_stream()
+        self._stop_heart_rate()
+        # Like bleak, report every lost connection, including the ones asked for.
+        asyncio.get_running_loop().call_soon(self._on_disconnect)
+
+    def _stop_stream(self) -> None:
+        if self._stream_task is not None:
+            if self._stream_task is not asyncio.current_task():
+                self._stream_task.cancel()
+            self._stream_task = None
+
+    def _stop_heart_rate(self) -> None:
+        if self._heart_rate_task is not None:
+            self._heart_rate_task.cancel()
+            self._heart_rate_task = None
+
+    async def _reply(self, packet: bytearray) -> None:
+        await asyncio.sleep(_REPLY_LATENCY)
+        if self._callback is not None:
+            await self._callback(packet)
+
+    async def _measure_heart_rate(self) -> None:
+        """
+        Like the ring, reports 0 while measuring and then a value every second until stopped.
+        """
+        for i in itertools.count():
+            await asyncio.sleep(1.0)
+            value = 0 if i < 4 else self._random.randint(60, 80)
+            if self._callback is not None:
+                await self._callback(_packet(0x69, 0x01, 0x00, value))
+
+    async def _stream(self) -> None:
+        loop = asyncio.get_running_loop()
+        next_time = loop.time()
+        disconnect_probability = self._faults.disconnect_rate * self._sample_period
+        stall_probability = self._faults.stall_rate * self._sample_period
+
+        while True:
+            # Sleep towards a deadline, so time spent in the callback does not lower the rate.
+            next_time += self._sample_period
+            await asyncio.sleep(max(0.0, next_time - loop.time()))
+            now = loop.time()
+
+            if self._random.random() < disconnect_probability:
+                self._stats.injected_disconnects += 1
+                self._drop_connection()
+                return
+
+            if self._stalled_until > 0.0:
+                if now < self._stalled_until:
+                    continue
+                self._stalled_until = 0.0
+            elif self._random.random() < stall_probability:
+                self._stats.injected_stalls += 1
+                self._stalled_until = now + self._faults.stall_duration.total_seconds()
+                continue
+
+            if self._random.random() < self._faults.drop_probability:
+                self._stats.packets_dropped += 1
+                continue
+
+            if self._callback is not None:
+                self._stats.packets_sent += 1
+                await self._callback(self._raw_sensor_packet(now))
+
+    def _raw_sensor_packet(self, t: float) -> bytearray:
+        """
+        Gravity along z plus noise, with occasional bursts of movement.
+        """
+        movement = max(0.0, math.sin(0.3 * t + self._phase)) ** 4 * 1500.0
+        x = self._random.gauss(0.0, 20.0) + movement * math.sin(7.0 * t)
+        y = self._random.gauss(0.0, 20.0)
+        z = self._random.gauss(512.0, 20.0) + movement * math.cos(5.0 * t)
+
+        packet = bytearray(16)
+        packet[0] = 0xA1
+        packet[1] = 0x03
+        packet[2], packet[3] = _encode_axis(y)
+        packet[4], packet[5] = _encode_axis(z)
+        packet[6], packet[7] = _encode_axis(x)
+        packet[15] = sum(packet[:15]) & 0xFF
+        return packet
+
+
+def _packet(*payload: int) -> bytearray:
+    packet = bytearray(16)
+    packet[: len(payload)] = payload
+    packet[15] = sum(packet[:15]) & 0xFF
+    return packet
+
+
+def _encode_axis(value: float) -> tuple[int, int]:
+    """
+    12 bit two's complement, high 8 bits in the first byte and low 4 bits in the second.
+    """
+    raw = max(-2048, min(2047, int(round(value)))) & 0xFFF
+    return raw >> 4, raw & 0xF
+
+
+def emulator_transport_factory(
+    sample_rate: float = 25.0,
+    faults: FaultConfig | None = None,
+    seed: int | None = None,
+    transports: list[EmulatedRingTransport] | None = None,
+) -> RingTransportFactory:
+    """
+    transports: if given, every created transport is appended to it, to read their EmulatorStats.
+    """
+
+    def create(address: str, on_disconnect: Callable[[], None]) -> RingTransport:
+        transport = EmulatedRingTransport(
+            address, on_disconnect, sample_rate=sample_rate, faults=faults, seed=seed
+        )
+        if transports is not None:
+            transports.append(transport)
+        return transport
+
+    return create
+
+
+_REPLY_LATENCY = 0.03
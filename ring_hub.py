@@ -0,0 +1,211 @@
+"""
+Ring hub: runs only the ring managers, on a small machine within BLE range of the dancers, and forwards their samples
+over UDP to the main process, which runs the filters. The main process takes the rings marked with "hub": true in its
+rings.json from hubs.
+
+    python ring_hub.py --target 192.168.1.10:9870 --rings rings.json --adapter hci0
+    python ring_hub.py --target 127.0.0.1:9870 --simulated 4
+
+--loopback runs a hub of emulated rings and a receiver in this process over 127.0.0.1 and reports loss and latency.
+
+    python ring_hub.py --loopback --simulated 50 --duration 30
+"""
+
+from accelerometer_data import AccelerometerData
+from ring_manager import RingManager, RingStatus
+from ring_emulator import emulator_transport_factory
+from hub_link import HubSender, HubReceiver, HUB_PORT
+from datetime import timedelta
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import signal
+
+
+class RingHub:
+    _rings: list[dict]
+    _adapter: str | None
+    _simulated: bool
+    _sender: HubSender
+    _ring_managers: list[RingManager]
+    _stop_event: asyncio.Event | None
+
+    def __init__(
+        self,
+        target: tuple[str, int],
+        rings: list[dict],
+        adapter: str | None = None,
+        simulated: bool = False,
+        batch_period: timedelta = timedelta(milliseconds=20),
+    ) -> None:
+        """
+        rings: {"address": ..., "name": ...} per ring.
+        simulated: connect to emulated rings instead of over BLE.
+        """
+        self._rings = rings
+        self._adapter = adapter
+        self._simulated = simulated
+        self._sender = HubSender(target, rings, batch_period=batch_period)
+        self._ring_managers = []
+        self._stop_event = None
+
+    async def run(self) -> None:
+        self._stop_event = asyncio.Event()
+        tasks = [asyncio.create_task(self._sender.run())]
+        for ring in self._rings:
+            address = ring["address"]
+            self._ring_managers.append(
+                RingManager(
+                    address=address,
+                    name=ring["name"],
+                    on_connect=lambda a=address: self._sender.on_status(
+                        a, RingStatus.CONNECTED
+                    ),
+                    on_disconnect=lambda a=address: self._sender.on_status(
+                        a, RingStatus.DISCONNECTED
+                    ),
+                    on_connecting=lambda a=address: self._sender.on_status(
+                        a, RingStatus.CONNECTING
+                    ),
+                    on_connect_fail=lambda msg, a=address: self._sender.on_status(
+                        a, RingStatus.DISCONNECTED
+                    ),
+                    on_raw_sensor_data=lambda data, a=address: self._on_raw_sensor_data(
+                        a, data
+                    ),
+                    adapter=self._adapter,
+                    transport_factory=(
+                        emulator_transport_factory() if self._simulated else None
+                    ),
+                )
+            )
+        tasks += [asyncio.create_task(r.run()) for r in self._ring_managers]
+
+        await self._stop_event.wait()
+
+        for ring_manager in self._ring_managers:
+            await ring_manager.close()
+        self._sender.close()
+        await asyncio.gather(*tasks)
+
+    def close(self) -> None:
+        self._stop_event.set()
+
+    async def _on_raw_sensor_data(self, address: str, data: AccelerometerData) -> None:
+        self._sender.on_sample(address, data)
+
+
+async def loopback(rings: list[dict], duration: timedelta) -> None:
+    connected: set[str] = set()
+
+    def on_status(address: str, status: RingStatus) -> None:
+        if status == RingStatus.CONNECTED:
+            connected.add(address)
+
+    receiver = HubReceiver(
+        on_sample=lambda address, data: None,
+        on_status=on_status,
+        local_addr=("127.0.0.1", 0),
+    )
+    await receiver.open()
+    receiver_task = asyncio.create_task(receiver.run())
+    port = receiver.local_addr[1]
+
+    hub = RingHub(("127.0.0.1", port), rings, simulated=True)
+    hub_task = asyncio.create_task(hub.run())
+    await asyncio.sleep(duration.total_seconds())
+    hub.close()
+    await hub_task
+    # Let the last datagrams arrive.
+    await asyncio.sleep(0.1)
+    receiver.close()
+    await receiver_task
+
+    stats = receiver.stats
+    print(f"Rings:       {len(rings)}, {len(connected)} reported connected")
+    print(
+        f"Samples:     {stats.samples} "
+        f"({stats.samples / duration.total_seconds():.0f}/s), "
+        f"{stats.unknown_samples} before the first state"
+    )
+    print(
+        f"Datagrams:   {stats.datagrams}, {stats.lost} lost ({stats.loss_rate:.2%}), "
+        f"{stats.reordered} reordered"
+    )
+    print(
+        f"Latency:     mean {stats.latency_mean.total_seconds() * 1000:.2f} ms, "
+        f"max {stats.latency_max.total_seconds() * 1000:.2f} ms"
+    )
+    print(
+        f"Sample age:  mean {stats.sample_age_mean.total_seconds() * 1000:.2f} ms, "
+        f"max {stats.sample_age_max.total_seconds() * 1000:.2f} ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--target",
+        default=None,
+        help=f"host[:port] of the main process, port {HUB_PORT} by default.",
+    )
+    parser.add_argument("--rings", type=Path, default=Path("rings.json"))
+    parser.add_argument(
+        "--adapter", default=None, help='Bluetooth adapter, e.g. "hci1".'
+    )
+    parser.add_argument(
+        "--simulated", type=int, default=None, help="Run this many emulated rings."
+    )
+    parser.add_argument("--batch", type=float, default=20.0, help="Milliseconds.")
+    parser.add_argument("--loopback", action="store_true")
+    parser.add_argument(
+        "--duration", type=float, default=30.0, help="Seconds, with --loopback."
+    )
+    args = parser.parse_args()
+
+    if args.simulated is not None:
+        rings = [
+            {
+                "address": f"EM:00:00:00:{i >> 8:02X}:{i & 0xFF:02X}",
+                "name": f"Emulated {i}",
+            }
+            for i in range(args.simulated)
+        ]
+    else:
+        with open(args.rings, "r") as f:
+            rings = [
+                {"address": ring["address"], "name": ring["name"]}
+                for ring in json.load(f)
+            ]
+
+    if args.loopback:
+        if args.simulated is None:
+            parser.error("--loopback needs --simulated")
+        asyncio.run(loopback(rings, timedelta(seconds=args.duration)))
+        return
+
+    if args.target is None:
+        parser.error("--target is required")
+    host, _, port = args.target.partition(":")
+    hub = RingHub(
+        target=(host, int(port) if port != "" else HUB_PORT),
+        rings=rings,
+        adapter=args.adapter,
+        simulated=args.simulated is not None,
+        batch_period=timedelta(milliseconds=args.batch),
+    )
+
+    async def run() -> None:
+        loop = asyncio.get_running_loop()
+        hub_task = asyncio.create_task(hub.run())
+        await asyncio.sleep(0)
+        loop.add_signal_handler(signal.SIGTERM, hub.close)
+        loop.add_signal_handler(signal.SIGINT, hub.close)
+        await hub_task
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
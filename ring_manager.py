@@ -1,9 +1,29 @@
 from enum import Enum, auto
+from dataclasses import dataclass
 from typing import Callable, Awaitable
 import asyncio
-from bleak import BleakClient, BleakError
+from ring_transport import (
+    RingTransport,
+    RingTransportError,
+    RingTransportFactory,
+    bleak_transport_factory,
+)
 from accelerometer_data import AccelerometerData
-from datetime import datetime
+from command_scheduler import CommandScheduler, CommandPriority
+from clock import Clock, system_clock
+from datetime import datetime, timedelta
+from link_monitor import LinkMonitor, LinkStats
+from metrics import (
+    metrics,
+    Timer,
+    SAMPLES_DECODED,
+    DECODE_SECONDS,
+    STALL_RESENDS,
+    STALL_RECONNECTS,
+    RECONNECT_GAP_SECONDS,
+    RING_BATTERY,
+    RING_HEART_RATE,
+)
 
 
 class RingStatus(Enum):
@@ -12,20 +32,44 @@ class RingStatus(Enum):
     CONNECTING = auto()
 
 
+@dataclass
+class RingReadings:
+    battery_level: int | None = None
+    """Percent."""
+    charging: bool | None = None
+    heart_rate: int | None = None
+    """Beats per minute."""
+
+
 class RingManager:
     _address: str
     _name: str
+    _adapter: str | None
     _on_connect: Callable[[], None]
     _on_disconnect: Callable[[], None]
     _on_connecting: Callable[[], None]
     _on_connect_fail: Callable[[str], None]
     _on_raw_sensor_data: Callable[[AccelerometerData], Awaitable[None]]
 
+    _clock: Clock
     _ring_status: RingStatus
 
-    _bleak_client: BleakClient | None
+    _transport_factory: RingTransportFactory
+    _transport: RingTransport | None
+    _commands: CommandScheduler
+
+    _battery_poll_period: timedelta | None
+    _heart_rate_poll_period: timedelta | None
+    _readings: RingReadings
+
+    _link_monitor: LinkMonitor
+    _stall_resend_after: timedelta
+    _stall_reconnect_after: timedelta
 
     _stop_event: asyncio.Event | None
+    _disconnect_event: asyncio.Event
+
+    _disconnected_at: datetime | None
 
     def __init__(
         self,
@@ -36,9 +80,27 @@ class RingManager:
         on_connecting: Callable[[], None],
         on_connect_fail: Callable[[str], None],
         on_raw_sensor_data: Callable[[AccelerometerData], Awaitable[None]],
+        adapter: str | None = None,
+        stall_resend_after: timedelta = timedelta(seconds=1),
+        stall_reconnect_after: timedelta = timedelta(seconds=4),
+        transport_factory: RingTransportFactory | None = None,
+        clock: Clock = system_clock,
+        battery_poll_period: timedelta | None = timedelta(minutes=5),
+        heart_rate_poll_period: timedelta | None = None,
     ) -> None:
+        """
+        adapter: Bluetooth adapter to connect through, e.g. "hci1". None uses the default adapter.
+        transport_factory: how to reach the ring. None connects over BLE through adapter.
+        stall_resend_after: re-enable the raw sensor stream when no notification arrived for this long while connected.
+        stall_reconnect_after: force a reconnect when no notification arrived for this long while connected.
+        clock: timestamps samples and times the stall watch.
+        battery_poll_period, heart_rate_poll_period: how often to take these readings while connected, None never.
+        A heart rate reading keeps the ring measuring for several seconds, the accelerometer stream continues meanwhile.
+        """
+        self._clock = clock
         self._address = address
         self._name = name
+        self._adapter = adapter
         self._on_connect = on_connect
         self._on_disconnect = on_disconnect
         self._on_connecting = on_connecting
@@ -46,10 +108,28 @@ class RingManager:
         self._on_raw_sensor_data = on_raw_sensor_data
 
         self._stop_event = None
+        self._disconnect_event = asyncio.Event()
+
+        self._disconnected_at = None
 
         self._ring_status = RingStatus.DISCONNECTED
 
-        self._bleak_client = None
+        self._transport_factory = (
+            bleak_transport_factory(adapter)
+            if transport_factory is None
+            else transport_factory
+        )
+        self._transport = None
+        self._commands = CommandScheduler(address, clock=clock)
+        self._commands.set_handler(0xA1, self._handle_raw_sensor_packet)
+
+        self._battery_poll_period = battery_poll_period
+        self._heart_rate_poll_period = heart_rate_poll_period
+        self._readings = RingReadings()
+
+        self._link_monitor = LinkMonitor()
+        self._stall_resend_after = stall_resend_after
+        self._stall_reconnect_after = stall_reconnect_after
 
     @property
     def address(self) -> str:
@@ -59,44 +139,182 @@ class RingManager:
     def name(self) -> str:
         return self._name
 
+    @property
+    def adapter(self) -> str | None:
+        return self._adapter
+
     async def run(self) -> None:
         self._stop_event = asyncio.Event()
 
+        failed_attempts = 0
         while not self._stop_event.is_set():
             self._ring_status = RingStatus.CONNECTING
             self._on_connecting()
 
-            disconnect_event = asyncio.Event()
+            self._disconnect_event = asyncio.Event()
             try:
-                self._bleak_client = BleakClient(
-                    self._address,
-                    disconnected_callback=lambda c: disconnect_event.set(),
-                )
-                await self._bleak_client.connect()
-                await self._bleak_client.start_notify(
-                    _UART_TX_CHAR_UUID, self._handle_tx
-                )
+                if self._transport is None:
+                    self._transport = self._transport_factory(
+                        self._address, self._on_transport_disconnect
+                    )
+                    use_cache = False
+                else:
+                    # Reconnecting with the same transport, services were already discovered.
+                    use_cache = True
+                await self._transport.connect(use_cache=use_cache)
+                await self._transport.start_notify(self._commands.on_notification)
+                self._commands.start(self._transport)
                 self._ring_status = RingStatus.CONNECTED
+                self._link_monitor.on_connect(self._clock.now())
                 self._on_connect()
 
                 await self._enable_raw_sensor_data()
-
-                await disconnect_event.wait()
+                failed_attempts = 0
+
+                poll_task = asyncio.create_task(self._poll_readings())
+                try:
+                    await self._watch_stream(self._disconnect_event)
+                finally:
+                    poll_task.cancel()
+                self._commands.stop()
                 self._ring_status = RingStatus.DISCONNECTED
+                self._link_monitor.on_disconnect()
+                self._disconnected_at = self._clock.now()
                 self._on_disconnect()
-            except BleakError as e:
+            except RingTransportError as e:
+                self._commands.stop()
+                if self._transport is not None and self._transport.is_connected:
+                    # Failed after connecting, e.g. enabling notifications. Reconnecting needs the link down, and the
+                    # gap to the next sample counts from here like after any disconnect.
+                    try:
+                        await self._transport.disconnect()
+                    except RingTransportError:
+                        pass
+                    self._link_monitor.on_disconnect()
+                    self._disconnected_at = self._clock.now()
                 self._ring_status = RingStatus.DISCONNECTED
                 self._on_connect_fail(str(e))
-            self._bleak_client = None
+                failed_attempts += 1
+                if failed_attempts >= _FRESH_TRANSPORT_AFTER_FAILED_ATTEMPTS:
+                    # The cached transport or its services may be stale, start over.
+                    self._transport = None
 
             if not self._stop_event.is_set():
-                await asyncio.sleep(2)
+                # A dropout is retried immediately, only repeated failures back off.
+                await self._clock.sleep(
+                    0.0
+                    if failed_attempts == 0
+                    else min(_MAX_RECONNECT_DELAY, 0.25 * 2 ** (failed_attempts - 1))
+                )
+
+    async def _watch_stream(self, disconnect_event: asyncio.Event) -> None:
+        """
+        Wait until disconnected. Meanwhile re-enable a stalled stream and drop the connection when that does not help.
+        """
+        last_resend = self._clock.now()
+        while not disconnect_event.is_set() and not self._stop_event.is_set():
+            try:
+                await asyncio.wait_for(
+                    disconnect_event.wait(),
+                    timeout=self._stall_resend_after.total_seconds() / 4,
+                )
+            except asyncio.TimeoutError:
+                pass
+            if disconnect_event.is_set() or self._stop_event.is_set():
+                break
+
+            now = self._clock.now()
+            stall = self._link_monitor.stall(now)
+            if stall > self._stall_reconnect_after:
+                self._link_monitor.on_forced_reconnect()
+                metrics.inc(STALL_RECONNECTS, self._address)
+                await self._transport.disconnect()
+                break
+            elif (
+                stall > self._stall_resend_after
+                and now - last_resend > self._stall_resend_after
+            ):
+                last_resend = now
+                self._link_monitor.on_resend()
+                metrics.inc(STALL_RESENDS, self._address)
+                await self._enable_raw_sensor_data()
+
+    @property
+    def link_stats(self) -> LinkStats:
+        return self._link_monitor.stats(self._clock.now())
+
+    @property
+    def readings(self) -> RingReadings:
+        """
+        Latest readings other than the accelerometer, kept across reconnects.
+        """
+        return self._readings
+
+    async def _poll_readings(self) -> None:
+        polls = [
+            (period, read)
+            for period, read in [
+                (self._battery_poll_period, self._read_battery),
+                (self._heart_rate_poll_period, self._read_heart_rate),
+            ]
+            if period is not None
+        ]
+        if len(polls) == 0:
+            return
+        due = [self._clock.now()] * len(polls)
+        while True:
+            for i, (period, read) in enumerate(polls):
+                if self._clock.now() >= due[i]:
+                    due[i] = self._clock.now() + period
+                    try:
+                        await read()
+                    except RingTransportError:
+                        # Missed readings are taken at the next poll, the connection is watched elsewhere.
+                        pass
+            await self._clock.sleep(
+                max(0.0, (min(due) - self._clock.now()).total_seconds())
+            )
+
+    async def _read_battery(self) -> None:
+        reply = await self._commands.request(
+            _BATTERY_CMD, reply_type=0x03, priority=CommandPriority.POLL
+        )
+        self._readings.battery_level = reply[1]
+        self._readings.charging = reply[2] != 0
+        metrics.set(RING_BATTERY, reply[1], self._address)
+
+    async def _read_heart_rate(self) -> None:
+        """
+        The ring reports 0 every second until it has a measurement, or an error code when it cannot measure.
+        """
+        reply = await self._commands.request(
+            _START_HEART_RATE_CMD, reply_type=0x69, priority=CommandPriority.POLL
+        )
+        try:
+            for _ in range(_MAX_HEART_RATE_REPLIES):
+                if reply[2] != 0:
+                    break
+                if reply[3] != 0:
+                    self._readings.heart_rate = reply[3]
+                    metrics.set(RING_HEART_RATE, reply[3], self._address)
+                    break
+                reply = await self._commands.expect(0x69)
+        except RingTransportError:
+            pass
+        await self._commands.send(_STOP_HEART_RATE_CMD, CommandPriority.POLL)
 
     async def close(self) -> None:
+        if self._transport is not None and self._transport.is_connected:
+            # Through the scheduler, after a write in progress, and before stopping run, which stops the scheduler.
+            try:
+                await self._send_command(_DISABLE_RAW_SENSOR_CMD)
+            except RingTransportError:
+                # Disconnected meanwhile, the stream is gone anyway.
+                pass
         self._stop_event.set()
-        if self._bleak_client is not None:
-            await self._disable_raw_sensor_data()
-            await self._bleak_client.disconnect()
+        self._disconnect_event.set()
+        if self._transport is not None and self._transport.is_connected:
+            await self._transport.disconnect()
 
     @property
     def status(self) -> RingStatus:
@@ -105,35 +323,46 @@ class RingManager:
     async def _enable_raw_sensor_data(self) -> None:
         await self._send_command(_ENABLE_RAW_SENSOR_CMD)
 
-    async def _disable_raw_sensor_data(self) -> None:
-        await self._send_command(_DISABLE_RAW_SENSOR_CMD)
-
     async def _send_command(self, command):
-        await self._bleak_client.write_gatt_char(_UART_RX_CHAR_UUID, command)
+        await self._commands.send(command, CommandPriority.STREAM)
 
-    async def _handle_tx(self, sender: int, data: bytearray) -> None:
-        if data[0] == 0xA1:
-            if data[1] == 0x03:
-                # y = axis through charging point
-                # z = axis through ring
+    def _on_transport_disconnect(self) -> None:
+        self._disconnect_event.set()
 
-                acc_x = (data[6] << 4) | (data[7] & 0xF)
-                if acc_x & (1 << 11):
-                    acc_x -= 1 << 12
+    async def _handle_raw_sensor_packet(self, data: bytearray) -> None:
+        # Only the accelerometer stream counts, replies to other commands must not hide a stall.
+        self._link_monitor.on_packet(self._clock.now())
+        if data[1] == 0x03:
+            with Timer(metrics, DECODE_SECONDS, self._address):
+                await self._handle_raw_sensor_data(data)
 
-                acc_y = (data[2] << 4) | (data[3] & 0xF)
-                if acc_y & (1 << 11):
-                    acc_y -= 1 << 12
+    async def _handle_raw_sensor_data(self, data: bytearray) -> None:
+        # y = axis through charging point
+        # z = axis through ring
 
-                acc_z = (data[4] << 4) | (data[5] & 0xF)
-                if acc_z & (1 << 11):
-                    acc_z -= 1 << 12
+        acc_x = (data[6] << 4) | (data[7] & 0xF)
+        if acc_x & (1 << 11):
+            acc_x -= 1 << 12
 
-                await self._on_raw_sensor_data(
-                    AccelerometerData(
-                        x=acc_x, y=acc_y, z=acc_z, timestamp=datetime.now()
-                    )
-                )
+        acc_y = (data[2] << 4) | (data[3] & 0xF)
+        if acc_y & (1 << 11):
+            acc_y -= 1 << 12
+
+        acc_z = (data[4] << 4) | (data[5] & 0xF)
+        if acc_z & (1 << 11):
+            acc_z -= 1 << 12
+
+        now = self._clock.now()
+        if self._disconnected_at is not None:
+            gap = now - self._disconnected_at
+            self._disconnected_at = None
+            self._link_monitor.on_reconnect_gap(gap)
+            metrics.observe(RECONNECT_GAP_SECONDS, gap.total_seconds(), self._address)
+
+        metrics.inc(SAMPLES_DECODED, self._address)
+        await self._on_raw_sensor_data(
+            AccelerometerData(x=acc_x, y=acc_y, z=acc_z, timestamp=now)
+        )
 
 
 def _create_command(hex_string):
@@ -149,6 +378,11 @@ _REBOOT_CMD = _create_command("0801")
 _BLINK_TWICE_CMD = _create_command("10")
 _ENABLE_RAW_SENSOR_CMD = _create_command("a104")
 _DISABLE_RAW_SENSOR_CMD = _create_command("a102")
+_BATTERY_CMD = _create_command("03")
+_START_HEART_RATE_CMD = _create_command("690101")
+_STOP_HEART_RATE_CMD = _create_command("6a010000")
+
+_MAX_HEART_RATE_REPLIES = 30
 
-_UART_TX_CHAR_UUID = "6E400003-B5A3-F393-E0A9-E50E24DCCA9E"
-_UART_RX_CHAR_UUID = "6E400002-B5A3-F393-E0A9-E50E24DCCA9E"
+_FRESH_TRANSPORT_AFTER_FAILED_ATTEMPTS = 3
+_MAX_RECONNECT_DELAY = 2.0
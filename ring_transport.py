@@ -0,0 +1,105 @@
+from abc import ABC, abstractmethod
+from typing import Awaitable, Callable
+import asyncio
+from bleak import BleakClient, BleakError
+
+UART_SERVICE_UUID = "6E400001-B5A3-F393-E0A9-E50E24DCCA9E"
+UART_TX_CHAR_UUID = "6E400003-B5A3-F393-E0A9-E50E24DCCA9E"
+UART_RX_CHAR_UUID = "6E400002-B5A3-F393-E0A9-E50E24DCCA9E"
+
+
+class RingTransportError(Exception):
+    pass
+
+
+class RingTransport(ABC):
+    """
+    Connection to the UART service of one ring.
+
+    Implementations raise RingTransportError when connecting or writing fails, and call the on_disconnect callback
+    given by their factory when an established connection is lost.
+    """
+
+    @abstractmethod
+    async def connect(self, use_cache: bool) -> None:
+        """
+        use_cache: the transport connected before, cached service information may be reused.
+        """
+        ...
+
+    @abstractmethod
+    async def disconnect(self) -> None: ...
+
+    @property
+    @abstractmethod
+    def is_connected(self) -> bool: ...
+
+    @abstractmethod
+    async def start_notify(
+        self, callback: Callable[[bytearray], Awaitable[None]]
+    ) -> None:
+        """
+        Call callback for every packet the ring sends. Has to be called again after reconnecting.
+        """
+        ...
+
+    @abstractmethod
+    async def write(self, data: bytes) -> None: ...
+
+
+RingTransportFactory = Callable[[str, Callable[[], None]], RingTransport]
+"""Creates the transport for a ring address, with the callback for lost connections."""
+
+
+class BleakRingTransport(RingTransport):
+    _client: BleakClient
+
+    def __init__(
+        self, address: str, on_disconnect: Callable[[], None], adapter: str | None
+    ) -> None:
+        self._client = BleakClient(
+            address,
+            disconnected_callback=lambda c: on_disconnect(),
+            services=[UART_SERVICE_UUID],
+            bluez={} if adapter is None else {"adapter": adapter},
+            winrt={"use_cached_services": True},
+        )
+
+    async def connect(self, use_cache: bool) -> None:
+        try:
+            await self._client.connect(dangerous_use_bleak_cache=use_cache)
+        except (BleakError, asyncio.TimeoutError) as e:
+            raise RingTransportError(str(e)) from e
+
+    async def disconnect(self) -> None:
+        try:
+            await self._client.disconnect()
+        except BleakError as e:
+            raise RingTransportError(str(e)) from e
+
+    @property
+    def is_connected(self) -> bool:
+        return self._client.is_connected
+
+    async def start_notify(
+        self, callback: Callable[[bytearray], Awaitable[None]]
+    ) -> None:
+        async def on_notify(sender, data: bytearray) -> None:
+            await callback(data)
+
+        try:
+            await self._client.start_notify(UART_TX_CHAR_UUID, on_notify)
+        except BleakError as e:
+            raise RingTransportError(str(e)) from e
+
+    async def write(self, data: bytes) -> None:
+        try:
+            await self._client.write_gatt_char(UART_RX_CHAR_UUID, data)
+        except BleakError as e:
+            raise RingTransportError(str(e)) from e
+
+
+def bleak_transport_factory(adapter: str | None = None) -> RingTransportFactory:
+    return lambda address, on_disconnect: BleakRingTransport(
+        address, on_disconnect, adapter
+    )
@@ -0,0 +1,102 @@
+from ring_manager import RingStatus
+from timing_reconstructor import TimingStats
+from link_monitor import LinkStats
+from collections import Counter
+from dataclasses import dataclass
+
+
+@dataclass
+class RingView:
+    address: str
+    name: str
+    status: RingStatus | None = None
+    """None until the first status arrived."""
+    timing_stats: TimingStats | None = None
+    link_stats: LinkStats | None = None
+
+
+class RingsViewModel:
+    """
+    What the UI shows about the rings, written by engine callbacks and read once per UI frame.
+
+    Writes only record the new state and mark the ring dirty, so any number of status changes between two frames cost
+    one UI update per changed ring. The counts behind the rings tab icon are kept up to date on every status change,
+    so the icon never needs a scan over all rings.
+    """
+
+    _rings: dict[str, RingView]
+    _dirty: set[str]
+    _status_counts: Counter[RingStatus | None]
+    _connect_failures: dict[str, str]
+
+    def __init__(self) -> None:
+        self._rings = {}
+        self._dirty = set()
+        self._status_counts = Counter()
+        self._connect_failures = {}
+
+    def add(self, address: str, name: str) -> None:
+        self._rings[address] = RingView(address=address, name=name)
+        self._status_counts[None] += 1
+        self._dirty.add(address)
+
+    def remove(self, address: str) -> None:
+        ring = self._rings.pop(address)
+        self._status_counts[ring.status] -= 1
+        self._dirty.discard(address)
+        self._connect_failures.pop(address, None)
+
+    def ring(self, address: str) -> RingView:
+        return self._rings[address]
+
+    def set_status(self, address: str, status: RingStatus) -> None:
+        ring = self._rings.get(address)
+        if ring is None or ring.status == status:
+            return
+        self._status_counts[ring.status] -= 1
+        self._status_counts[status] += 1
+        ring.status = status
+        self._dirty.add(address)
+
+    def on_connect_fail(self, address: str, message: str) -> None:
+        if address not in self._rings:
+            return
+        self.set_status(address, RingStatus.DISCONNECTED)
+        self._connect_failures[address] = message
+
+    def set_timing_stats(self, address: str, stats: TimingStats) -> None:
+        if address in self._rings:
+            self._rings[address].timing_stats = stats
+            self._dirty.add(address)
+
+    def set_link_stats(self, address: str, stats: LinkStats) -> None:
+        if address in self._rings:
+            self._rings[address].link_stats = stats
+            self._dirty.add(address)
+
+    @property
+    def rings_icon(self) -> str:
+        if self._status_counts[RingStatus.DISCONNECTED] > 0:
+            return "warning"
+        elif self._status_counts[RingStatus.CONNECTING] > 0:
+            return "bluetooth_searching"
+        elif self._status_counts[None] > 0:
+            return "question_mark"
+        else:
+            return "check"
+
+    def take_dirty(self) -> list[RingView]:
+        """
+        Rings changed since the previous call.
+        """
+        dirty = [self._rings[address] for address in self._dirty]
+        self._dirty.clear()
+        return dirty
+
+    def take_connect_failures(self) -> dict[str, str]:
+        """
+        Latest connection error per ring since the previous call.
+        """
+        failures = self._connect_failures
+        self._connect_failures = {}
+        return failures
@@ -0,0 +1,177 @@
+"""
+Worker process running the rings of one shard: their ring managers, bound to one Bluetooth adapter, and their filters.
+
+Filter outputs and ring status are written to the shared memory block of the shard, which the ShardSupervisor in
+the main process reads. Commands to remove, add and retune rings come as JSON lines on stdin. Started by
+ShardSupervisor, not meant to be run by hand.
+"""
+
+from accelerometer_data import AccelerometerData
+from ring_manager import RingManager, RingStatus
+from filters import Filters, FilterParams
+from filter_abs import FilterAbsOutput
+from filter_leaky_integrator import FilterLeakyIntegratorOutput
+from shard_memory import ShardMemoryWriter
+from ring_emulator import emulator_transport_factory
+import argparse
+import asyncio
+import json
+import signal
+import sys
+
+SIMULATED_ADAPTER = "simulated"
+"""Adapter name of shards whose rings are emulated, see ring_emulator."""
+
+
+class RingWorker:
+    _adapter: str
+    _rings: list[dict]
+    _indices: dict[str, int]
+
+    _memory: ShardMemoryWriter
+    _filters: Filters
+    _ring_managers: dict[str, RingManager]
+    _ring_manager_tasks: dict[str, asyncio.Task]
+
+    _stop_event: asyncio.Event | None
+
+    def __init__(self, shm_name: str, adapter: str, rings: list[dict]) -> None:
+        """
+        rings: {"address": ..., "name": ..., "filters": ...} per ring, in the row order of the shared memory block.
+        Rings with "removed": true only keep their row.
+        """
+        self._adapter = adapter
+        self._rings = rings
+        self._indices = {ring["address"]: i for i, ring in enumerate(rings)}
+        self._memory = ShardMemoryWriter(shm_name, len(rings))
+        self._ring_managers = {}
+        self._ring_manager_tasks = {}
+        self._stop_event = None
+
+    async def run(self) -> None:
+        self._stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGTERM, self._stop_event.set)
+        loop.add_signal_handler(signal.SIGINT, self._stop_event.set)
+
+        self._filters = Filters(
+            on_abs_filter_output=self._on_abs_filter_output,
+            on_leaky_integrator_filter_output=self._on_leaky_integrator_filter_output,
+        )
+        filters_task = asyncio.create_task(self._filters.run())
+        for ring in self._rings:
+            if not ring.get("removed", False):
+                self._add_ring(ring)
+        commands_task = asyncio.create_task(self._read_commands())
+
+        await self._stop_event.wait()
+
+        commands_task.cancel()
+        for ring in self._ring_managers.values():
+            await ring.close()
+        self._filters.close()
+        await asyncio.gather(filters_task, *self._ring_manager_tasks.values())
+        self._memory.close()
+
+    def _add_ring(self, ring: dict) -> None:
+        address = ring["address"]
+        self._filters.on_ring_add(
+            address=address, params=FilterParams.from_dict(ring.get("filters", {}))
+        )
+        self._ring_managers[address] = RingManager(
+            address=address,
+            name=ring["name"],
+            on_connect=lambda a=address: self._on_status(a, RingStatus.CONNECTED),
+            on_disconnect=lambda a=address: self._on_status(a, RingStatus.DISCONNECTED),
+            on_connecting=lambda a=address: self._on_status(a, RingStatus.CONNECTING),
+            on_connect_fail=lambda msg, a=address: self._on_status(
+                a, RingStatus.DISCONNECTED
+            ),
+            on_raw_sensor_data=lambda data, a=address: self._on_raw_sensor_data(
+                a, data
+            ),
+            adapter=None if self._adapter == SIMULATED_ADAPTER else self._adapter,
+            transport_factory=(
+                emulator_transport_factory()
+                if self._adapter == SIMULATED_ADAPTER
+                else None
+            ),
+        )
+        self._ring_manager_tasks[address] = asyncio.create_task(
+            self._ring_managers[address].run()
+        )
+
+    async def _remove_ring(self, address: str) -> None:
+        ring_manager = self._ring_managers.pop(address, None)
+        if ring_manager is None:
+            return
+        await ring_manager.close()
+        await self._ring_manager_tasks.pop(address)
+        self._filters.on_ring_remove(address)
+
+    async def _read_commands(self) -> None:
+        """
+        Applies the commands of ShardSupervisor until stdin closes, which also stops the worker as the supervisor is
+        gone.
+        """
+        reader = asyncio.StreamReader()
+        await asyncio.get_running_loop().connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(reader), sys.stdin
+        )
+        while line := await reader.readline():
+            try:
+                command = json.loads(line)
+            except json.JSONDecodeError:
+                print(f"Invalid worker command: {line!r}")
+                continue
+            name = command.get("command")
+            if name == "remove":
+                await self._remove_ring(command["address"])
+            elif name == "add":
+                ring = command["ring"]
+                if (
+                    ring["address"] in self._indices
+                    and ring["address"] not in self._ring_managers
+                ):
+                    self._add_ring(ring)
+            elif name == "set_params":
+                if command["address"] in self._ring_managers:
+                    self._filters.set_params(
+                        command["address"], FilterParams.from_dict(command["filters"])
+                    )
+            else:
+                print(f"Unknown worker command: {command!r}")
+        self._stop_event.set()
+
+    def _on_status(self, address: str, status: RingStatus) -> None:
+        self._memory.write_status(self._indices[address], status)
+
+    async def _on_raw_sensor_data(self, address: str, data: AccelerometerData) -> None:
+        self._filters.on_raw_sensor_data(address, data)
+
+    def _on_abs_filter_output(self, address: str, output: FilterAbsOutput) -> None:
+        self._memory.write_abs(self._indices[address], output.value, output.timestamp)
+
+    def _on_leaky_integrator_filter_output(
+        self, address: str, output: FilterLeakyIntegratorOutput
+    ) -> None:
+        self._memory.write_leaky_integrator(
+            self._indices[address], output.value, output.timestamp
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shm", required=True)
+    parser.add_argument("--adapter", required=True)
+    parser.add_argument("--rings", required=True, help="JSON list of rings.")
+    args = parser.parse_args()
+
+    worker = RingWorker(
+        shm_name=args.shm, adapter=args.adapter, rings=json.loads(args.rings)
+    )
+    asyncio.run(worker.run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import sys
+import threading
+from collections import Counter
+
+
+class SamplingProfiler:
+    """
+    Periodically samples the stack of one thread from a background thread.
+
+    Stacks are aggregated in the folded format ("outer;inner count" per line) understood by flamegraph tools.
+    The sampled thread is not interrupted, so the overhead is limited to the sampling thread itself.
+    """
+
+    _thread_id: int
+    _interval: float
+    _stacks: Counter[str]
+    _stop_event: threading.Event
+    _thread: threading.Thread | None
+
+    def __init__(self, thread_id: int, interval: float = 0.005) -> None:
+        self._thread_id = thread_id
+        self._interval = interval
+        self._stacks = Counter()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        assert self._thread is None
+        self._thread = threading.Thread(
+            target=self._run, name="sampling-profiler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def reset(self) -> None:
+        self._stacks = Counter()
+
+    def render(self) -> str:
+        return "".join(
+            f"{stack} {count}\n" for stack, count in self._stacks.most_common()
+        )
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self._interval):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+                )
+                frame = frame.f_back
+            self._stacks[";".join(reversed(stack))] += 1
@@ -0,0 +1,129 @@
+from multiprocessing import shared_memory, resource_tracker
+from dataclasses import dataclass
+from datetime import datetime
+from ring_manager import RingStatus
+import numpy as np
+
+# One row of float64 per ring. The sequence number makes every row a seqlock: the writer makes it odd before
+# and even after writing, a reader retries when it sees an odd or changed sequence number.
+_SEQ = 0
+_STATUS = 1
+_ABS_VALUE = 2
+_ABS_TIMESTAMP = 3
+_LEAKY_INTEGRATOR_VALUE = 4
+_LEAKY_INTEGRATOR_TIMESTAMP = 5
+_ROW_SIZE = 6
+
+_STATUS_CODES = {status: float(status.value) for status in RingStatus}
+_STATUS_BY_CODE = {code: status for status, code in _STATUS_CODES.items()}
+
+
+@dataclass
+class ShardRingState:
+    status: RingStatus | None
+    abs_value: float
+    abs_timestamp: datetime | None
+    leaky_integrator_value: float
+    leaky_integrator_timestamp: datetime | None
+
+
+def create_shard_memory(ring_count: int) -> shared_memory.SharedMemory:
+    memory = shared_memory.SharedMemory(
+        create=True, size=ring_count * _ROW_SIZE * np.dtype(np.float64).itemsize
+    )
+    np.ndarray((ring_count, _ROW_SIZE), dtype=np.float64, buffer=memory.buf)[:] = 0.0
+    return memory
+
+
+class ShardMemoryWriter:
+    """
+    Worker side of the shared memory block of a shard. Row i belongs to ring i of the shard.
+    """
+
+    _memory: shared_memory.SharedMemory
+    _rows: np.ndarray
+
+    def __init__(self, name: str, ring_count: int) -> None:
+        self._memory = shared_memory.SharedMemory(name=name)
+        # The supervisor owns the block. Without this the resource tracker of the worker unlinks it when the worker
+        # exits, which would break a restarted worker.
+        resource_tracker.unregister(self._memory._name, "shared_memory")
+        self._rows = np.ndarray(
+            (ring_count, _ROW_SIZE), dtype=np.float64, buffer=self._memory.buf
+        )
+
+    def write_status(self, index: int, status: RingStatus) -> None:
+        row = self._rows[index]
+        row[_SEQ] += 1.0
+        row[_STATUS] = _STATUS_CODES[status]
+        row[_SEQ] += 1.0
+
+    def write_abs(self, index: int, value: float, timestamp: datetime) -> None:
+        row = self._rows[index]
+        row[_SEQ] += 1.0
+        row[_ABS_VALUE] = value
+        row[_ABS_TIMESTAMP] = timestamp.timestamp()
+        row[_SEQ] += 1.0
+
+    def write_leaky_integrator(
+        self, index: int, value: float, timestamp: datetime
+    ) -> None:
+        row = self._rows[index]
+        row[_SEQ] += 1.0
+        row[_LEAKY_INTEGRATOR_VALUE] = value
+        row[_LEAKY_INTEGRATOR_TIMESTAMP] = timestamp.timestamp()
+        row[_SEQ] += 1.0
+
+    def close(self) -> None:
+        del self._rows
+        self._memory.close()
+
+
+class ShardMemoryReader:
+    """
+    Supervisor side of the shared memory block of a shard.
+    """
+
+    _rows: np.ndarray
+    _seen_seq: np.ndarray
+
+    def __init__(self, memory: shared_memory.SharedMemory, ring_count: int) -> None:
+        self._rows = np.ndarray(
+            (ring_count, _ROW_SIZE), dtype=np.float64, buffer=memory.buf
+        )
+        self._seen_seq = np.zeros(ring_count, dtype=np.float64)
+
+    def changed_rows(self) -> np.ndarray:
+        """
+        Indices of the rings written to since they were last read.
+        """
+        return np.flatnonzero(self._rows[:, _SEQ] != self._seen_seq)
+
+    def read(self, index: int) -> ShardRingState | None:
+        """
+        Consistent snapshot of a row, or None when the writer is busy with it. Try again on the next poll.
+        """
+        row = self._rows[index]
+        seq = row[_SEQ]
+        if seq % 2.0 != 0.0:
+            return None
+        snapshot = row.copy()
+        if row[_SEQ] != seq:
+            return None
+        self._seen_seq[index] = seq
+        return ShardRingState(
+            status=_STATUS_BY_CODE.get(snapshot[_STATUS]),
+            abs_value=float(snapshot[_ABS_VALUE]),
+            abs_timestamp=_to_datetime(snapshot[_ABS_TIMESTAMP]),
+            leaky_integrator_value=float(snapshot[_LEAKY_INTEGRATOR_VALUE]),
+            leaky_integrator_timestamp=_to_datetime(
+                snapshot[_LEAKY_INTEGRATOR_TIMESTAMP]
+            ),
+        )
+
+    def release(self) -> None:
+        del self._rows
+
+
+def _to_datetime(timestamp: float) -> datetime | None:
+    return None if timestamp == 0.0 else datetime.fromtimestamp(timestamp)
@@ -0,0 +1,238 @@
+from ring_manager import RingStatus
+from filter_abs import FilterAbsOutput
+from filter_leaky_integrator import FilterLeakyIntegratorOutput
+from shard_memory import ShardMemoryReader, create_shard_memory
+from multiprocessing import shared_memory
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Callable
+import asyncio
+import json
+import sys
+import traceback
+
+
+@dataclass
+class Shard:
+    adapter: str
+    rings: list[dict]
+    """{"address": ..., "name": ..., "filters": ...} per ring, "removed": true for rings removed since startup."""
+
+
+class _ShardProcess:
+    shard: Shard
+    memory: shared_memory.SharedMemory
+    reader: ShardMemoryReader
+    process: asyncio.subprocess.Process | None
+    restart_at: float | None
+    last_abs: list[datetime | None]
+    last_leaky_integrator: list[datetime | None]
+    last_status: list[RingStatus | None]
+
+    def __init__(self, shard: Shard) -> None:
+        self.shard = shard
+        self.memory = create_shard_memory(len(shard.rings))
+        self.reader = ShardMemoryReader(self.memory, len(shard.rings))
+        self.process = None
+        self.restart_at = None
+        self.last_abs = [None] * len(shard.rings)
+        self.last_leaky_integrator = [None] * len(shard.rings)
+        self.last_status = [None] * len(shard.rings)
+
+
+class ShardSupervisor:
+    """
+    Runs each shard of rings in its own worker process and merges their outputs into this process.
+
+    Workers write filter outputs and ring status to shared memory, which is polled here and dispatched through the
+    callbacks as if the rings were local. A crashed worker only takes its own rings down. It is restarted after a delay.
+
+    Rings are removed, re-added and retuned live by sending the worker commands as JSON lines on its stdin. The rings
+    of the shard are kept up to date with them, so a restarted worker starts in the same state.
+    """
+
+    _shards: list[_ShardProcess]
+    _on_status: Callable[[str, RingStatus], None]
+    _on_abs_filter_output: Callable[[str, FilterAbsOutput], None]
+    _on_leaky_integrator_filter_output: Callable[
+        [str, FilterLeakyIntegratorOutput], None
+    ]
+    _poll_period: float
+    _restart_delay: float
+
+    _stop_event: asyncio.Event | None
+
+    def __init__(
+        self,
+        shards: list[Shard],
+        on_status: Callable[[str, RingStatus], None],
+        on_abs_filter_output: Callable[[str, FilterAbsOutput], None],
+        on_leaky_integrator_filter_output: Callable[
+            [str, FilterLeakyIntegratorOutput], None
+        ],
+        poll_period: float = 0.01,
+        restart_delay: float = 2.0,
+    ) -> None:
+        self._shards = [_ShardProcess(shard) for shard in shards]
+        self._on_status = on_status
+        self._on_abs_filter_output = on_abs_filter_output
+        self._on_leaky_integrator_filter_output = on_leaky_integrator_filter_output
+        self._poll_period = poll_period
+        self._restart_delay = restart_delay
+        self._stop_event = None
+
+    @property
+    def addresses(self) -> list[str]:
+        return [
+            ring["address"]
+            for s in self._shards
+            for ring in s.shard.rings
+            if not ring.get("removed", False)
+        ]
+
+    def remove_ring(self, address: str) -> None:
+        """
+        Stops the ring in its worker. Its outputs and status are ignored from now on.
+        """
+        shard, ring = self._find(address)
+        ring["removed"] = True
+        self._send(shard, {"command": "remove", "address": address})
+
+    def add_ring(self, address: str, filters: dict) -> None:
+        """
+        Starts a removed ring of a shard again.
+        """
+        shard, ring = self._find(address)
+        ring.pop("removed", None)
+        ring["filters"] = filters
+        self._send(shard, {"command": "add", "ring": ring})
+
+    def set_params(self, address: str, filters: dict) -> None:
+        """
+        filters: FilterParams.to_dict() of the ring.
+        """
+        shard, ring = self._find(address)
+        ring["filters"] = filters
+        self._send(
+            shard, {"command": "set_params", "address": address, "filters": filters}
+        )
+
+    def _find(self, address: str) -> tuple[_ShardProcess, dict]:
+        for shard in self._shards:
+            for ring in shard.shard.rings:
+                if ring["address"] == address:
+                    return shard, ring
+        raise KeyError(address)
+
+    def _send(self, shard: _ShardProcess, command: dict) -> None:
+        process = shard.process
+        if process is None or process.returncode is not None or process.stdin is None:
+            # Not running, the restart picks the change up from the rings of the shard.
+            return
+        try:
+            process.stdin.write((json.dumps(command) + "\n").encode("utf-8"))
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    async def run(self) -> None:
+        self._stop_event = asyncio.Event()
+        try:
+            for shard in self._shards:
+                await self._start(shard)
+
+            while not self._stop_event.is_set():
+                loop_time = asyncio.get_running_loop().time()
+                for shard in self._shards:
+                    self._poll(shard)
+                    await self._supervise(shard, loop_time)
+                await asyncio.sleep(self._poll_period)
+        except Exception:
+            print("Shard supervisor crashed!!!")
+            traceback.print_exc()
+        finally:
+            for shard in self._shards:
+                await self._stop(shard)
+                shard.reader.release()
+                shard.memory.close()
+                shard.memory.unlink()
+
+    def close(self) -> None:
+        if self._stop_event is not None:
+            self._stop_event.set()
+
+    async def _start(self, shard: _ShardProcess) -> None:
+        for i, ring in enumerate(shard.shard.rings):
+            if ring.get("removed", False):
+                continue
+            shard.last_status[i] = RingStatus.CONNECTING
+            self._on_status(ring["address"], RingStatus.CONNECTING)
+        shard.process = await asyncio.create_subprocess_exec(
+            sys.executable,
+            str(Path(__file__).with_name("ring_worker.py")),
+            "--shm",
+            shard.memory.name,
+            "--adapter",
+            shard.shard.adapter,
+            "--rings",
+            json.dumps(shard.shard.rings),
+            stdin=asyncio.subprocess.PIPE,
+        )
+        shard.restart_at = None
+
+    async def _stop(self, shard: _ShardProcess) -> None:
+        if shard.process is not None and shard.process.returncode is None:
+            shard.process.terminate()
+            try:
+                await asyncio.wait_for(shard.process.wait(), timeout=10.0)
+            except asyncio.TimeoutError:
+                shard.process.kill()
+                await shard.process.wait()
+
+    async def _supervise(self, shard: _ShardProcess, loop_time: float) -> None:
+        if shard.process is None or shard.process.returncode is None:
+            return
+        if shard.restart_at is None:
+            print(
+                f"Worker for adapter {shard.shard.adapter} exited with code {shard.process.returncode}."
+            )
+            shard.restart_at = loop_time + self._restart_delay
+            for i, ring in enumerate(shard.shard.rings):
+                if (
+                    not ring.get("removed", False)
+                    and shard.last_status[i] != RingStatus.DISCONNECTED
+                ):
+                    shard.last_status[i] = RingStatus.DISCONNECTED
+                    self._on_status(ring["address"], RingStatus.DISCONNECTED)
+        elif loop_time >= shard.restart_at:
+            await self._start(shard)
+
+    def _poll(self, shard: _ShardProcess) -> None:
+        for i in shard.reader.changed_rows():
+            state = shard.reader.read(i)
+            ring = shard.shard.rings[i]
+            if state is None or ring.get("removed", False):
+                continue
+            address = ring["address"]
+            if state.status is not None and state.status != shard.last_status[i]:
+                shard.last_status[i] = state.status
+                self._on_status(address, state.status)
+            if (
+                state.abs_timestamp is not None
+                and state.abs_timestamp != shard.last_abs[i]
+            ):
+                shard.last_abs[i] = state.abs_timestamp
+                self._on_abs_filter_output(
+                    address, FilterAbsOutput(state.abs_value, state.abs_timestamp)
+                )
+            if (
+                state.leaky_integrator_timestamp is not None
+                and state.leaky_integrator_timestamp != shard.last_leaky_integrator[i]
+            ):
+                shard.last_leaky_integrator[i] = state.leaky_integrator_timestamp
+                self._on_leaky_integrator_filter_output(
+                    address,
+                    FilterLeakyIntegratorOutput(
+                        state.leaky_integrator_value, state.leaky_integrator_timestamp
+                    ),
+                )
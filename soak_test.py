@@ -0,0 +1,210 @@
+"""
+Soak test of reconnection and throughput: runs many RingManagers against emulated rings with injected faults.
+
+    python soak_test.py --rings 200 --duration 120 --disconnect-rate 0.02 --stall-rate 0.02 --drop 0.01
+"""
+
+from accelerometer_data import AccelerometerData
+from ring_manager import RingManager
+from ring_emulator import EmulatedRingTransport, FaultConfig, emulator_transport_factory
+from datetime import datetime, timedelta
+import argparse
+import asyncio
+import math
+import statistics
+import time
+
+
+class SoakRing:
+    """
+    Counts what one RingManager delivers.
+    """
+
+    samples: int
+    connects: int
+    disconnects: int
+    connect_failures: int
+    reconnect_gaps: list[float]
+    _disconnected_at: datetime | None
+
+    def __init__(self) -> None:
+        self.samples = 0
+        self.connects = 0
+        self.disconnects = 0
+        self.connect_failures = 0
+        self.reconnect_gaps = []
+        self._disconnected_at = None
+
+    def on_connect(self) -> None:
+        self.connects += 1
+
+    def on_disconnect(self) -> None:
+        self.disconnects += 1
+        self._disconnected_at = datetime.now()
+
+    def on_connect_fail(self, message: str) -> None:
+        self.connect_failures += 1
+
+    async def on_raw_sensor_data(self, data: AccelerometerData) -> None:
+        self.samples += 1
+        if self._disconnected_at is not None:
+            self.reconnect_gaps.append(
+                (data.timestamp - self._disconnected_at).total_seconds()
+            )
+            self._disconnected_at = None
+
+
+async def soak(
+    rings: int,
+    duration: timedelta,
+    sample_rate: float,
+    faults: FaultConfig,
+    seed: int | None,
+    battery_poll_period: timedelta | None,
+    heart_rate_poll_period: timedelta | None,
+) -> None:
+    transports: list[EmulatedRingTransport] = []
+    factory = emulator_transport_factory(
+        sample_rate=sample_rate, faults=faults, seed=seed, transports=transports
+    )
+
+    soak_rings = {}
+    ring_managers = []
+    for i in range(rings):
+        address = f"EM:00:00:00:{i >> 8:02X}:{i & 0xFF:02X}"
+        soak_ring = SoakRing()
+        soak_rings[address] = soak_ring
+        ring_managers.append(
+            RingManager(
+                address=address,
+                name=f"Emulated {i}",
+                on_connect=soak_ring.on_connect,
+                on_disconnect=soak_ring.on_disconnect,
+                on_connecting=lambda: None,
+                on_connect_fail=soak_ring.on_connect_fail,
+                on_raw_sensor_data=soak_ring.on_raw_sensor_data,
+                transport_factory=factory,
+                battery_poll_period=battery_poll_period,
+                heart_rate_poll_period=heart_rate_poll_period,
+            )
+        )
+
+    loop = asyncio.get_running_loop()
+    max_lag = 0.0
+
+    async def measure_lag() -> None:
+        nonlocal max_lag
+        while True:
+            start = loop.time()
+            await asyncio.sleep(0.1)
+            max_lag = max(max_lag, loop.time() - start - 0.1)
+
+    start = time.perf_counter()
+    start_cpu = time.process_time()
+    lag_task = asyncio.create_task(measure_lag())
+    tasks = [asyncio.create_task(r.run()) for r in ring_managers]
+    await asyncio.sleep(duration.total_seconds())
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - start_cpu
+
+    for ring_manager in ring_managers:
+        await ring_manager.close()
+    await asyncio.gather(*tasks)
+    lag_task.cancel()
+
+    samples = sum(r.samples for r in soak_rings.values())
+    sent = sum(t.stats.packets_sent for t in transports)
+    dropped = sum(t.stats.packets_dropped for t in transports)
+    gaps = sorted(g for r in soak_rings.values() for g in r.reconnect_gaps)
+    link_stats = [r.link_stats for r in ring_managers]
+
+    print(f"Rings:                {rings} at {sample_rate:g} Hz for {elapsed:.1f} s")
+    print(
+        f"Samples:              {samples} ({samples / elapsed:.0f}/s, "
+        f"{samples / (rings * sample_rate * elapsed):.1%} of nominal)"
+    )
+    print(f"Packets sent/dropped: {sent}/{dropped}")
+    print(
+        f"CPU:                  {cpu / elapsed:.1%}, max loop lag {max_lag * 1000:.1f} ms"
+    )
+    print(
+        "Connects:             "
+        f"{sum(r.connects for r in soak_rings.values())}, "
+        f"failures {sum(r.connect_failures for r in soak_rings.values())}"
+    )
+    print(
+        "Injected:             "
+        f"{sum(t.stats.injected_disconnects for t in transports)} disconnects, "
+        f"{sum(t.stats.injected_stalls for t in transports)} stalls"
+    )
+    print(
+        "Stall handling:       "
+        f"{sum(s.resends for s in link_stats)} resends, "
+        f"{sum(s.forced_reconnects for s in link_stats)} forced reconnects"
+    )
+    print(
+        "Readings:             "
+        f"{sum(r.readings.battery_level is not None for r in ring_managers)} battery, "
+        f"{sum(r.readings.heart_rate is not None for r in ring_managers)} heart rate"
+    )
+    if len(gaps) > 0:
+        print(
+            "Reconnect gaps:       "
+            f"{len(gaps)}, median {statistics.median(gaps) * 1000:.0f} ms, "
+            f"p95 {gaps[math.ceil(0.95 * len(gaps)) - 1] * 1000:.0f} ms, "
+            f"max {gaps[-1] * 1000:.0f} ms"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rings", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=60.0, help="Seconds.")
+    parser.add_argument("--rate", type=float, default=25.0, help="Samples per second.")
+    parser.add_argument(
+        "--disconnect-rate", type=float, default=0.01, help="Per second."
+    )
+    parser.add_argument("--stall-rate", type=float, default=0.01, help="Per second.")
+    parser.add_argument("--stall-duration", type=float, default=3.0, help="Seconds.")
+    parser.add_argument("--drop", type=float, default=0.01, help="Probability.")
+    parser.add_argument(
+        "--connect-failure", type=float, default=0.1, help="Probability."
+    )
+    parser.add_argument(
+        "--battery-period", type=float, default=None, help="Seconds between polls."
+    )
+    parser.add_argument(
+        "--heart-rate-period", type=float, default=None, help="Seconds between polls."
+    )
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    asyncio.run(
+        soak(
+            rings=args.rings,
+            duration=timedelta(seconds=args.duration),
+            sample_rate=args.rate,
+            faults=FaultConfig(
+                disconnect_rate=args.disconnect_rate,
+                stall_rate=args.stall_rate,
+                stall_duration=timedelta(seconds=args.stall_duration),
+                drop_probability=args.drop,
+                connect_failure_probability=args.connect_failure,
+            ),
+            seed=args.seed,
+            battery_poll_period=(
+                None
+                if args.battery_period is None
+                else timedelta(seconds=args.battery_period)
+            ),
+            heart_rate_poll_period=(
+                None
+                if args.heart_rate_period is None
+                else timedelta(seconds=args.heart_rate_period)
+            ),
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+from accelerometer_data import AccelerometerData
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from collections import deque
+import math
+
+
+@dataclass
+class TimingStats:
+    sample_rate: float
+    """Estimated true sample rate in Hz."""
+    jitter: timedelta
+    """Standard deviation of arrival time relative to reconstructed sample time."""
+    gaps: int
+    samples: int
+
+
+class TimingReconstructor:
+    """
+    Reconstructs sample times of a single ring and resamples onto a uniform grid.
+
+    Notifications are delivered in bursts per BLE connection interval, so arrival times collapse onto a few instants.
+    The true sample period is estimated from the arrival times over a sliding window. Sample times are spread
+    at that period and pulled slowly towards arrival time, never later than it. Resampling interpolates linearly
+    between reconstructed samples. Output samples that fall in a gap are flagged.
+    """
+
+    _output_period: timedelta
+    _gap_periods: float
+    _max_gap: timedelta
+    _correction: float
+
+    _arrivals: deque[datetime]
+    _period: float | None
+    _jitter_mean: float
+    _jitter_var: float
+    _gaps: int
+    _samples: int
+
+    _previous: AccelerometerData | None
+    _next_grid: datetime | None
+
+    def __init__(
+        self,
+        output_period: timedelta = timedelta(milliseconds=20),
+        rate_window: int = 64,
+        gap_periods: float = 4.0,
+        max_gap: timedelta = timedelta(seconds=1),
+        correction: float = 0.05,
+    ) -> None:
+        """
+        gap_periods: missing time, in estimated sample periods, after which a gap is reported.
+        max_gap: gaps longer than this are not filled in, the grid skips ahead.
+        correction: fraction of the arrival error corrected per sample.
+        """
+        self._output_period = output_period
+        self._gap_periods = gap_periods
+        self._max_gap = max_gap
+        self._correction = correction
+        self._arrivals = deque(maxlen=rate_window)
+        self.reset()
+
+    def reset(self) -> None:
+        self._arrivals.clear()
+        self._period = None
+        self._jitter_mean = 0.0
+        self._jitter_var = 0.0
+        self._gaps = 0
+        self._samples = 0
+        self._previous = None
+        self._next_grid = None
+
+    def set_output_period(self, output_period: timedelta) -> None:
+        self._output_period = output_period
+
+    @property
+    def stats(self) -> TimingStats:
+        return TimingStats(
+            sample_rate=0.0 if self._period is None else 1.0 / self._period,
+            jitter=timedelta(seconds=math.sqrt(self._jitter_var)),
+            gaps=self._gaps,
+            samples=self._samples,
+        )
+
+    def on_sample(self, data: AccelerometerData) -> list[AccelerometerData]:
+        """
+        Ingest a sample stamped with its arrival time and return the uniform grid samples it completes.
+        """
+        arrival = data.timestamp
+        self._samples += 1
+
+        gap = self._is_gap(arrival)
+        if gap:
+            self._gaps += 1
+            self._arrivals.clear()
+        self._arrivals.append(arrival)
+        self._update_period()
+
+        sample_time = self._reconstruct_time(arrival, gap)
+        sample = AccelerometerData(
+            x=data.x, y=data.y, z=data.z, timestamp=sample_time, gap=data.gap
+        )
+        resampled = self._resample(sample, gap)
+        self._previous = sample
+        return resampled
+
+    def _is_gap(self, arrival: datetime) -> bool:
+        if self._period is None or len(self._arrivals) == 0:
+            return False
+        missing = (arrival - self._arrivals[-1]).total_seconds()
+        return missing > self._gap_periods * self._period
+
+    def _update_period(self) -> None:
+        if len(self._arrivals) < 2:
+            return
+        span = (self._arrivals[-1] - self._arrivals[0]).total_seconds()
+        if span > 0.0:
+            self._period = span / (len(self._arrivals) - 1)
+
+    def _reconstruct_time(self, arrival: datetime, gap: bool) -> datetime:
+        if self._previous is None or self._period is None or gap:
+            return arrival
+
+        predicted = self._previous.timestamp + timedelta(seconds=self._period)
+        error = (arrival - predicted).total_seconds()
+        sample_time = min(
+            arrival, predicted + timedelta(seconds=self._correction * error)
+        )
+
+        residual = (arrival - sample_time).total_seconds()
+        delta = residual - self._jitter_mean
+        self._jitter_mean += self._correction * delta
+        self._jitter_var = (1.0 - self._correction) * (
+            self._jitter_var + self._correction * delta * delta
+        )
+        return sample_time
+
+    def _resample(
+        self, sample: AccelerometerData, gap: bool
+    ) -> list[AccelerometerData]:
+        previous = self._previous
+        if previous is None or self._next_grid is None:
+            self._next_grid = sample.timestamp + self._output_period
+            return [sample]
+
+        if sample.timestamp - previous.timestamp > self._max_gap:
+            self._next_grid = sample.timestamp + self._output_period
+            return [
+                AccelerometerData(
+                    x=sample.x,
+                    y=sample.y,
+                    z=sample.z,
+                    timestamp=sample.timestamp,
+                    gap=True,
+                )
+            ]
+
+        span = (sample.timestamp - previous.timestamp).total_seconds()
+        output = []
+        while self._next_grid <= sample.timestamp:
+            a = (
+                1.0
+                if span <= 0.0
+                else (self._next_grid - previous.timestamp).total_seconds() / span
+            )
+            output.append(
+                AccelerometerData(
+                    x=previous.x + a * (sample.x - previous.x),
+                    y=previous.y + a * (sample.y - previous.y),
+                    z=previous.z + a * (sample.z - previous.z),
+                    timestamp=self._next_grid,
+                    gap=gap or sample.gap,
+                )
+            )
+            self._next_grid += self._output_period
+        return output
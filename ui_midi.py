@@ -1,104 +1,249 @@
 from nicegui import ui
 import nicegui
+from datetime import timedelta
 from typing import Callable
-from midi_config import MidiConfig
+from midi_config import (
+    MidiConfig,
+    MidiRoute,
+    FEATURE_ABS,
+    FEATURE_LEAKY_INTEGRATOR,
+    MAX_NUMBERS,
+)
+
+_TYPES = ["cc", "cc14", "nrpn"]
+_CURVES = ["linear", "exponential", "logarithmic", "s_curve"]
 
 
 class UIMidi:
-    _on_ring_1_address: Callable[[str], None]
-    _on_ring_2_address: Callable[[str], None]
-    _on_ring_3_address: Callable[[str], None]
+    _on_routes_change: Callable[[list[MidiRoute]], str | None]
+    _on_preset_save: Callable[[str], str | None]
+    _on_preset_recall: Callable[[str, timedelta], str | None]
+    _on_preset_delete: Callable[[str], None]
 
-    _ring_1_address: nicegui.elements.select.Select
-    _ring_2_address: nicegui.elements.select.Select
-    _ring_3_address: nicegui.elements.select.Select
+    _routes: list[MidiRoute]
+    _addresses: list[str]
+    _features: list[str]
 
-    _ring_1_address_label: nicegui.elements.label.Label
-    _ring_2_address_label: nicegui.elements.label.Label
-    _ring_3_address_label: nicegui.elements.label.Label
+    _routes_list: nicegui.elements.list.List
+    _preset_select: ui.select
+    _preset_name: ui.input
+    _fade: ui.number
 
     def __init__(
         self,
         midi_config: MidiConfig,
-        on_ring_1_address: Callable[[str], None],
-        on_ring_2_address: Callable[[str], None],
-        on_ring_3_address: Callable[[str], None],
+        on_routes_change: Callable[[list[MidiRoute]], str | None],
+        presets: list[str],
+        on_preset_save: Callable[[str], str | None],
+        on_preset_recall: Callable[[str, timedelta], str | None],
+        on_preset_delete: Callable[[str], None],
     ) -> None:
-        self._on_ring_1_address = on_ring_1_address
-        self._on_ring_2_address = on_ring_2_address
-        self._on_ring_3_address = on_ring_3_address
-
-        with ui.list().props("separator").props("width-max"):
-            with ui.item():
-                with ui.item_section():
-                    ui.label("Ring #1 address:").classes("text-bold")
-                with ui.item_section():
-                    self._ring_1_address = ui.select(options=[]).props("width-max")
-
-                    def on_select(args) -> None:
-                        self._ring_1_address_label.text = args.value
-                        self._on_ring_1_address(
-                            None if args.value == "<not set>" else args.value
-                        )
-
-                    self._ring_1_address.on_value_change(on_select)
-                # with ui.item_section():
-                #     ui.input(label="Manual input")
-                with ui.item_section():
-                    self._ring_1_address_label = ui.label(
-                        midi_config.abs_ring_1
-                        if midi_config.abs_ring_1 is not None
-                        else "<not set>"
-                    )
-            with ui.item():
-                with ui.item_section():
-                    ui.label("Ring #2 address:").classes("text-bold")
-                with ui.item_section():
-                    self._ring_2_address = ui.select(options=[]).props("width-max")
-
-                    def on_select(args) -> None:
-                        self._ring_2_address_label.text = args.value
-                        self._on_ring_2_address(
-                            None if args.value == "<not set>" else args.value
-                        )
-
-                    self._ring_2_address.on_value_change(on_select)
-                # with ui.item_section():
-                #     ui.input(label="Manual input")
-                with ui.item_section():
-                    self._ring_2_address_label = ui.label(
-                        midi_config.abs_ring_2
-                        if midi_config.abs_ring_2 is not None
-                        else "<not set>"
-                    )
-            with ui.item():
-                with ui.item_section():
-                    ui.label("Ring #3 address:").classes("text-bold")
-                with ui.item_section():
-                    self._ring_3_address = ui.select(options=[]).props("width-max")
-
-                    def on_select(args) -> None:
-                        self._ring_3_address_label.text = args.value
-                        self._on_ring_3_address(
-                            None if args.value == "<not set>" else args.value
-                        )
-
-                    self._ring_3_address.on_value_change(on_select)
-                # with ui.item_section():
-                #     ui.input(label="Manual input")
-                with ui.item_section():
-                    self._ring_3_address_label = ui.label(
-                        midi_config.abs_ring_3
-                        if midi_config.abs_ring_3 is not None
-                        else "<not set>"
-                    )
+        self._on_routes_change = on_routes_change
+        self._on_preset_save = on_preset_save
+        self._on_preset_recall = on_preset_recall
+        self._on_preset_delete = on_preset_delete
+
+        self._routes = list(midi_config.routes)
+        self._addresses = []
+        self._features = [FEATURE_ABS, FEATURE_LEAKY_INTEGRATOR]
+
+        with ui.row().classes("items-center"):
+            self._preset_select = ui.select(
+                label="Preset", options=presets, value=None
+            ).classes("w-48")
+            self._fade = ui.number(
+                label="Fade (s)", value=2.0, min=0.0, step=0.5
+            ).classes("w-20")
+            ui.button(text="Recall", icon="play_arrow", on_click=self._recall_preset)
+            ui.button(icon="delete", on_click=self._delete_preset).props("flat round")
+            self._preset_name = ui.input(label="Save routes as").classes("w-48")
+            ui.button(text="Save", icon="save", on_click=self._save_preset)
+
+        with ui.list().props("separator").classes("w-full") as routes_list:
+            self._routes_list = routes_list
+        ui.button(text="Add route", icon="add", on_click=self._add_route)
+
+        self._render()
 
     def update_ring_addresses(self, addresses: list[str]) -> None:
-        self._ring_1_address.options = addresses + ["<not set>"]
-        self._ring_1_address.update()
+        self._addresses = addresses
+        self._render()
+
+    def update_routes(self, routes: list[MidiRoute]) -> None:
+        self._routes = list(routes)
+        self._render()
+
+    def update_features(self, features: list[str]) -> None:
+        self._features = features
+        self._render()
+
+    def update_presets(self, presets: list[str]) -> None:
+        self._preset_select.options = presets
+        if self._preset_select.value not in presets:
+            self._preset_select.value = None
+        self._preset_select.update()
+
+    def _save_preset(self) -> None:
+        result = self._on_preset_save(self._preset_name.value)
+        if result is None:
+            ui.notify(message=f"Preset {self._preset_name.value} saved.")
+            self._preset_select.value = self._preset_name.value
+        else:
+            ui.notify(message=result, type="warning")
+
+    def _recall_preset(self) -> None:
+        if self._preset_select.value is None:
+            return
+        result = self._on_preset_recall(
+            self._preset_select.value, timedelta(seconds=self._fade.value or 0.0)
+        )
+        if result is not None:
+            ui.notify(message=result, type="warning")
+
+    def _delete_preset(self) -> None:
+        if self._preset_select.value is not None:
+            self._on_preset_delete(self._preset_select.value)
+
+    def _add_route(self) -> None:
+        used = {(r.channel, r.number) for r in self._routes}
+        number = next(n for n in range(1, 128) if (1, n) not in used)
+        self._routes.append(
+            MidiRoute(
+                address=self._addresses[0] if len(self._addresses) > 0 else "",
+                feature=FEATURE_ABS,
+                number=number,
+            )
+        )
+        self._changed()
+
+    def _remove_route(self, route: MidiRoute) -> None:
+        self._routes.remove(route)
+        self._changed()
+
+    def _set(self, route: MidiRoute, name: str, value) -> None:
+        if value is None or getattr(route, name) == value:
+            return
+        setattr(route, name, value)
+        self._routes_changed()
+
+    def _set_type(self, route: MidiRoute, route_type: str) -> None:
+        """
+        Clamps the number to the range of the type, and renders again for its limits.
+        """
+        if route_type is None or route.type == route_type:
+            return
+        route.type = route_type
+        route.number = min(route.number, MAX_NUMBERS[route_type])
+        self._changed()
+
+    def _changed(self) -> None:
+        self._render()
+        self._routes_changed()
+
+    def _routes_changed(self) -> None:
+        result = self._on_routes_change(list(self._routes))
+        if result is not None:
+            ui.notify(message=result, type="warning")
+
+    def _render(self) -> None:
+        self._routes_list.clear()
+        with self._routes_list:
+            for route in self._routes:
+                with ui.item():
+                    with ui.row().classes("items-center"):
+                        ui.select(
+                            label="Ring",
+                            options=_with_value(self._addresses, route.address),
+                            value=route.address,
+                            on_change=lambda e, r=route: self._set(
+                                r, "address", e.value
+                            ),
+                        ).classes("w-48")
+                        ui.select(
+                            label="Feature",
+                            options=_with_value(self._features, route.feature),
+                            value=route.feature,
+                            on_change=lambda e, r=route: self._set(
+                                r, "feature", e.value
+                            ),
+                        ).classes("w-40")
+                        ui.select(
+                            label="Type",
+                            options=_TYPES,
+                            value=route.type,
+                            on_change=lambda e, r=route: self._set_type(r, e.value),
+                        ).classes("w-20")
+                        ui.number(
+                            label="Channel",
+                            value=route.channel,
+                            min=1,
+                            max=16,
+                            precision=0,
+                            on_change=lambda e, r=route: self._set(
+                                r, "channel", _to_int(e.value, 1, 16)
+                            ),
+                        ).classes("w-20")
+                        ui.number(
+                            label="Number",
+                            value=route.number,
+                            min=0,
+                            max=MAX_NUMBERS.get(route.type, 16383),
+                            precision=0,
+                            on_change=lambda e, r=route: self._set(
+                                r,
+                                "number",
+                                _to_int(e.value, 0, MAX_NUMBERS.get(r.type, 16383)),
+                            ),
+                        ).classes("w-20")
+                        ui.select(
+                            label="Curve",
+                            options=_CURVES,
+                            value=route.curve,
+                            on_change=lambda e, r=route: self._set(r, "curve", e.value),
+                        ).classes("w-32")
+                        ui.number(
+                            label="Amount",
+                            value=route.amount,
+                            min=0.1,
+                            step=0.1,
+                            on_change=lambda e, r=route: self._set(
+                                r, "amount", e.value
+                            ),
+                        ).classes("w-20")
+                        ui.number(
+                            label="Min",
+                            value=route.minimum,
+                            min=0.0,
+                            max=1.0,
+                            step=0.05,
+                            on_change=lambda e, r=route: self._set(
+                                r, "minimum", e.value
+                            ),
+                        ).classes("w-20")
+                        ui.number(
+                            label="Max",
+                            value=route.maximum,
+                            min=0.0,
+                            max=1.0,
+                            step=0.05,
+                            on_change=lambda e, r=route: self._set(
+                                r, "maximum", e.value
+                            ),
+                        ).classes("w-20")
+                        ui.button(
+                            icon="delete",
+                            on_click=lambda r=route: self._remove_route(r),
+                        ).props("flat round")
+
+
+def _with_value(options: list[str], value: str) -> list[str]:
+    return options if value in options else options + [value]
 
-        self._ring_2_address.options = addresses + ["<not set>"]
-        self._ring_2_address.update()
 
-        self._ring_3_address.options = addresses + ["<not set>"]
-        self._ring_3_address.update()
+def _to_int(value: float | None, minimum: int, maximum: int) -> int | None:
+    """
+    None if out of range, on_change sees values before the element clamps them.
+    """
+    if value is None or not minimum <= value <= maximum:
+        return None
+    return int(value)